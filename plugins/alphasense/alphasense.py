@@ -16,6 +16,10 @@ Suppose that the Alphasense is device /dev/ttyACM0. You can simply run:
 
 python alphasense.py /dev/ttyACM0
 
+Transfers send one SPI byte per USB-ISS command by default. With bulk=True,
+up to 62 bytes are sent per command, which is much faster but holds chip
+select across the bytes of each command.
+
 USB-ISS Reference:
 https://www.robot-electronics.co.uk/htm/usb_iss_tech.htm
 
@@ -56,6 +60,10 @@ def iss_set_spi_mode(serial, mode, freq):
             raise RuntimeError('USB-ISS: Undocumented Error')
 
 
+# the USB-ISS accepts at most this many bytes in one SPI_IO command
+ISS_SPI_MAX_TRANSFER = 62
+
+
 def iss_spi_transfer_data(serial, data):
     serial.write(bytearray([0x61] + data))
     response = bytearray(serial.read(1 + len(data)))
@@ -148,14 +156,20 @@ class Alphasense(object):
         ('tof to sfr factor', '<B'),
     ]
 
-    def __init__(self, port):
+    def __init__(self, port, bulk=False):
         self.serial = Serial(port)
+        self.bulk = bulk
+        self.info = None
+        self.info_serial_number = None
         iss_set_spi_mode(self.serial, 0x92, 500000)
 
     def close(self):
         self.serial.close()
 
     def transfer(self, data):
+        if self.bulk:
+            return self.transfer_bulk(data)
+
         result = bytearray(len(data))
 
         for i, x in enumerate(data):
@@ -167,6 +181,23 @@ class Alphasense(object):
 
         return result
 
+    def transfer_bulk(self, data):
+        """
+        Transfers data in as few USB-ISS commands as possible. Chip select
+        stays asserted for each command, so up to ISS_SPI_MAX_TRANSFER bytes
+        are clocked out back to back.
+        """
+        result = bytearray()
+
+        for i in range(0, len(data), ISS_SPI_MAX_TRANSFER):
+            chunk = list(data[i:i + ISS_SPI_MAX_TRANSFER])
+            iss_result = iss_spi_transfer_data(self.serial, chunk)
+            if len(iss_result) != len(chunk) + 1 or iss_result[0] != 0xFF:
+                raise RuntimeError('USB-ISS Read Error')
+            result += iss_result[1:]
+
+        return result
+
     def power_on(self, fan=True, laser=True):
         if fan and laser:
             self.transfer([0x03, 0x00])
@@ -184,9 +215,12 @@ class Alphasense(object):
             self.transfer([0x03, 0x03])
 
     def set_laser_power(self, power):
+        # the laser and fan power are part of the config data
+        self.info = None
         self.transfer([0x42, 0x01, power])
 
     def set_fan_power(self, power):
+        self.info = None
         self.transfer([0x42, 0x00, power])
 
     def get_serial_number(self):
@@ -208,6 +242,20 @@ class Alphasense(object):
         config_data = self.get_config_data_raw()
         return unpack_structs(self.config_data_structs, config_data)
 
+    def get_info(self):
+        """
+        Returns the firmware version and raw config data. They are read once
+        and then only read again if the serial number, which is much cheaper
+        to read, changes or the fan or laser power is set.
+        """
+        serial_number = self.get_serial_number()
+
+        if self.info is None or serial_number != self.info_serial_number:
+            self.info = (self.get_firmware_version(), self.get_config_data_raw())
+            self.info_serial_number = serial_number
+
+        return self.info
+
     def ready(self):
         return self.transfer([0xCF])[0] == 0xF3
 
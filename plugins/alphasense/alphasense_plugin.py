@@ -14,6 +14,7 @@ from contextlib import closing
 
 
 device = os.environ.get('ALPHASENSE_DEVICE', '/dev/alphasense')
+bulk = os.environ.get('ALPHASENSE_BULK_SPI') == '1'
 
 class AlphasensePlugin(waggle.pipeline.Plugin):
 
@@ -27,7 +28,7 @@ class AlphasensePlugin(waggle.pipeline.Plugin):
 
         print('Connecting to device: {}'.format(device), flush=True)
 
-        with closing(Alphasense(device)) as alphasense:
+        with closing(Alphasense(device, bulk=bulk)) as alphasense:
             print('Connected to device: {}'.format(device), flush=True)
 
             print('Setting OPN-N2 fan power.', flush=True)
@@ -43,8 +44,7 @@ class AlphasensePlugin(waggle.pipeline.Plugin):
             time.sleep(3)
 
             while True:
-                firmware = alphasense.get_firmware_version()
-                config = alphasense.get_config_data_raw()
+                firmware, config = alphasense.get_info()
 
                 if firmware.startswith(b'\xf3\xf3\xf3\xf3'):
                     raise RuntimeError('not ready')
@@ -68,4 +68,4 @@ if os.path.exists(device):
     plugin = AlphasensePlugin.defaultConfig()
     plugin.run()
 else:
-    exit(1
+    exit(1)
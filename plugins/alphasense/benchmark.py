@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+'''
+Measures the latency of each Alphasense read against the simulated USB-ISS,
+with one USB-ISS command per byte and with bulk transfers. The simulation is
+run with no added latency and with 1ms per command, about the round trip of
+a full speed USB device.
+'''
+import time
+from contextlib import closing
+from alphasense import Alphasense
+from iss_simulator import SimulatedISS
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    reads = [
+        ('histogram', lambda alphasense: alphasense.get_histogram_raw()),
+        ('firmware', lambda alphasense: alphasense.get_firmware_version()),
+        ('config', lambda alphasense: alphasense.get_config_data_raw()),
+        ('cached info', lambda alphasense: alphasense.get_info()),
+    ]
+
+    for latency in [0.0, 0.001]:
+        print('command latency {:.0f}ms'.format(1e3 * latency))
+
+        with SimulatedISS(latency=latency) as iss:
+            times = {}
+
+            for bulk in [False, True]:
+                with closing(Alphasense(iss.port, bulk=bulk)) as alphasense:
+                    alphasense.get_info()
+
+                    for name, read in reads:
+                        times[name, bulk] = timed(lambda: read(alphasense))
+
+            for name, _ in reads:
+                single, bulk = times[name, False], times[name, True]
+                print('  {:<12} {:7.1f}ms  bulk {:6.1f}ms  speedup {:.1f}x'.format(
+                    name, 1e3 * single, 1e3 * bulk, single / bulk))
+
+
+if __name__ == '__main__':
+    main()
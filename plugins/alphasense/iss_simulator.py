@@ -0,0 +1,158 @@
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+'''
+Simulated USB-ISS adapter with an OPC-N2 attached, served on a pty, for
+testing and benchmarking the Alphasense reader without hardware.
+
+Example:
+
+with SimulatedISS() as iss:
+    alphasense = Alphasense(iss.port)
+    print(alphasense.get_firmware_version())
+'''
+import os
+import select
+import struct
+import threading
+import time
+import tty
+
+
+def make_histogram(bins):
+    data = bytearray(62)
+    struct.pack_into('<16H', data, 0, *bins)
+    struct.pack_into('<4B', data, 32, 10, 20, 30, 40)
+    struct.pack_into('<f', data, 36, 1.5)
+    struct.pack_into('<I', data, 40, 250)
+    struct.pack_into('<f', data, 44, 2.5)
+    struct.pack_into('<H', data, 48, sum(bins) & 0xFFFF)
+    struct.pack_into('<3f', data, 50, 1.0, 2.0, 3.0)
+    return bytes(data)
+
+
+class SimulatedOPCN2(object):
+    '''
+    Responds to SPI bytes like an OPC-N2. A command byte is answered with
+    0xF3 and the following bytes return the command's data, one per byte.
+    '''
+
+    # number of argument bytes following each write command
+    argument_counts = {0x03: 1, 0x42: 2}
+
+    def __init__(self):
+        self.serial_number = b'OPC-N2 123456789'
+        self.firmware = b'OPC-N2 FirmwareVer=OPC-018.2'.ljust(60, b' ')
+        self.config = bytes(range(256))
+        self.histogram = make_histogram(range(16))
+        self.fan_power = None
+        self.laser_power = None
+        self.pending = []
+        self.command = None
+        self.arguments = []
+
+    def read_commands(self):
+        return {
+            0x10: self.serial_number,
+            0x3F: self.firmware,
+            0x3C: self.config,
+            0x30: self.histogram,
+            0x32: self.histogram[50:62],
+        }
+
+    def spi(self, value):
+        if self.pending:
+            return self.pending.pop(0)
+
+        if self.command is not None:
+            self.arguments.append(value)
+
+            if len(self.arguments) == self.argument_counts[self.command]:
+                if self.command == 0x42 and self.arguments[0] == 0x00:
+                    self.fan_power = self.arguments[1]
+                elif self.command == 0x42:
+                    self.laser_power = self.arguments[1]
+
+                self.command = None
+                self.arguments = []
+
+            return 0xF3
+
+        commands = self.read_commands()
+
+        if value in commands:
+            self.pending = list(commands[value])
+        elif value in self.argument_counts:
+            self.command = value
+
+        return 0xF3
+
+
+class SimulatedISS(object):
+    '''
+    Serves a simulated USB-ISS on a pty. Each write by the host is handled
+    as one command, as the real adapter receives each command in one USB
+    packet. latency is added before each response to model the USB round
+    trip. commands counts the SPI_IO commands handled.
+    '''
+
+    # the adapter accepts at most this many bytes per SPI_IO command
+    max_transfer = 62
+
+    def __init__(self, device=None, latency=0.0):
+        self.device = device or SimulatedOPCN2()
+        self.latency = latency
+        self.commands = 0
+        self.fail = False
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self.slave = slave
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def handle(self, command):
+        if command[0] == 0x5A and command[1] == 0x02:
+            return bytes([0xFF, 0x00])
+
+        if command[0] == 0x61:
+            self.commands += 1
+            data = command[1:]
+
+            if self.fail or len(data) > self.max_transfer:
+                return bytes([0x00] * (1 + len(data)))
+
+            return bytes([0xFF] + [self.device.spi(x) for x in data])
+
+        return bytes([0x00, 0x05])
+
+    def run(self):
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+
+            if not ready:
+                continue
+
+            command = os.read(self.master, 4096)
+
+            if self.latency > 0:
+                time.sleep(self.latency)
+
+            os.write(self.master, self.handle(command))
@@ -0,0 +1,79 @@
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+import unittest
+from contextlib import closing
+from alphasense import Alphasense, decode17
+from iss_simulator import SimulatedISS, make_histogram
+
+
+class AlphasenseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.iss = SimulatedISS()
+
+    def tearDown(self):
+        self.iss.close()
+
+    def test_bulk_matches_single(self):
+        device = self.iss.device
+        device.histogram = make_histogram([i * 7 for i in range(16)])
+
+        for bulk in [False, True]:
+            with closing(Alphasense(self.iss.port, bulk=bulk)) as alphasense:
+                self.assertEqual(alphasense.get_serial_number(), device.serial_number)
+                self.assertEqual(alphasense.get_firmware_version(), device.firmware)
+                self.assertEqual(alphasense.get_config_data_raw(), device.config)
+                self.assertEqual(alphasense.get_histogram_raw(), device.histogram)
+                self.assertEqual(alphasense.get_histogram(), decode17(device.histogram))
+                self.assertEqual(alphasense.get_pm(), (1.0, 2.0, 3.0))
+
+                alphasense.set_fan_power(255)
+                alphasense.set_laser_power(190)
+                self.assertEqual(device.fan_power, 255)
+                self.assertEqual(device.laser_power, 190)
+
+    def test_bulk_commands(self):
+        with closing(Alphasense(self.iss.port, bulk=True)) as alphasense:
+            alphasense.get_config_data_raw()
+            # the command byte and 256 bytes in 62 byte chunks
+            self.assertEqual(self.iss.commands, 1 + 5)
+
+            self.iss.commands = 0
+            alphasense.get_histogram_raw()
+            self.assertEqual(self.iss.commands, 1 + 1)
+
+    def test_transfer_error(self):
+        self.iss.fail = True
+
+        for bulk in [False, True]:
+            with closing(Alphasense(self.iss.port, bulk=bulk)) as alphasense:
+                with self.assertRaises(RuntimeError):
+                    alphasense.get_histogram_raw()
+
+    def test_info_cache(self):
+        device = self.iss.device
+
+        with closing(Alphasense(self.iss.port, bulk=True)) as alphasense:
+            self.assertEqual(alphasense.get_info(), (device.firmware, device.config))
+
+            # only the serial number is read while it is unchanged
+            self.iss.commands = 0
+            device.config = bytes(256)
+            self.assertEqual(alphasense.get_info()[1], bytes(range(256)))
+            self.assertEqual(self.iss.commands, 2)
+
+            device.serial_number = b'OPC-N2 987654321'
+            self.assertEqual(alphasense.get_info()[1], bytes(256))
+
+            # setting the fan or laser power changes the config
+            device.config = bytes([1] * 256)
+            alphasense.set_fan_power(200)
+            self.assertEqual(alphasense.get_info()[1], bytes([1] * 256))
+
+
+if __name__ == '__main__':
+    unittest.main()
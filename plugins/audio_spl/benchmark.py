@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+'''
+Measures the CPU time of one analysis of a 5 second sample, as read by the
+plugin in 1024 sample chunks, with the original full sample FFT and with the
+streaming octave band analyzer. Run it on the node to get the node's figures.
+'''
+import time
+import numpy as np
+from octave import OctaveBandAnalyzer, octave_bands
+
+RATE = 44100
+
+CHUNK = 1024
+
+SECONDS = 5
+
+
+def reference_analysis(frames, octave_band):
+    numpydata = np.hstack(frames)
+
+    number_of_samples = numpydata.shape[0]
+    time_per_sample = 1.0 / RATE
+
+    yf = np.fft.fftn(numpydata)
+    xf = np.linspace(0.0, 1.0 / (2.0 * time_per_sample), number_of_samples // 2)
+
+    val = yf[0:number_of_samples // 2]
+    octaves_lower_hz, octaves_center_hz, octaves_upper_hz = octave_bands(octave_band)
+
+    octave = {}
+    avg = []
+    for i in range(len(octaves_upper_hz)):
+        octave[i] = []
+
+    for hz, magnitude in zip(xf, val):
+        if hz < 20:
+            continue
+        index = np.searchsorted(octaves_upper_hz, hz, side="left")
+        if index >= len(octaves_upper_hz):
+            continue
+        octave[index].append(magnitude)
+
+    for di in range(len(octave)):
+        avg.append(sum(octave[di]) / len(octave[di]))
+
+    avg = np.asarray(avg)
+    avg_db = 10 * np.log10(np.abs(avg))
+
+    total = 0.
+    for ia in range(len(avg)):
+        total = total + 10 ** (avg_db[ia] / 10)
+
+    return avg_db, 10 * np.log10(total)
+
+
+def streaming_analysis(frames, analyzer):
+    analyzer.reset()
+
+    for frame in frames:
+        analyzer.update(frame)
+
+    return analyzer.levels()
+
+
+def cpu_time(func, *args):
+    start = time.process_time()
+    func(*args)
+    return time.process_time() - start
+
+
+def main():
+    count = int(RATE / CHUNK * SECONDS)
+    samples = np.random.RandomState(0).randint(-3000, 3000, count * CHUNK).astype(np.int16)
+    frames = [samples[i:i + CHUNK] for i in range(0, len(samples), CHUNK)]
+
+    for octave_band in [1, 3, 12]:
+        analyzer = OctaveBandAnalyzer(RATE, octave_band)
+
+        reference_time = cpu_time(reference_analysis, frames, octave_band)
+        streaming_time = cpu_time(streaming_analysis, frames, analyzer)
+
+        print('1/{} octave, window {}'.format(octave_band, analyzer.window_size))
+        print('  full sample FFT  {:.3f}s  {:.0f}kB buffered'.format(
+            reference_time, (samples.nbytes + 16 * len(samples)) / 1e3))
+        print('  streaming        {:.3f}s  {:.0f}kB buffered  speedup {:.1f}x'.format(
+            streaming_time, (analyzer.buffer.nbytes + analyzer.power.nbytes) / 1e3,
+            reference_time / streaming_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+'''
+Continuous sound level monitoring for the sound pressure level plugin.
+
+The monitor is fed 16 bit mono audio as it is read. It computes band levels
+over each level period (1 second by default) and reports the equivalent
+continuous level (Leq) of each band and of all bands over each reporting
+interval. The last few seconds of audio are kept in a preallocated ring
+buffer, so when a period's level reaches the trigger threshold a clip with
+the audio before and after the event is written to clip_dir.
+
+Example:
+
+monitor = LeqMonitor(44100, 3, trigger_db=70)
+
+with closing(WaveSource('test.wav')) as source:
+    monitor.run(source, 1024, print)
+'''
+import datetime
+import os
+import wave
+from collections import namedtuple
+import numpy as np
+from octave import OctaveBandAnalyzer
+
+SAMPLE_WIDTH = 2
+
+Report = namedtuple('Report', [
+    'band_db',
+    'total_db',
+    'max_db',
+])
+
+
+class RingBuffer:
+    '''
+    Keeps the last size samples in a preallocated array.
+    '''
+
+    def __init__(self, size, dtype=np.int16):
+        self.data = np.zeros(size, dtype=dtype)
+        self.position = 0
+        self.count = 0
+
+    def write(self, samples):
+        size = len(self.data)
+
+        if len(samples) >= size:
+            self.data[:] = samples[-size:]
+            self.position = 0
+            self.count = size
+            return
+
+        first = min(len(samples), size - self.position)
+        self.data[self.position:self.position + first] = samples[:first]
+        self.data[:len(samples) - first] = samples[first:]
+        self.position = (self.position + len(samples)) % size
+        self.count = min(self.count + len(samples), size)
+
+    def read(self):
+        '''
+        Returns a copy of the buffered samples, oldest first.
+        '''
+        if self.count < len(self.data):
+            return self.data[:self.count].copy()
+        return np.concatenate((self.data[self.position:], self.data[:self.position]))
+
+
+class WaveSource:
+    '''
+    Reads 16 bit mono audio from a wav file with the same read interface as
+    the microphone, for testing the monitor without an input device. read
+    returns empty bytes at the end of the file.
+    '''
+
+    def __init__(self, path):
+        self.file = wave.open(path, 'rb')
+
+        if self.file.getnchannels() != 1 or self.file.getsampwidth() != SAMPLE_WIDTH:
+            self.file.close()
+            raise ValueError('Only 16 bit mono wav files are supported.')
+
+        self.rate = self.file.getframerate()
+
+    def read(self, count):
+        return self.file.readframes(count)
+
+    def close(self):
+        self.file.close()
+
+
+class LeqMonitor:
+    '''
+    Computes band levels over every level_period seconds and reports the Leq
+    over every interval seconds. When a period's total level is at least
+    trigger_db, a clip from pre_trigger seconds before that period to
+    post_trigger seconds after it is written to clip_dir. Another trigger
+    during a clip extends it. trigger_db of None disables clips.
+    '''
+
+    def __init__(self, rate, octave_band, level_period=1, interval=60, trigger_db=None,
+                 pre_trigger=5, post_trigger=5, clip_dir='/wagglerw/files/audio', window_size=None):
+        self.rate = rate
+        self.analyzer = OctaveBandAnalyzer(rate, octave_band, window_size=window_size)
+        self.period_samples = int(rate * level_period)
+
+        if self.analyzer.window_size > self.period_samples:
+            raise ValueError('Level period is shorter than the analysis window.')
+
+        self.interval_periods = max(1, int(round(interval / level_period)))
+        self.trigger_db = trigger_db
+        self.post_samples = int(rate * post_trigger)
+        self.clip_dir = clip_dir
+
+        # the trigger is checked at the end of a period, so the ring holds
+        # the period as well as the pre trigger audio before it.
+        self.ring = RingBuffer(int(rate * pre_trigger) + self.period_samples)
+
+        self.clip = None
+        self.clip_remaining = 0
+        self.clip_path = None
+        self.level = None
+        self.reset()
+
+    def reset(self):
+        '''
+        Discards the current period and interval.
+        '''
+        self.analyzer.reset()
+        self.period_count = 0
+        self.periods = 0
+        self.interval_power = np.zeros(len(self.analyzer.upper))
+        self.max_db = -np.inf
+
+    def update(self, samples):
+        '''
+        Adds samples to the monitor. Returns the list of reports for the
+        intervals which ended.
+        '''
+        reports = []
+        offset = 0
+
+        while offset < len(samples):
+            count = min(len(samples) - offset, self.period_samples - self.period_count)
+            piece = samples[offset:offset + count]
+            offset += count
+
+            if self.clip is not None:
+                self._write_clip(piece)
+
+            self.ring.write(piece)
+            self.analyzer.update(piece)
+            self.period_count += count
+
+            if self.period_count == self.period_samples:
+                report = self._end_period()
+
+                if report is not None:
+                    reports.append(report)
+
+            # the clip is closed after the period is checked, so a trigger at
+            # the end of the clip extends it.
+            if self.clip is not None and self.clip_remaining == 0:
+                self.close()
+
+        return reports
+
+    def run(self, source, chunk, publish):
+        '''
+        Reads chunks from source until it returns no data, calling publish
+        with each report.
+        '''
+        try:
+            while True:
+                data = source.read(chunk)
+
+                if not data:
+                    break
+
+                for report in self.update(np.frombuffer(data, dtype=np.int16)):
+                    publish(report)
+        finally:
+            self.close()
+
+    def close(self):
+        '''
+        Closes the clip being written, if any.
+        '''
+        if self.clip is not None:
+            self.clip.close()
+            self.clip = None
+
+    def _end_period(self):
+        power = self.analyzer.band_power()
+        self.analyzer.reset(keep_samples=True)
+        self.period_count = 0
+
+        total = np.sum(power)
+        self.level = (10 * np.log10(power), 10 * np.log10(total))
+        self.interval_power += power
+        self.periods += 1
+        self.max_db = max(self.max_db, self.level[1])
+
+        if self.trigger_db is not None and self.level[1] >= self.trigger_db:
+            self._trigger()
+
+        if self.periods < self.interval_periods:
+            return None
+
+        power = self.interval_power / self.periods
+        report = Report(10 * np.log10(power), 10 * np.log10(np.sum(power)), self.max_db)
+        self.periods = 0
+        self.interval_power[:] = 0
+        self.max_db = -np.inf
+        return report
+
+    def _trigger(self):
+        self.clip_remaining = self.post_samples
+
+        if self.clip is not None:
+            return
+
+        if not os.path.exists(self.clip_dir):
+            os.makedirs(self.clip_dir)
+
+        name = 'audio_{:%Y%m%dT%H%M%S}'.format(datetime.datetime.now())
+        path = os.path.join(self.clip_dir, name + '.wav')
+        number = 1
+        while os.path.exists(path):
+            path = os.path.join(self.clip_dir, '{}_{}.wav'.format(name, number))
+            number += 1
+
+        self.clip = wave.open(path, 'wb')
+        self.clip.setnchannels(1)
+        self.clip.setsampwidth(SAMPLE_WIDTH)
+        self.clip.setframerate(self.rate)
+        self.clip.writeframes(self.ring.read().tobytes())
+        self.clip_path = path
+
+    def _write_clip(self, samples):
+        samples = samples[:self.clip_remaining]
+        self.clip.writeframes(np.asarray(samples, dtype=np.int16).tobytes())
+        self.clip_remaining -= len(samples)
@@ -0,0 +1,197 @@
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+'''
+Streaming octave band analysis for the sound pressure level plugin.
+
+Audio is fed in chunks of any size as it arrives. Each full window is
+transformed with rfft and its power is added to a per bin sum, so only one
+window of audio is kept. Band levels are computed from the averaged power
+with a precomputed bin to band index.
+
+Example:
+
+analyzer = OctaveBandAnalyzer(44100, 3)
+
+for chunk in chunks:
+    analyzer.update(chunk)
+
+band_db, total_db = analyzer.levels()
+'''
+import numpy as np
+
+# bins below this frequency are not part of any band
+MIN_FREQUENCY = 20
+
+MIN_WINDOW_SIZE = 4096
+
+MAX_WINDOW_SIZE = 2**18
+
+# number of values reported for the octave bands
+OCTAVE_COUNT = 10
+
+
+def octave_bands(octave_band):
+    '''
+    Returns the lower, center and upper frequencies of 1/octave_band octave
+    bands from 20Hz up, following EN ISO 266 for 1/1 and 1/3 octaves. Only
+    the first octave_band * 10 lower and upper frequencies are returned.
+    '''
+    octv = octave_band
+    n = 5 * octv + (octv - 1) + 10
+    m = 4 * octv + 10
+
+    center = []
+    for i in reversed(range(n)):
+        c = 1000. / 2 ** ((i + 1) / octv)
+        if c > 20:
+            center.append(round(c, 4))
+    center.append(1000)
+    for i in range(m):
+        c = 1000. * 2 ** ((i + 1) / octv)
+        if c < 22000:
+            center.append(round(c, 4))
+
+    upper = []
+    for i in range(len(center)):
+        u = center[i] * 2 ** (1 / (octv * 2))
+        if len(upper) < (octv * 10):
+            upper.append(round(u, 4))
+    lower = []
+    for i in range(len(center)):
+        l = center[i] / 2 ** (1 / (octv * 2))
+        if len(lower) < (octv * 10):
+            lower.append(round(l, 4))
+
+    return lower, center, upper
+
+
+def bin_bands(frequencies, upper):
+    '''
+    Returns the indices of the frequencies which fall in a band and the band
+    of each. A band covers the frequencies above the previous upper frequency
+    up to and including its own, and the first band starts at MIN_FREQUENCY.
+    '''
+    bands = np.searchsorted(upper, frequencies, side='left')
+    valid = (frequencies >= MIN_FREQUENCY) & (bands < len(upper))
+    indices = np.flatnonzero(valid)
+    return indices, bands[indices]
+
+
+def choose_window_size(rate, upper):
+    '''
+    Returns the smallest power of two window, at least MIN_WINDOW_SIZE, whose
+    rfft bins resolve every band.
+    '''
+    size = MIN_WINDOW_SIZE
+
+    while size <= MAX_WINDOW_SIZE:
+        _, bands = bin_bands(np.fft.rfftfreq(size, 1.0 / rate), upper)
+
+        if np.all(np.bincount(bands, minlength=len(upper)) > 0):
+            return size
+
+        size *= 2
+
+    raise ValueError('No window up to {} samples resolves every band.'.format(MAX_WINDOW_SIZE))
+
+
+def combine_octaves(band_db, octave_band):
+    '''
+    Combines fractional octave band levels into OCTAVE_COUNT octave levels by
+    adding the power of each group of octave_band bands. The last octave also
+    takes any remaining bands.
+    '''
+    power = 10 ** (np.asarray(band_db, dtype=float) / 10)
+    starts = np.arange(OCTAVE_COUNT) * octave_band
+    return 10 * np.log10(np.add.reduceat(power, starts))
+
+
+class OctaveBandAnalyzer:
+    '''
+    Accumulates Welch style band power over Hann windows of window_size
+    samples with 50% overlap. If window_size is None, the smallest window
+    which resolves every band is used.
+    '''
+
+    def __init__(self, rate, octave_band, window_size=None):
+        self.rate = rate
+        self.octave_band = octave_band
+        self.lower, self.center, self.upper = octave_bands(octave_band)
+
+        if window_size is None:
+            window_size = choose_window_size(rate, self.upper)
+
+        self.window_size = window_size
+        self.hop = window_size // 2
+        self.window = np.hanning(window_size)
+
+        frequencies = np.fft.rfftfreq(window_size, 1.0 / rate)
+        self.bin_indices, self.bin_bands = bin_bands(frequencies, self.upper)
+
+        if len(np.unique(self.bin_bands)) < len(self.upper):
+            raise ValueError('Window of {} samples does not resolve every band.'.format(window_size))
+
+        # scales the one sided power of each bin to mean square signal
+        # power, accounting for the window's power.
+        self.scale = np.full(len(frequencies), 2.0 / (window_size * np.sum(self.window ** 2)))
+        self.scale[0] /= 2
+        if window_size % 2 == 0:
+            self.scale[-1] /= 2
+
+        self.buffer = np.zeros(window_size)
+        self.power = np.zeros(len(frequencies))
+        self.reset()
+
+    def reset(self, keep_samples=False):
+        '''
+        Discards the accumulated power, and the buffered audio unless
+        keep_samples is set so the next window continues from it.
+        '''
+        if not keep_samples:
+            self.filled = 0
+        self.windows = 0
+        self.power[:] = 0
+
+    def update(self, samples):
+        '''
+        Adds samples to the analysis, transforming each window as it fills.
+        '''
+        samples = np.asarray(samples)
+        offset = 0
+
+        while offset < len(samples):
+            count = min(self.window_size - self.filled, len(samples) - offset)
+            self.buffer[self.filled:self.filled + count] = samples[offset:offset + count]
+            self.filled += count
+            offset += count
+
+            if self.filled == self.window_size:
+                spectrum = np.fft.rfft(self.buffer * self.window)
+                self.power += spectrum.real ** 2 + spectrum.imag ** 2
+                self.windows += 1
+
+                self.buffer[:-self.hop] = self.buffer[self.hop:]
+                self.filled -= self.hop
+
+    def band_power(self):
+        '''
+        Returns the mean square power of each band averaged over the windows
+        analyzed since the last reset.
+        '''
+        if self.windows == 0:
+            raise RuntimeError('Not enough samples for one window.')
+
+        power = self.power[self.bin_indices] * self.scale[self.bin_indices]
+        return np.bincount(self.bin_bands, weights=power, minlength=len(self.upper)) / self.windows
+
+    def levels(self):
+        '''
+        Returns the level of each band and the total level over all bands, in
+        dB relative to a mean square sample value of 1.
+        '''
+        power = self.band_power()
+        return 10 * np.log10(power), 10 * np.log10(np.sum(power))
@@ -19,6 +19,8 @@ import datetime
 
 from waggle.pipeline import Plugin
 from waggle.protocol.v5.encoder import encode_frame
+from octave import OctaveBandAnalyzer, OCTAVE_COUNT, combine_octaves, octave_bands
+from monitor import LeqMonitor, WaveSource
 
 device = os.environ.get('WAGGLE_MICROPHONE', '/dev/waggle_microphone')
 
@@ -34,10 +36,56 @@ def get_default_configuration():
         'interval': 60,  # 1 minute
         'octave_band': 3,
         'recording': False,
+        'fft_window': None,  # in samples, None to fit the octave band
+        'mode': 'sample',  # 'sample' or 'continuous'
+        'level_period': 1,  # in Second, continuous mode only
+        'trigger_db': 70,  # None to disable clips, continuous mode only
+        'pre_trigger': 5,  # in Second, continuous mode only
+        'post_trigger': 5,  # in Second, continuous mode only
     }
     return default_config
 
 
+def find_device_index(audio, audio_name):
+    for i in range(audio.get_device_count()):
+        device_info = audio.get_device_info_by_index(i)
+        if audio_name in device_info['name']:
+            return device_info['index']
+    return -1
+
+
+class MicrophoneSource:
+    '''
+    Keeps a blocking input stream open on the Waggle microphone for the
+    continuous mode.
+    '''
+
+    def __init__(self, audio_name, rate, channels, chunk):
+        self.rate = rate
+        self.audio = pyaudio.PyAudio()
+        device_index = find_device_index(self.audio, audio_name)
+
+        if device_index < 0:
+            self.audio.terminate()
+            raise RuntimeError('Failed to find Waggle microphone')
+
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=channels,
+            rate=rate,
+            input=True,
+            frames_per_buffer=chunk,
+            input_device_index=device_index)
+
+    def read(self, count):
+        return self.stream.read(count, exception_on_overflow=False)
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
+
+
 class SoundPressureLevel(Plugin):
     plugin_name = 'spl'
     plugin_version = '0'
@@ -55,6 +103,9 @@ class SoundPressureLevel(Plugin):
         self.total_count = int(self.audio_rate / self.audio_chunk * self.audio_sampling_seconds)
         self.octave_band = self.config['octave_band']
         self.recording = self.config['recording']
+        self.analyzer = OctaveBandAnalyzer(
+            self.audio_rate, self.octave_band, window_size=self.config.get('fft_window'))
+        self.wave_file = None
 
     def _get_config_table(self):
         config_file = '/wagglerw/waggle/audio_spl.conf'
@@ -69,7 +120,9 @@ class SoundPressureLevel(Plugin):
         return config_data
 
     def _read_callback(self, in_data, frame_count, time_info, status):
-        self.frames.append(np.frombuffer(in_data, dtype=np.int16))
+        self.analyzer.update(np.frombuffer(in_data, dtype=np.int16))
+        if self.wave_file is not None:
+            self.wave_file.writeframes(in_data)
         self.frame_count += 1
         if self.frame_count >= self.total_count:
             return (in_data, pyaudio.paComplete)
@@ -78,32 +131,35 @@ class SoundPressureLevel(Plugin):
 
     def _open_and_read(self):
         audio = pyaudio.PyAudio()
-        device_count = audio.get_device_count()
-        device_index = -1
-
-        for i in range(device_count):
-            device_info = audio.get_device_info_by_index(i)
-            if self.audio_name in device_info['name']:
-                device_index = device_info['index']
-                break
+        device_index = find_device_index(audio, self.audio_name)
 
         if device_index < 0:
             audio.terminate()
             return False, 'Failed to find Waggle microphone'
 
-        stream = audio.open(
-            format=self.audio_format,
-            channels=self.audio_channels,
-            rate=self.audio_rate,
-            input=True,
-            frames_per_buffer=self.audio_chunk,
-            input_device_index=device_index,
-            stream_callback=self._read_callback)
-
-        self.frames = []
+        self.analyzer.reset()
         self.frame_count = 0
+
+        try:
+            stream = audio.open(
+                format=self.audio_format,
+                channels=self.audio_channels,
+                rate=self.audio_rate,
+                input=True,
+                frames_per_buffer=self.audio_chunk,
+                input_device_index=device_index,
+                stream_callback=self._read_callback)
+        except Exception as ex:
+            audio.terminate()
+            return False, str(ex)
+
         error_code = 1
         try:
+            # the wave file is opened once the stream is, so that it is always
+            # closed below
+            if self.recording is True:
+                self.wave_file = self._open_wave_file(audio)
+
             stream.start_stream()
             # Give it 30 more seconds as timeout
             for i in range(self.audio_sampling_seconds + 30):
@@ -117,118 +173,47 @@ class SoundPressureLevel(Plugin):
             stream.stop_stream()
             stream.close()
             audio.terminate()
-
-        if self.recording is True:
-            base_dir = '/wagglerw/files/audio'
-            if not os.path.exists(base_dir):
-                os.makedirs(base_dir)
-            file_name = os.path.join(base_dir, 'audio_{:%Y%m%dT%H%M%S}.wav'.format(datetime.datetime.now()))
-            waveFile = wave.open(file_name, 'wb')
-            waveFile.setnchannels(self.audio_channels)
-            waveFile.setsampwidth(audio.get_sample_size(self.audio_format))
-            waveFile.setframerate(self.audio_rate)
-            waveFile.writeframes(b''.join(self.frames))
-            waveFile.close()
+            if self.wave_file is not None:
+                self.wave_file.close()
+                self.wave_file = None
 
         if error_code == 0:
-            return True, self.frames
+            return True, self.analyzer
         else:
             return False, 'Timeout on data collection'
 
+    def _open_wave_file(self, audio):
+        base_dir = '/wagglerw/files/audio'
+        if not os.path.exists(base_dir):
+            os.makedirs(base_dir)
+        file_name = os.path.join(base_dir, 'audio_{:%Y%m%dT%H%M%S}.wav'.format(datetime.datetime.now()))
+        waveFile = wave.open(file_name, 'wb')
+        waveFile.setnchannels(self.audio_channels)
+        waveFile.setsampwidth(audio.get_sample_size(self.audio_format))
+        waveFile.setframerate(self.audio_rate)
+        return waveFile
+
     def cal_freq_range(self):
-        octv = self.octave_band
-        n = 5 * octv + (octv - 1) + 10
-        m = 4 * octv + 10
-
-        center = []
-        for i in reversed(range(n)):
-            c = 1000. / 2 ** ((i + 1) / octv)
-            if c > 20:
-                center.append(round(c, 4))
-        center.append(1000)
-        for i in range(m):
-            c = 1000. * 2 ** ((i + 1) / octv)
-            if c < 22000:
-                center.append(round(c, 4))
-
-        upper = []
-        for i in range(len(center)):
-            u = center[i] * 2 ** (1 / (octv * 2))
-            if len(upper) < (octv * 10):
-                upper.append(round(u, 4))
-        lower = []
-        for i in range(len(center)):
-            l = center[i] / 2 ** (1 / (octv * 2))
-            if len(lower) < (octv * 10):
-                lower.append(round(l, 4))
-
-        return lower, center, upper
+        return octave_bands(self.octave_band)
 
     def match_length(self, avg_db):
-        octave_db = []
-        for i in range(10):
-            instance = 0.
-            if i == 9:
-                left = len(avg_db) - self.octave_band * 9
-                for j in range(left):
-                    instance = instance + 10 ** (avg_db[i * self.octave_band + j] / 10)
-            else:
-                for j in range(self.octave_band):
-                    instance = instance + 10 ** (avg_db[i * self.octave_band + j] / 10)
-            octave_db.append(10 * np.log10(instance))
-
-        instance = 0.
-        for i in range(10):
-            instance = instance + 10 ** (octave_db[i] / 10)
-
-        return octave_db
+        return combine_octaves(avg_db, self.octave_band).tolist()
 
     def close(self):
         pass
 
     def _do_process(self):
-        f, raw_data = self._open_and_read()
+        f, analyzer = self._open_and_read()
         if f is False:
-            raise Exception(raw_data)
+            raise Exception(analyzer)
         print('Received frame')
-        numpydata = np.hstack(raw_data)
-
-        number_of_samples = numpydata.shape[0]
-        time_per_sample = 1.0 / self.audio_rate
-
-        yf = np.fft.fftn(numpydata)  # the n-dimensional FFT
-        xf = np.linspace(0.0, 1.0 / (2.0 * time_per_sample), number_of_samples // 2)  # 1.0/(2.0*T) = RATE / 2
-
-        val = yf[0:number_of_samples // 2]
-        octaves_lower_hz, octaves_center_hz, octaves_upper_hz = self.cal_freq_range()
-
-        octave = {}
-        avg = []
-        for i in range(len(octaves_upper_hz)):
-            octave[i] = []
-
-        for hz, magnitude in zip(xf, val):
-            if hz < 20:
-                continue
-            index = np.searchsorted(octaves_upper_hz, hz, side="left")
-            if index >= len(octaves_upper_hz):
-                continue
-            octave[index].append(magnitude)
 
-        for di in range(len(octave)):
-            avg.append(sum(octave[di]) / len(octave[di]))
-
-        avg = np.asarray(avg)
-        avg_db = 10 * np.log10(np.abs(avg))
-
-        total = 0.
-        for ia in range(len(avg)):
-            total = total + 10 ** (avg_db[ia] / 10)
-
-        sdb = 10 * np.log10(total)
+        avg_db, sdb = analyzer.levels()
+        self._publish(avg_db, sdb)
 
+    def _publish(self, avg_db, sdb):
         # if octave band > 1, so that the length of avg_db does not match with waggle protocol:
-        if len(avg_db) > 10:
+        if len(avg_db) > OCTAVE_COUNT:
             avg_db = self.match_length(avg_db)
 
         if self.hrf:
@@ -244,7 +229,29 @@ class SoundPressureLevel(Plugin):
             binary_packet = encode_frame(packet)
             self.send(sensor='', data=binary_packet)
 
+    def run_continuous(self, source=None):
+        if source is None:
+            source = MicrophoneSource(self.audio_name, self.audio_rate, self.audio_channels, self.audio_chunk)
+
+        try:
+            monitor = LeqMonitor(
+                source.rate,
+                self.octave_band,
+                level_period=self.config.get('level_period', 1),
+                interval=self.config['interval'],
+                trigger_db=self.config.get('trigger_db', 70),
+                pre_trigger=self.config.get('pre_trigger', 5),
+                post_trigger=self.config.get('post_trigger', 5),
+                window_size=self.config.get('fft_window'))
+            monitor.run(source, self.audio_chunk, lambda report: self._publish(report.band_db, report.total_db))
+        finally:
+            source.close()
+
     def run(self):
+        if self.config.get('mode') == 'continuous':
+            self.run_continuous()
+            return
+
         while True:
             self._do_process()
             time.sleep(self.config['interval'])
@@ -253,16 +260,20 @@ class SoundPressureLevel(Plugin):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--hrf', action='store_true', help='Print in human readable form')
+    parser.add_argument('--wav', help='Run the continuous mode on a 16 bit mono wav file instead of the microphone')
     args = parser.parse_args()
 
-    if not os.path.exists(device):
+    if args.wav is None and not os.path.exists(device):
         print('No Waggle microphone detected')
         exit(1)
 
     plugin = SoundPressureLevel.defaultConfig()
     plugin.hrf = args.hrf
     try:
-        plugin.run()
+        if args.wav is not None:
+            plugin.run_continuous(WaveSource(args.wav))
+        else:
+            plugin.run()
     except (KeyboardInterrupt, Exception) as ex:
         print(str(ex))
     finally:
@@ -0,0 +1,118 @@
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+import os
+import tempfile
+import unittest
+import wave
+from contextlib import closing
+import numpy as np
+from monitor import LeqMonitor, RingBuffer, WaveSource
+
+RATE = 44100
+
+
+def write_wave(path, samples, channels=1):
+    with closing(wave.open(path, 'wb')) as file:
+        file.setnchannels(channels)
+        file.setsampwidth(2)
+        file.setframerate(RATE)
+        file.writeframes(samples.astype(np.int16).tobytes())
+
+
+def read_wave(path):
+    with closing(wave.open(path, 'rb')) as file:
+        return np.frombuffer(file.readframes(file.getnframes()), dtype=np.int16)
+
+
+def make_samples(seconds, event_start=None, event_seconds=0.5):
+    samples = np.random.RandomState(0).normal(0, 10, RATE * seconds)
+
+    if event_start is not None:
+        start = int(RATE * event_start)
+        end = start + int(RATE * event_seconds)
+        t = np.arange(end - start) / RATE
+        samples[start:end] += 10000 * np.sin(2 * np.pi * 500 * t)
+
+    return np.round(samples).astype(np.int16)
+
+
+class RingBufferTestCase(unittest.TestCase):
+
+    def test_write_and_read(self):
+        ring = RingBuffer(4)
+        ring.write(np.arange(3))
+        self.assertEqual(ring.read().tolist(), [0, 1, 2])
+
+        ring.write(np.arange(3, 6))
+        self.assertEqual(ring.read().tolist(), [2, 3, 4, 5])
+
+        ring.write(np.arange(6, 11))
+        self.assertEqual(ring.read().tolist(), [7, 8, 9, 10])
+
+
+class LeqMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.clip_dir = os.path.join(self.dir.name, 'audio')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_monitor(self, samples, **kwargs):
+        path = os.path.join(self.dir.name, 'input.wav')
+        write_wave(path, samples)
+
+        monitor = LeqMonitor(RATE, 3, clip_dir=self.clip_dir, **kwargs)
+        reports = []
+
+        with closing(WaveSource(path)) as source:
+            monitor.run(source, 1024, reports.append)
+
+        return monitor, reports
+
+    def test_event_clip(self):
+        samples = make_samples(10, event_start=6.2)
+        monitor, reports = self.run_monitor(
+            samples, interval=5, trigger_db=60, pre_trigger=2, post_trigger=1)
+
+        # the period from 6s to 7s triggers a clip from 4s to 8s
+        self.assertEqual(os.listdir(self.clip_dir), [os.path.basename(monitor.clip_path)])
+        self.assertEqual(read_wave(monitor.clip_path).tolist(), samples[4 * RATE:8 * RATE].tolist())
+
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(len(reports[0].band_db), 30)
+        self.assertAlmostEqual(reports[0].total_db, 20, delta=0.5)
+        self.assertAlmostEqual(reports[0].max_db, 20, delta=0.5)
+
+        # a 0.5s burst with a mean square of 10000**2 / 2 over a 5s interval
+        self.assertAlmostEqual(reports[1].total_db, 10 * np.log10(10000 ** 2 / 2 / 10), delta=0.5)
+        self.assertGreater(reports[1].max_db, reports[1].total_db)
+
+    def test_quiet(self):
+        monitor, reports = self.run_monitor(make_samples(4), interval=2, trigger_db=60)
+        self.assertEqual(len(reports), 2)
+        self.assertIsNone(monitor.clip_path)
+        self.assertFalse(os.path.exists(self.clip_dir))
+
+    def test_extended_clip(self):
+        samples = make_samples(8, event_start=2.5, event_seconds=2)
+        monitor, _ = self.run_monitor(samples, trigger_db=60, pre_trigger=1, post_trigger=1)
+
+        # periods ending at 3s, 4s and 5s trigger, the clip runs from 1s to 6s
+        self.assertEqual(read_wave(monitor.clip_path).tolist(), samples[1 * RATE:6 * RATE].tolist())
+
+    def test_wave_source_format(self):
+        path = os.path.join(self.dir.name, 'stereo.wav')
+        write_wave(path, np.zeros(200), channels=2)
+
+        with self.assertRaises(ValueError):
+            WaveSource(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
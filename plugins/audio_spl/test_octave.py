@@ -0,0 +1,97 @@
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+import unittest
+import numpy as np
+from octave import OctaveBandAnalyzer, combine_octaves, octave_bands
+
+RATE = 44100
+
+
+def reference_match_length(avg_db, octave_band):
+    octave_db = []
+    for i in range(10):
+        instance = 0.
+        if i == 9:
+            left = len(avg_db) - octave_band * 9
+            for j in range(left):
+                instance = instance + 10 ** (avg_db[i * octave_band + j] / 10)
+        else:
+            for j in range(octave_band):
+                instance = instance + 10 ** (avg_db[i * octave_band + j] / 10)
+        octave_db.append(10 * np.log10(instance))
+    return octave_db
+
+
+def tone(frequency, amplitude, seconds):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+class OctaveTestCase(unittest.TestCase):
+
+    def test_band_layout(self):
+        lower, center, upper = octave_bands(1)
+        self.assertEqual(center[:10], [31.25, 62.5, 125.0, 250.0, 500.0, 1000, 2000.0, 4000.0, 8000.0, 16000.0])
+        self.assertEqual(upper[0], 44.1942)
+
+        for octave_band in [1, 2, 3, 12]:
+            analyzer = OctaveBandAnalyzer(RATE, octave_band)
+            self.assertEqual(len(analyzer.upper), 10 * octave_band)
+            analyzer.update(np.ones(analyzer.window_size))
+            self.assertEqual(len(analyzer.band_power()), 10 * octave_band)
+
+    def test_tone_level(self):
+        analyzer = OctaveBandAnalyzer(RATE, 3)
+        analyzer.update(tone(1000, 1000, 2))
+        band_db, total_db = analyzer.levels()
+
+        expected = 10 * np.log10(1000 ** 2 / 2)
+        band = int(np.searchsorted(analyzer.upper, 1000))
+        self.assertAlmostEqual(band_db[band], expected, places=1)
+        self.assertAlmostEqual(total_db, expected, places=1)
+        self.assertLess(max(np.delete(band_db, band)), expected - 20)
+
+    def test_noise_level(self):
+        samples = np.random.RandomState(0).normal(0, 300, RATE * 5)
+        analyzer = OctaveBandAnalyzer(RATE, 1)
+        analyzer.update(samples)
+        _, total_db = analyzer.levels()
+        self.assertAlmostEqual(total_db, 10 * np.log10(np.var(samples)), delta=0.2)
+
+    def test_chunked_update(self):
+        samples = np.random.RandomState(1).randint(-2000, 2000, RATE * 2).astype(np.int16)
+
+        whole = OctaveBandAnalyzer(RATE, 3)
+        whole.update(samples)
+
+        chunked = OctaveBandAnalyzer(RATE, 3)
+        for i in range(0, len(samples), 1000):
+            chunked.update(samples[i:i + 1000])
+
+        self.assertEqual(chunked.windows, whole.windows)
+        self.assertEqual(chunked.band_power().tolist(), whole.band_power().tolist())
+
+        chunked.reset()
+        with self.assertRaises(RuntimeError):
+            chunked.band_power()
+
+    def test_combine_octaves(self):
+        rand = np.random.RandomState(2)
+
+        for octave_band in [1, 2, 3, 12]:
+            band_db = rand.uniform(0, 80, 10 * octave_band)
+            expected = reference_match_length(band_db, octave_band)
+            for value, ref in zip(combine_octaves(band_db, octave_band), expected):
+                self.assertAlmostEqual(value, ref)
+
+    def test_window_too_small(self):
+        with self.assertRaises(ValueError):
+            OctaveBandAnalyzer(RATE, 24, window_size=4096)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@
 #           http://www.wa8.gl
 # ANL:waggle-license
 
+import asyncio
 import time
 import os
 import argparse
@@ -13,6 +14,8 @@ from serial import Serial, SerialException
 
 from waggle.pipeline import Plugin
 from waggle.checksum import crc8
+from waggle.coresense.transport import FrameReader, StreamFrameReader
+from waggle.plugin.runtime import Runtime, open_serial
 from waggle.protocol.v5.decoder import decode_frame, convert
 
 import json
@@ -61,12 +64,9 @@ def get_default_configuration():
 class DeviceHandler(object):
     def __init__(self, device):
         self.serial = None
+        self.reader = None
         self.device = device
 
-        self.START_BYTE = 0xAA
-        self.END_BYTE = 0x55
-        self.HEADER_SIZE = 3
-        self.FOOTER_SIZE = 2
         self.SQN = 0
 
     def open(self):
@@ -76,6 +76,7 @@ class DeviceHandler(object):
                 time.sleep(1)
             self.serial = None
         self.serial = Serial(self.device, baudrate=115200, timeout=180)
+        self.reader = FrameReader(self.serial)
 
     def close(self):
         if self.serial is not None:
@@ -83,45 +84,14 @@ class DeviceHandler(object):
                 self.serial.close()
 
     def read_response(self, timeout=180):
-        data = bytearray()
-        packets = bytearray()
-
         # The response must be received within 3 minutes
-        for i in range(timeout * 2):
-            if self.serial.inWaiting() > 0 or len(data) > 0:
-                data.extend(self.serial.read(self.serial.inWaiting()))
-
-                while True:
-                    try:
-                        del data[:data.index(self.START_BYTE)]
-                    except ValueError:
-                        del data[:]
-
-                    if len(data) >= self.HEADER_SIZE:
-                        packet_length = data[2]
-                        if len(data) >= self.HEADER_SIZE + packet_length + self.FOOTER_SIZE:
-                            packet = data[:self.HEADER_SIZE + packet_length + self.FOOTER_SIZE]
-                            crc = packet[-2]
-                            if crc != crc8(packet[self.HEADER_SIZE:-2]):
-                                return None
-                            sequence = data[3]
-                            packets.extend(packet)
-                            del data[:len(packet)]
-                            if (sequence & 0x80) == 0x80:
-                                return packets
-                        else:
-                            time.sleep(0.5)
-                            break
-                    else:
-                        time.sleep(0.5)
-                        break
-            else:
-                time.sleep(0.5)
-
-        # TIMEOUT: return packet that have been received
-        return packets
+        return self.reader.read_response(timeout)
 
     def request_data(self, sensors):
+        self.serial.write(self.pack_request(sensors))
+        return self.read_response()
+
+    def pack_request(self, sensors):
         # Packaging
         buffer = bytearray()
         buffer.append(0xAA)  # preamble
@@ -152,8 +122,7 @@ class DeviceHandler(object):
         buffer[2] = len(data) + 1
         buffer.append(crc8(buffer[3:]))  # crc
         buffer.append(0x55)  # postscript
-        self.serial.write(bytes(buffer))
-        return self.read_response()
+        return bytes(buffer)
 
 
 class CoresensePlugin4(Plugin):
@@ -167,8 +136,9 @@ class CoresensePlugin4(Plugin):
             s = self.sensors[sensor]
             s['last_updated'] = time.time()
             self.sensors[sensor] = s
+        # the port is opened as an async stream by run
         self.input_handler = DeviceHandler(device)
-        self.input_handler.open()
+        self.stream = None
         self.hrf = hrf
 
         self.function_type = {
@@ -195,6 +165,9 @@ class CoresensePlugin4(Plugin):
         }
 
     def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
         self.input_handler.close()
 
     def _get_config_table(self):
@@ -247,11 +220,25 @@ class CoresensePlugin4(Plugin):
             except Exception as ex:
                 print('Coult not decode %s: %s' % (item, str(ex)))
 
+    async def request_data(self, sensors):
+        self.stream.write(self.input_handler.pack_request(sensors))
+        await self.stream.drain()
+        # The response must be received within 3 minutes
+        return await self.reader.read_response(180)
+
     def run(self):
+        runtime = Runtime()
+        runtime.add(self.read_sensors)
+        runtime.run()
+
+    async def read_sensors(self):
+        self.stream = await open_serial(device, 115200)
+        self.reader = StreamFrameReader(self.stream)
+
         # Check firmware version and MAC address of the Metsense
         try:
             check_firmware_request = [5, 255, 5, 0]  # sensor_read, 0xFF, 0x00
-            message = self.input_handler.request_data(check_firmware_request)
+            message = await self.request_data(check_firmware_request)
             if message is None:
                 raise Exception('Serial error')
             else:
@@ -261,7 +248,7 @@ class CoresensePlugin4(Plugin):
                 self._print(ver)
                 if not self.hrf:
                     self.send(sensor='frame', data=message)
-        except SerialException:
+        except (SerialException, OSError, EOFError):
             print('Could not check firmware version due to serial error. Restarting...')
             return
         except Exception as ex:
@@ -272,14 +259,14 @@ class CoresensePlugin4(Plugin):
             requests = self._get_requests()
             if len(requests) > 0:
                 try:
-                    message = self.input_handler.request_data(requests)
-                except SerialException:
+                    message = await self.request_data(requests)
+                except (SerialException, OSError, EOFError):
                     print('Error in serial connection. Restarting...')
                     break
 
                 if message is None:
                     print('Errors or invalid crc')
-                    time.sleep(5)
+                    await asyncio.sleep(5)
                 elif len(message) == 0:
                     print('No packet received. Restarting...')
                     break
@@ -291,7 +278,7 @@ class CoresensePlugin4(Plugin):
                     else:
                         self.send(sensor='frame', data=message)
             else:
-                time.sleep(1)
+                await asyncio.sleep(1)
 
 
 if __name__ == '__main__':
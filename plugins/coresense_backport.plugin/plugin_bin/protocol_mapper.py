@@ -1,4 +1,4 @@
-from waggle.protocol.v5.decoder import decode_frame
+from waggle.protocol.v5.decoder import decode_frame, spec_cache
 # ANL:waggle-license
 #  This file is part of the Waggle Platform.  Please see the file
 #  LICENSE.waggle.txt for the legal details of the copyright and software
@@ -62,10 +62,16 @@ table = {
 }
 
 
+# only sensors with at least one mapped parameter need to be decoded
+mapped_sensors = set(
+    sensor_id for sensor_id, (names, _, _) in spec_cache.items()
+    if any(table.get(name) is not None for name in names))
+
+
 def map_v1_to_v2(datagram_v1):
     sensorgrams = []
 
-    decoded_message = decode_frame(datagram_v1)
+    decoded_message = decode_frame(datagram_v1, sensors=mapped_sensors)
 
     for values in decoded_message.values():
         for key, value in values.items():
@@ -15,6 +15,7 @@ import cv2
 import numpy as np
 
 from waggle.pipeline import Plugin, ImagePipelineHandler
+from waggle.plugin.framebus import FrameBusReader, frame_bus_path
 from waggle.protocol.v5.encoder import encode_frame
 
 # Configuration of the pipeline
@@ -41,6 +42,7 @@ def get_default_configuration():
         'detection_interval': 300,  # every 5 mins
         'sampling_interval': -1,  # None, by default
         'detection_confidence': 0.3,  # least detection confidence
+        'frame_bus': False,  # read decoded frames from image_framebus
     }
     return conf
 
@@ -54,6 +56,9 @@ class CarPedDetector(Plugin):
         self.hrf = False
         self.config = self._get_config_table()
         self.input_handler = ImagePipelineHandler(routing_in=self.config['source'])
+        self.frame_reader = None
+        if self.config.get('frame_bus', False):
+            self.frame_reader = FrameBusReader(frame_bus_path(self.config['source']))
 
     def _get_config_table(self):
         config_file = '/wagglerw/waggle/image_car_ped_detector.conf'
@@ -101,8 +106,29 @@ class CarPedDetector(Plugin):
                 print('    x:%5d, y:%5d' % (x, y))
             print('Total: %s %d' % (detected_object, len(detected_objects[detected_object].keys())))
 
+    def _read_frame(self):
+        """ Returns (True, (headers, img, frame, bus_frame)). frame is the
+            encoded frame from the image pipeline, or None for a decoded frame
+            from the frame bus, which must be released once processed.
+        """
+        if self.frame_reader is not None:
+            return_code, bus_frame = self.frame_reader.read()
+            if return_code is not True:
+                return False, None
+            return True, (bus_frame.headers, bus_frame.image, None, bus_frame)
+
+        return_code, message = self.input_handler.read()
+        if return_code is not True:
+            return False, None
+        properties, frame = message
+        nparr_img = np.fromstring(frame, np.uint8)
+        img = cv2.imdecode(nparr_img, cv2.IMREAD_COLOR)
+        return True, (properties.headers, img, frame, None)
+
     def close(self):
         self.input_handler.close()
+        if self.frame_reader is not None:
+            self.frame_reader.close()
 
     def run(self):
         # Load models
@@ -153,61 +179,65 @@ class CarPedDetector(Plugin):
         while True:
             current_time = time.time()
             if current_time - self.config['last_updated'] > self.config['detection_interval']:
-                return_code, message = self.input_handler.read()
+                return_code, message = self._read_frame()
                 if return_code is True:
                     print('Received frame')
-                    properties, frame = message
-                    nparr_img = np.fromstring(frame, np.uint8)
-                    img = cv2.imdecode(nparr_img, cv2.IMREAD_COLOR)
-
-                    img_blob = cv2.dnn.blobFromImage(
-                        img,
-                        self.config['input_scale'],
-                        tuple(self.config['input_size']),
-                        tuple(self.config['input_mean_subtraction']),
-                        swapRB=True if 'RGB' in self.config['input_channel_order'].upper() else False,
-                        crop=False
-                    )
-
-                    detected_objects = self._detect(
-                        img_blob,
-                        cvNet,
-                        classes,
-                        confidence=confidence,
-                        img_rows=img.shape[0],
-                        img_cols=img.shape[1]
-                    )
-
-                    if self.hrf:
-                        self._print(detected_objects)
-                    else:
-                        count_car = 0
-                        count_person = 0
-
-                        if 'car' in detected_objects:
-                            count_car = len(detected_objects['car'].keys())
-                        if 'person' in detected_objects:
-                            count_person = len(detected_objects['person'].keys())
-                        packet = {
-                            0xA1: [count_car, count_person]
-                        }
-                        waggle_packet = encode_frame(packet)
-                        self.send(sensor='', data=waggle_packet)
-
-                        # Sampling the result
-                        if do_sampling:
-                            if current_time - self.config['last_sampled'] > self.config['sampling_interval']:
-                                result = {
-                                    'processing_software': os.path.basename(__file__),
-                                    'results': json.dumps(detected_objects)
-                                }
-                                properties.headers.update(result)
-                                self.input_handler.write(
-                                    ROUTING_KEY_EXPORT,
-                                    frame,
-                                    properties.headers
-                                )
-                                self.config['last_sampled'] = current_time
+                    headers, img, frame, bus_frame = message
+
+                    try:
+                        img_blob = cv2.dnn.blobFromImage(
+                            img,
+                            self.config['input_scale'],
+                            tuple(self.config['input_size']),
+                            tuple(self.config['input_mean_subtraction']),
+                            swapRB=True if 'RGB' in self.config['input_channel_order'].upper() else False,
+                            crop=False
+                        )
+
+                        detected_objects = self._detect(
+                            img_blob,
+                            cvNet,
+                            classes,
+                            confidence=confidence,
+                            img_rows=img.shape[0],
+                            img_cols=img.shape[1]
+                        )
+
+                        if self.hrf:
+                            self._print(detected_objects)
+                        else:
+                            count_car = 0
+                            count_person = 0
+
+                            if 'car' in detected_objects:
+                                count_car = len(detected_objects['car'].keys())
+                            if 'person' in detected_objects:
+                                count_person = len(detected_objects['person'].keys())
+                            packet = {
+                                0xA1: [count_car, count_person]
+                            }
+                            waggle_packet = encode_frame(packet)
+                            self.send(sensor='', data=waggle_packet)
+
+                            # Sampling the result
+                            if do_sampling:
+                                if current_time - self.config['last_sampled'] > self.config['sampling_interval']:
+                                    result = {
+                                        'processing_software': os.path.basename(__file__),
+                                        'results': json.dumps(detected_objects)
+                                    }
+                                    headers.update(result)
+                                    if frame is None:
+                                        frame = cv2.imencode('.jpg', img)[1].tobytes()
+                                    self.input_handler.write(
+                                        ROUTING_KEY_EXPORT,
+                                        frame,
+                                        headers
+                                    )
+                                    self.config['last_sampled'] = current_time
+                    finally:
+                        if bus_frame is not None:
+                            bus_frame.release()
                     self.config['last_updated'] = current_time
             else:
                 wait_time = current_time - self.config['last_updated']
@@ -15,7 +15,8 @@ import cv2
 import numpy as np
 
 from waggle.pipeline import Plugin, ImagePipelineHandler
-from waggle.protocol.v5.encoder import encode_frame_from_flat_string
+from waggle.plugin.framebus import FrameBusReader, frame_bus_path
+from waggle.protocol.v5.encoder import encode_frame_from_dict
 
 # Configuration of the pipeline
 # name of the pipeline
@@ -29,9 +30,11 @@ def get_default_configuration():
     conf = {
         'top': {
             'interval': 300,  # every 5 mins
+            'frame_bus': False,  # read decoded frames from image_framebus
         },
         'bottom': {
             'interval': 300,  # every 5 mins
+            'frame_bus': False,
         }
     }
     return conf
@@ -84,16 +87,21 @@ def get_histogram(image):
     return ret
 
 
-def print_plaintext(report, prefix='', delimiter='_', no_print_for_none=False):
+def flatten_report(report, prefix='', delimiter='_', no_print_for_none=False):
     for key, value in sorted(report.items()):
         if isinstance(value, dict):
-            yield from print_plaintext(value, prefix + key + delimiter, no_print_for_none=no_print_for_none)
+            yield from flatten_report(value, prefix + key + delimiter, no_print_for_none=no_print_for_none)
         else:
             if no_print_for_none:
                 if value is not None:
-                    yield '{}{} {}'.format(prefix, key, str(value))
+                    yield prefix + key, value
             else:
-                yield '{}{} {}'.format(prefix, key, str(value))
+                yield prefix + key, value
+
+
+def print_plaintext(report, prefix='', delimiter='_', no_print_for_none=False):
+    for key, value in flatten_report(report, prefix, delimiter, no_print_for_none):
+        yield '{} {}'.format(key, str(value))
 
 
 class ExampleImageProcessor(Plugin):
@@ -128,8 +136,6 @@ class ExampleImageProcessor(Plugin):
         @return: (processed frame, processed headers)
     """
     def do_process(self, frame, headers, device_char):
-        results = {'device': device_char}
-
         # Convert frame into JPEG image
         image_format = headers['image_format']
         if 'MJPG' in image_format:
@@ -138,16 +144,26 @@ class ExampleImageProcessor(Plugin):
         else:
             raise Exception('Unknown image format')
 
+        return self.do_process_image(img, device_char)
+
+    """
+        Processes a decoded frame
+        @params: img: ndarray
+                 device_char: String
+
+        @return: processed frame
+    """
+    def do_process_image(self, img, device_char):
+        results = {'device': device_char}
+
         # Obtain basic information of the image
         results['average_color'] = get_average_color(img)
         results['histogram'] = get_histogram(img)
 
         # Packetizing
         image = {'image': results}
-        results_flat_string = print_plaintext(image)
-        flat_string_data = '\n'.join(results_flat_string)
-        print(flat_string_data)
-        encoded_data = encode_frame_from_flat_string(flat_string_data)
+        print('\n'.join(print_plaintext(image)))
+        encoded_data = encode_frame_from_dict(dict(flatten_report(image)))
         return encoded_data
 
     """
@@ -165,12 +181,18 @@ class ExampleImageProcessor(Plugin):
                     handler = device_config['handler']
                     return_code, message = handler.read()
                     if return_code is True:
-                        properties, frame = message
                         print('Received frame')
-                        waggle_packet = self.do_process(
-                            frame,
-                            properties.headers,
-                            device_char=device[0])
+                        if device_config.get('frame_bus', False):
+                            with message as frame:
+                                waggle_packet = self.do_process_image(
+                                    frame.image,
+                                    device_char=device[0])
+                        else:
+                            properties, frame = message
+                            waggle_packet = self.do_process(
+                                frame,
+                                properties.headers,
+                                device_char=device[0])
                         self.send(sensor='frame', data=waggle_packet)
                         device_config['last_updated'] = current_time
                         self.config[device] = device_config
@@ -189,7 +211,10 @@ if __name__ == '__main__':
             device_config = config[device]
 
             # Set up a subscriber for the device
-            reader = ImagePipelineHandler(routing_in=device)
+            if device_config.get('frame_bus', False):
+                reader = FrameBusReader(frame_bus_path(device))
+            else:
+                reader = ImagePipelineHandler(routing_in=device)
             device_config['handler'] = reader
             device_config['last_updated'] = 0
             valid_config[device] = device_config
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# ANL:waggle-license
+#  This file is part of the Waggle Platform.  Please see the file
+#  LICENSE.waggle.txt for the legal details of the copyright and software
+#  license.  For more details on the Waggle project, visit:
+#           http://www.wa8.gl
+# ANL:waggle-license
+
+import json
+
+from waggle.pipeline import ImagePipelineHandler
+from waggle.plugin.framebus import FrameBusWriter, frame_bus_path
+
+
+def get_default_configuration():
+    conf = {
+        'bottom': {
+            'max_height': 1944,
+            'max_width': 2592,
+            'levels': 2,  # frames downscaled by 2 and 4
+            'slots': 4,
+        },
+        'top': {
+            'max_height': 1944,
+            'max_width': 2592,
+            'levels': 2,
+            'slots': 4,
+        },
+    }
+    return conf
+
+
+def load_configuration():
+    config_file = '/wagglerw/waggle/image_framebus.conf'
+    config_data = None
+    try:
+        with open(config_file) as config:
+            config_data = json.loads(config.read())
+    except Exception:
+        config_data = get_default_configuration()
+        with open(config_file, 'w') as config:
+            config.write(json.dumps(config_data, sort_keys=True, indent=4))
+    return config_data
+
+
+class FrameBusProducer(object):
+    """
+        Decodes each frame of the configured devices from the image pipeline
+        once and publishes it to the device's frame bus.
+    """
+    def __init__(self, config):
+        self.devices = {}
+        for device, device_config in config.items():
+            handler = ImagePipelineHandler(routing_in=device)
+            writer = FrameBusWriter(
+                frame_bus_path(device),
+                device_config['max_height'],
+                device_config['max_width'],
+                slots=device_config.get('slots', 4),
+                levels=device_config.get('levels', 0))
+            self.devices[device] = (handler, writer)
+
+    def close(self):
+        for handler, writer in self.devices.values():
+            handler.close()
+            writer.close()
+
+    def run(self):
+        while True:
+            for device, (handler, writer) in self.devices.items():
+                return_code, message = handler.read(timeout=1)
+                if return_code is not True:
+                    continue
+
+                properties, frame = message
+                headers = properties.headers or {}
+                if 'MJPG' not in headers.get('image_format', 'MJPG'):
+                    print('Unknown image format from %s' % (device,))
+                    continue
+
+                sequence = writer.publish_jpeg(frame, headers=headers)
+                if sequence is None:
+                    print('All frame slots of %s are in use, frame dropped' % (device,))
+
+
+if __name__ == '__main__':
+    producer = None
+    try:
+        producer = FrameBusProducer(load_configuration())
+        producer.run()
+    except (KeyboardInterrupt, Exception) as ex:
+        print(str(ex))
+    finally:
+        if producer is not None:
+            producer.close()
@@ -43,7 +43,86 @@ crc8_table = [
 
 
 def crc8(data, crc=0):
-    """Computes CRC of data using CRC8 with 0x8c polynomial."""
+    """
+    Computes CRC of data using CRC8 with 0x8c polynomial. Data may be any
+    bytes-like object, including a memoryview into a larger buffer.
+    """
+    if isinstance(data, memoryview) and data.format != 'B':
+        data = data.cast('B')
+
+    table = crc8_table
+
     for value in data:
-        crc = crc8_table[crc ^ value]
+        crc = table[crc ^ value]
+
     return crc
+
+
+class Crc8:
+    """
+    Incrementally computes CRC8 of data which arrives in pieces, for example
+    from a serial port.
+
+    >>> c = Crc8()
+    >>> c.update(b'\\x01\\x02')
+    >>> c.update(b'\\x03')
+    >>> c.crc
+    216
+    """
+
+    def __init__(self, data=b'', crc=0):
+        self.crc = crc
+        self.update(data)
+
+    def update(self, data):
+        self.crc = crc8(data, self.crc)
+
+    def reset(self, crc=0):
+        self.crc = crc
+
+    def copy(self):
+        return Crc8(crc=self.crc)
+
+    def digest(self):
+        return bytes([self.crc])
+
+
+def crc8_batch(buffers, crc=0):
+    """
+    Computes CRC8 of each buffer in buffers in a single vectorized pass and
+    returns the results as a numpy uint8 array. This requires numpy and is
+    intended for checking many small buffers, such as a batch of datagram
+    bodies, at once.
+
+    Buffers are right aligned in one zero padded array. Since the table maps 0
+    to 0, leading padding leaves a zero CRC unchanged, so every buffer can be
+    stepped one byte column at a time. The cost is proportional to the number
+    of buffers times the longest buffer.
+    """
+    import numpy as np
+
+    buffers = [memoryview(b).cast('B') for b in buffers]
+    lengths = np.fromiter((len(b) for b in buffers), dtype=np.intp, count=len(buffers))
+    width = int(lengths.max()) if len(buffers) > 0 else 0
+
+    # scatter all buffers into a zero padded array with one copy
+    padding = width - lengths
+    data = np.zeros((len(buffers), width), dtype=np.uint8)
+    data[np.arange(width) >= padding[:, None]] = np.frombuffer(b''.join(buffers), dtype=np.uint8)
+
+    # an initial crc is folded into the first byte of each buffer
+    if crc != 0:
+        nonempty = np.flatnonzero(lengths)
+        data[nonempty, padding[nonempty]] ^= crc
+
+    # column major layout so each step reads one contiguous row
+    data = np.ascontiguousarray(data.T)
+
+    table = np.array(crc8_table, dtype=np.uint8)
+    result = np.zeros(len(buffers), dtype=np.uint8)
+
+    for row in data:
+        result = np.take(table, result ^ row)
+
+    result[lengths == 0] = crc
+    return result
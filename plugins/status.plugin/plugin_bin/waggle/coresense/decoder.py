@@ -7,7 +7,7 @@
 from binascii import unhexlify
 from format import unpack
 from packet import decode_packet
-import yaml
+from waggle.yamlcache import load_yaml
 import logging
 
 logger = logging.getLogger('coresense.decoder')
@@ -26,7 +26,7 @@ def htu21d_humidty(x):
 
 
 with open('spec.yml') as f:
-    sensors = yaml.load(f.read())
+    sensors = load_yaml(f.read())
 
 
 formatnames = {
@@ -4,7 +4,7 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
-from waggle.transport import TimedTransport
+from waggle.coresense.transport import FrameReader
 from waggle.coresense.utils import decode_frame
 from binascii import hexlify
 import sys
@@ -12,25 +12,26 @@ import sys
 
 class CoresenseReader(object):
 
-    def __init__(self, device):
-        self.transport = TimedTransport(device,
-                                        baudrate=115200,
-                                        device_timeout=60,
-                                        packet_timeout=5)
+    def __init__(self, device, device_timeout=60):
+        import serial
 
-    def __iter__(self):
-        for packet in self.transport:
-            try:
-                start = packet.index(0xAA)
-                end = packet.rindex(0x55) + 1
+        self.port = serial.Serial(device, baudrate=115200, timeout=5)
+        self.reader = FrameReader(self.port)
+        self.device_timeout = device_timeout
 
-                assert start < end
+    def __iter__(self):
+        while True:
+            frame = self.reader.read_frame(timeout=self.device_timeout)
 
-                if start != 0 and end != len(packet):
-                    print('WARN unexpected packet padding: {}'.format(hexlify(packet)), file=sys.stderr)
+            if frame is None:
+                raise TimeoutError('No frames received from device.')
 
-                data = decode_frame(packet[start:end])
+            try:
+                data = decode_frame(frame)
             except Exception as exc:
-                print('ERROR could not decode packet: {} <{}>'.format(hexlify(packet), exc), file=sys.stderr)
+                print('ERROR could not decode packet: {} <{}>'.format(hexlify(frame), exc), file=sys.stderr)
             else:
                 yield data
+
+    def close(self):
+        self.port.close()
@@ -0,0 +1,199 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import asyncio
+import time
+import unittest
+import serial
+from waggle.coresense.testing import FakeDevice
+from waggle.coresense.transport import FrameParser, FrameReader, StreamFrameReader, pack_frame
+from waggle.plugin.runtime import open_serial
+
+request = pack_frame(b'\x80\x05\x01\x01')
+frames = [
+    pack_frame(b'\x00\x01\x02\x12\x34'),
+    pack_frame(b'\x01\x02\x02\xAA\x55'),
+    pack_frame(b'\x82\x03\x01\x07'),
+]
+
+
+class FrameParserTestCase(unittest.TestCase):
+
+    def test_whole(self):
+        parser = FrameParser()
+        self.assertEqual(parser.feed(b''.join(frames)), frames)
+
+    def test_bytewise(self):
+        parser = FrameParser()
+        results = []
+
+        for b in b''.join(frames):
+            results.extend(parser.feed(bytes([b])))
+
+        self.assertEqual(results, frames)
+
+    def test_noise(self):
+        parser = FrameParser()
+        data = b'\x00\x55\x12' + frames[0] + b'\x99' + frames[1] + b'\xAA' + frames[2]
+        self.assertEqual(parser.feed(data), frames)
+
+    def test_empty_frame(self):
+        parser = FrameParser()
+        self.assertEqual(parser.feed(bytes([0xAA, 0, 0, 0, 0x55])), [bytes([0xAA, 0, 0, 0, 0x55])])
+
+    def test_bad_crc(self):
+        parser = FrameParser()
+        bad = bytearray(frames[0])
+        bad[-2] ^= 0xFF
+
+        self.assertEqual(parser.feed(bytes(bad) + frames[1]), frames[1:2])
+        self.assertEqual(parser.errors, 1)
+
+    def test_resync(self):
+        parser = FrameParser()
+
+        # a stray start byte claims a long frame which swallows a real frame.
+        # the real frame is found again once the bad frame fails its check.
+        data = b'\xAA\x02\x05' + frames[0]
+        self.assertEqual(parser.feed(data), frames[:1])
+        self.assertEqual(parser.errors, 1)
+
+
+class FrameReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ports = []
+
+    def tearDown(self):
+        for port in self.ports:
+            port.close()
+
+    def open_port(self, device):
+        port = serial.Serial(device.port, baudrate=115200, timeout=180)
+        self.ports.append(port)
+        return port
+
+    def test_read_response(self):
+        def handler(request):
+            # response is split at odd places and trickles in
+            data = b'\x00\x13' + b''.join(frames)
+
+            for i in range(0, len(data), 7):
+                yield data[i:i + 7]
+                time.sleep(0.01)
+
+        with FakeDevice(handler) as device:
+            port = self.open_port(device)
+            reader = FrameReader(port)
+
+            port.write(request)
+            self.assertEqual(reader.read_response(timeout=5), b''.join(frames))
+            self.assertEqual(device.requests, [request])
+
+    def test_latency(self):
+        def handler(request):
+            yield frames[2]
+
+        with FakeDevice(handler) as device:
+            port = self.open_port(device)
+            reader = FrameReader(port)
+
+            # the response is returned as soon as it arrives
+            start = time.monotonic()
+            port.write(request)
+            self.assertEqual(reader.read_response(timeout=5), frames[2])
+            self.assertLess(time.monotonic() - start, 0.2)
+
+    def test_bad_crc(self):
+        def handler(request):
+            bad = bytearray(frames[1])
+            bad[-2] ^= 0xFF
+            yield frames[0] + bytes(bad)
+
+        with FakeDevice(handler) as device:
+            port = self.open_port(device)
+            reader = FrameReader(port)
+
+            start = time.monotonic()
+            port.write(request)
+            self.assertIsNone(reader.read_response(timeout=5))
+            self.assertLess(time.monotonic() - start, 1)
+
+    def test_timeout(self):
+        def handler(request):
+            yield frames[0]
+
+        with FakeDevice(handler) as device:
+            port = self.open_port(device)
+            reader = FrameReader(port)
+
+            # frames received before the timeout are returned
+            port.write(request)
+            self.assertEqual(reader.read_response(timeout=0.2), frames[0])
+            self.assertIsNone(reader.read_frame(timeout=0.1))
+
+    def test_read_frame(self):
+        with FakeDevice() as device:
+            port = self.open_port(device)
+            reader = FrameReader(port)
+
+            device.write(b''.join(frames))
+
+            for frame in frames:
+                self.assertEqual(reader.read_frame(timeout=5), frame)
+
+
+class StreamFrameReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def request(self, handler, timeout=5):
+        async def talk(device):
+            stream = await open_serial(device.port, 115200)
+
+            try:
+                stream.write(request)
+                await stream.drain()
+                return await StreamFrameReader(stream).read_response(timeout)
+            finally:
+                stream.close()
+
+        with FakeDevice(handler) as device:
+            return self.loop.run_until_complete(talk(device)), device.requests
+
+    def test_read_response(self):
+        def handler(request):
+            data = b'\x00\x13' + b''.join(frames)
+
+            for i in range(0, len(data), 7):
+                yield data[i:i + 7]
+                time.sleep(0.01)
+
+        self.assertEqual(self.request(handler), (b''.join(frames), [request]))
+
+    def test_bad_crc(self):
+        def handler(request):
+            bad = bytearray(frames[1])
+            bad[-2] ^= 0xFF
+            yield frames[0] + bytes(bad)
+
+        self.assertIsNone(self.request(handler)[0])
+
+    def test_timeout(self):
+        def handler(request):
+            yield frames[0]
+
+        self.assertEqual(self.request(handler, timeout=0.2)[0], frames[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides a fake coresense board for tests.
+
+FakeDevice listens on a pseudo terminal, which can be opened as a serial port
+by name. Each request frame written to the port is passed to handler, which
+returns or yields chunks of bytes to write back. A generator handler can
+sleep between chunks to simulate a slow device.
+
+Example:
+
+```
+def handler(request):
+    yield pack_frame(b'\\x80\\x01\\x02\\x03\\x04')
+
+with FakeDevice(handler) as device:
+    port = serial.Serial(device.port, baudrate=115200)
+    ...
+```
+"""
+import os
+import select
+import threading
+import tty
+from waggle.coresense.transport import FrameParser
+
+
+class FakeDevice:
+
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.parser = FrameParser()
+        self.requests = []
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        os.close(self.master)
+        os.close(self.slave)
+
+    def write(self, data):
+        os.write(self.master, data)
+
+    def run(self):
+        while not self.stopped.is_set():
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+
+            if not ready:
+                continue
+
+            for request in self.parser.feed(os.read(self.master, 4096)):
+                self.requests.append(request)
+
+                if self.handler is None:
+                    continue
+
+                for chunk in self.handler(request):
+                    self.write(chunk)
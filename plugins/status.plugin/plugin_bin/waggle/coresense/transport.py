@@ -0,0 +1,276 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module reads coresense frames from a serial port.
+
+A frame is a start byte, a protocol byte, a length byte, length bytes of
+body, a CRC8 of the body and an end byte:
+
+```
+AA PP LL [body] CC 55
+```
+
+FrameParser splits a byte stream into frames incrementally. Bytes are copied
+into a fixed frame buffer and the CRC is updated as the body arrives, so a
+frame is checked as soon as its last byte is received. If a frame has a bad
+CRC or end byte, its start byte is treated as noise and the bytes following
+it are searched for the next frame.
+
+FrameReader waits on the port with select, so it wakes up as soon as data
+arrives instead of polling, and only reads what is available.
+StreamFrameReader does the same with coroutines over an async stream, such as
+a waggle.plugin.runtime.SerialStream, so a plugin can run under the runtime.
+
+Example:
+
+```
+port = serial.Serial('/dev/waggle_coresense', baudrate=115200, timeout=180)
+reader = FrameReader(port)
+
+port.write(request)
+packets = reader.read_response(timeout=180)
+```
+"""
+import asyncio
+import collections
+import select
+import time
+from waggle.checksum import crc8
+
+START_BYTE = 0xAA
+END_BYTE = 0x55
+HEADER_SIZE = 3
+FOOTER_SIZE = 2
+MAX_FRAME_SIZE = HEADER_SIZE + 255 + FOOTER_SIZE
+
+# the sequence byte is the first byte of the body. its high bit marks the
+# last frame of a response.
+SEQUENCE_LAST = 0x80
+
+SEARCH = 0
+HEADER = 1
+BODY = 2
+FOOTER = 3
+
+
+def pack_frame(body, protocol=0x02):
+    """Packs body into a frame."""
+    return bytes([START_BYTE, protocol, len(body)]) + bytes(body) + bytes([crc8(body), END_BYTE])
+
+
+def is_last_frame(frame):
+    return len(frame) > HEADER_SIZE + FOOTER_SIZE and frame[HEADER_SIZE] & SEQUENCE_LAST == SEQUENCE_LAST
+
+
+class FrameParser:
+
+    def __init__(self):
+        self.buffer = bytearray(MAX_FRAME_SIZE)
+        self.size = 0
+        self.length = 0
+        self.crc = 0
+        self.state = SEARCH
+        self.frames_received = 0
+        self.errors = 0
+
+    def reset(self):
+        """Drops any partially received frame."""
+        self.size = 0
+        self.state = SEARCH
+
+    def feed(self, data):
+        """Consumes data and returns a list of the frames it completed."""
+        frames = []
+        chunks = [bytes(data)]
+
+        while chunks:
+            data = chunks.pop()
+            pos = 0
+
+            while pos < len(data):
+                if self.state == SEARCH:
+                    pos = data.find(START_BYTE, pos)
+
+                    if pos < 0:
+                        break
+
+                    self.buffer[0] = START_BYTE
+                    self.size = 1
+                    self.state = HEADER
+                    pos += 1
+                elif self.state == HEADER:
+                    self.buffer[self.size] = data[pos]
+                    self.size += 1
+                    pos += 1
+
+                    if self.size == HEADER_SIZE:
+                        self.length = self.buffer[2]
+                        self.crc = 0
+                        self.state = BODY if self.length > 0 else FOOTER
+                elif self.state == BODY:
+                    n = min(HEADER_SIZE + self.length - self.size, len(data) - pos)
+                    chunk = data[pos:pos + n]
+                    self.buffer[self.size:self.size + n] = chunk
+                    self.crc = crc8(chunk, self.crc)
+                    self.size += n
+                    pos += n
+
+                    if self.size == HEADER_SIZE + self.length:
+                        self.state = FOOTER
+                else:
+                    self.buffer[self.size] = data[pos]
+                    self.size += 1
+                    pos += 1
+
+                    if self.size < HEADER_SIZE + self.length + FOOTER_SIZE:
+                        continue
+
+                    self.state = SEARCH
+
+                    if self.buffer[self.size - 2] == self.crc and self.buffer[self.size - 1] == END_BYTE:
+                        frames.append(bytes(self.buffer[:self.size]))
+                        self.frames_received += 1
+                        continue
+
+                    # search the rest of the bad frame before the rest of data
+                    self.errors += 1
+                    chunks.append(data[pos:])
+                    chunks.append(bytes(self.buffer[1:self.size]))
+                    break
+
+        return frames
+
+
+class FrameReader:
+
+    def __init__(self, port):
+        self.port = port
+        self.parser = FrameParser()
+        self.frames = collections.deque()
+
+    def poll(self, timeout):
+        """
+        Waits up to timeout seconds for data from the port and parses
+        whatever is available.
+        """
+        ready, _, _ = select.select([self.port], [], [], timeout)
+
+        if ready:
+            data = self.port.read(self.port.in_waiting or 1)
+            self.frames.extend(self.parser.feed(data))
+
+    def read_frame(self, timeout=None):
+        """
+        Returns the next valid frame or None if none was received within
+        timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while not self.frames:
+            if deadline is None:
+                self.poll(None)
+                continue
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                return None
+
+            self.poll(remaining)
+
+        return self.frames.popleft()
+
+    def read_response(self, timeout=180):
+        """
+        Reads frames up to and including the last frame of a response and
+        returns them concatenated. Returns None as soon as a bad frame is
+        received and the frames received so far if timeout seconds pass
+        before the last frame.
+        """
+        deadline = time.monotonic() + timeout
+        errors = self.parser.errors
+        packets = bytearray()
+
+        while True:
+            if self.parser.errors != errors:
+                return None
+
+            while self.frames:
+                frame = self.frames.popleft()
+                packets.extend(frame)
+
+                if is_last_frame(frame):
+                    return packets
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                return packets
+
+            self.poll(remaining)
+
+
+class StreamFrameReader:
+    """
+    Reads frames from an async stream with read(n), like FrameReader does from
+    a serial port. EOFError is raised when the stream ends.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.parser = FrameParser()
+        self.frames = collections.deque()
+
+    async def poll(self, timeout):
+        # asyncio.wait, unlike wait_for, never swallows a cancellation which
+        # arrives just as the read completes.
+        read = asyncio.ensure_future(self.stream.read(MAX_FRAME_SIZE))
+
+        try:
+            done, _ = await asyncio.wait([read], timeout=timeout)
+        except asyncio.CancelledError:
+            read.cancel()
+            raise
+
+        if not done:
+            read.cancel()
+            return
+
+        data = read.result()
+
+        if not data:
+            raise EOFError('Stream closed.')
+
+        self.frames.extend(self.parser.feed(data))
+
+    async def read_response(self, timeout=180):
+        """
+        Reads frames up to and including the last frame of a response, with
+        the same results as FrameReader.read_response.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        errors = self.parser.errors
+        packets = bytearray()
+
+        while True:
+            if self.parser.errors != errors:
+                return None
+
+            while self.frames:
+                frame = self.frames.popleft()
+                packets.extend(frame)
+
+                if is_last_frame(frame):
+                    return packets
+
+            remaining = deadline - loop.time()
+
+            if remaining <= 0:
+                return packets
+
+            await self.poll(remaining)
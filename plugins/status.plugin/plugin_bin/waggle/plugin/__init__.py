@@ -17,6 +17,7 @@ Publishing:
 * plugin.add_measurement(measument)
 * plugin.publish_measurements()
 * plugin.clear_measurements()
+* plugin.flush()
 
 Example:
 
@@ -36,16 +37,23 @@ plugin.publish_measurements()
 ```
 
 """
+import argparse
+import atexit
+import itertools
 import json
 import configparser
 import logging
+import operator
 import os
 import sys
+import threading
 import pika
 import pika.credentials
 import ssl
 import waggle.protocol
 from base64 import b64encode
+from waggle.plugin.publisher import Publisher
+from waggle.plugin.spool import Spool
 
 
 def load_package_configs(*filenames):
@@ -189,6 +197,67 @@ class Credentials:
         self.keyfile = kwargs.get('key')
 
 
+# maximum time spent at exit waiting for queued messages to be confirmed
+PUBLISHER_EXIT_TIMEOUT = 30
+
+# on nodes, outgoing messages are spooled to disk under here
+SPOOL_ROOT = '/wagglerw/waggle/spool'
+
+publishers = {}
+publishers_lock = threading.Lock()
+
+
+def default_spool_dir(plugin_id, plugin_instance):
+    if not os.path.isdir(os.path.dirname(os.path.dirname(SPOOL_ROOT))):
+        return None
+    return os.path.join(SPOOL_ROOT, 'plugin-{}-{}'.format(plugin_id, plugin_instance))
+
+
+def open_spool(spool_dir):
+    try:
+        return Spool(spool_dir)
+    except OSError:
+        logging.getLogger('pipeline.Plugin').exception(
+            'Failed to open spool %s. Queueing messages in memory.', spool_dir)
+        return None
+
+
+def get_publisher(credentials, spool_dir=None, max_batch_size=0):
+    """
+    Returns the process wide publisher for credentials. All plugins in a
+    process with the same broker and user share one publisher and connection.
+    If spool_dir is given, the publisher created by the first call queues
+    messages in a spool there.
+
+    Each waggle message is published as its own AMQP message unless
+    max_batch_size is set. In that case, queued messages are coalesced into
+    AMQP messages of up to max_batch_size bytes, which consumers must read
+    with waggle.protocol.unpack_messages rather than unpack_message.
+    """
+    key = (credentials.host, credentials.port, credentials.username)
+
+    with publishers_lock:
+        if key not in publishers:
+            publishers[key] = Publisher(
+                get_connection_parameters(credentials),
+                exchange='messages',
+                properties=pika.BasicProperties(
+                    delivery_mode=2,
+                    user_id=credentials.username),
+                max_batch_size=max_batch_size,
+                queue=open_spool(spool_dir) if spool_dir else None)
+
+        return publishers[key]
+
+
+@atexit.register
+def close_publishers():
+    with publishers_lock:
+        for publisher in publishers.values():
+            publisher.close(timeout=PUBLISHER_EXIT_TIMEOUT)
+        publishers.clear()
+
+
 class PluginBase:
 
     def load_config(self, **kwargs):
@@ -213,24 +282,42 @@ class Plugin(PluginBase):
 
         self.queue = 'to-{}'.format(self.credentials.username)
 
-        connection_parameters = get_connection_parameters(self.credentials)
-        self.connection = pika.BlockingConnection(connection_parameters)
-        self.channel = self.connection.channel()
+        self.publisher = kwargs.get('publisher')
+
+        if self.publisher is None:
+            spool_dir = kwargs.get('spool_dir', default_spool_dir(self.plugin_id, self.plugin_instance))
+            self.publisher = get_publisher(self.credentials, spool_dir, kwargs.get('max_batch_size', 0))
+
+        # compressing datagrams saves uplink bytes, but requires consumers
+        # which understand compressed datagrams.
+        self.compress = kwargs.get('compress', False)
+
+        # the consumer connection is only opened if messages are requested
+        self.connection = None
+        self.channel = None
 
         self.measurements = []
 
     def publish(self, body):
         self.logger.debug('Publishing message data %s.', body)
+        self.publisher.publish(body)
 
-        self.channel.basic_publish(
-            exchange='messages',
-            routing_key='',
-            properties=pika.BasicProperties(
-                delivery_mode=2,
-                user_id=self.credentials.username),
-            body=body)
+    def flush(self, timeout=None):
+        """
+        Waits until all published messages have been confirmed by the broker.
+        Returns False if this did not happen within timeout seconds.
+        """
+        return self.publisher.flush(timeout)
+
+    def get_publisher_metrics(self):
+        return self.publisher.get_metrics()
 
     def get_waiting_messages(self):
+        if self.channel is None:
+            connection_parameters = get_connection_parameters(self.credentials)
+            self.connection = pika.BlockingConnection(connection_parameters)
+            self.channel = self.connection.channel()
+
         self.channel.queue_declare(queue=self.queue, durable=True)
 
         while True:
@@ -252,17 +339,22 @@ class Plugin(PluginBase):
         self.measurements.clear()
 
     def publish_measurements(self):
+        datagram = {
+            'plugin_id': self.plugin_id,
+            'plugin_major_version': self.plugin_version[0],
+            'plugin_minor_version': self.plugin_version[1],
+            'plugin_patch_version': self.plugin_version[2],
+            'plugin_instance': self.plugin_instance,
+            'body': b''.join(self.measurements)
+        }
+
+        if self.compress:
+            datagram = waggle.protocol.compress_datagram(datagram)
+
         message = waggle.protocol.pack_message({
             'sender_id': self.credentials.node_id,
             'sender_sub_id': self.credentials.sub_id,
-            'body': waggle.protocol.pack_datagram({
-                'plugin_id': self.plugin_id,
-                'plugin_major_version': self.plugin_version[0],
-                'plugin_minor_version': self.plugin_version[1],
-                'plugin_patch_version': self.plugin_version[2],
-                'plugin_instance': self.plugin_instance,
-                'body': b''.join(self.measurements)
-            })
+            'body': waggle.protocol.pack_datagram(datagram)
         })
 
         self.publish(message)
@@ -414,6 +506,13 @@ def measurements_in_message_data(message_data):
                 yield message, datagram, sensorgram
 
 
+def measurements_in_message_stream(reader):
+    for message in waggle.protocol.read_messages(reader):
+        for datagram in waggle.protocol.unpack_datagrams(message['body']):
+            for sensorgram in waggle.protocol.unpack_sensorgrams(datagram['body']):
+                yield message, datagram, sensorgram
+
+
 def encode_bytes(b):
     return b64encode(b).decode()
 
@@ -426,17 +525,215 @@ def stringify(x):
     return str(x)
 
 
-def start_processing_measurements(handler, reader=sys.stdin.buffer, writer=sys.stdout):
-    results = []
+class BatchHandler:
+    """
+    Wraps a function which processes a list of (message, datagram, sensorgram)
+    measurements at once and returns a list of results for each measurement.
+    The processing functions pass it up to batch_size measurements at a time.
+    It can still be called like a handler, one measurement at a time.
+
+    If columns is true, the function instead returns one result for each
+    measurement, as a dict mapping each result field to a list of its values.
+    processed_results then adds the timestamp and stringifies the values a
+    column at a time and builds each result dict with a single zip.
+    """
+
+    def __init__(self, func, batch_size=4096, columns=False):
+        self.func = func
+        self.batch_size = batch_size
+        self.columns = columns
+
+    def __call__(self, message, datagram, sensorgram):
+        results = self.func([(message, datagram, sensorgram)])
+
+        if self.columns:
+            return iter(column_rows(results))
+
+        return iter(results[0])
+
+    def batches(self, measurements):
+        """Yields each batch of measurements with the results of func for it."""
+        measurements = iter(measurements)
+
+        while True:
+            batch = list(itertools.islice(measurements, self.batch_size))
+
+            if not batch:
+                break
+
+            yield batch, self.func(batch)
+
+    def process(self, measurements):
+        for batch, batch_results in self.batches(measurements):
+            if self.columns:
+                batch_results = ([r] for r in column_rows(batch_results))
+
+            for (message, datagram, sensorgram), results in zip(batch, batch_results):
+                for r in results:
+                    yield message, sensorgram, r
+
+
+row_builders = {}
 
-    for message, datagram, sensorgram in measurements_in_message_data(reader.read()):
+
+def row_builder(names):
+    """
+    Returns a function taking a value for each of names and returning a dict
+    of them. It builds the dict from a literal, which is several times faster
+    than dict(zip(names, values)).
+    """
+    try:
+        return row_builders[names]
+    except KeyError:
+        pass
+
+    if all(isinstance(name, str) for name in names):
+        args = ', '.join('_{}'.format(i) for i in range(len(names)))
+        items = ', '.join('{!r}: _{}'.format(name, i) for i, name in enumerate(names))
+        builder = eval('lambda {}: {{{}}}'.format(args, items))
+    else:
+        def builder(*values):
+            return dict(zip(names, values))
+
+    row_builders[names] = builder
+    return builder
+
+
+def column_rows(columns):
+    """Returns a list of dicts from a dict of equal length column lists."""
+    if not columns:
+        return []
+
+    return list(map(row_builder(tuple(columns)), *columns.values()))
+
+
+def field_column(items, name):
+    """
+    Returns a list of the name field of each record or dict in items. Lists of
+    records of one type are read by attribute, which is much faster.
+    """
+    types = set(map(type, items))
+
+    if len(types) == 1 and issubclass(next(iter(types)), waggle.protocol.Record):
+        if name not in next(iter(types)).field_set:
+            raise KeyError(name)
+
+        return list(map(operator.attrgetter(name), items))
+
+    return list(map(operator.itemgetter(name), items))
+
+
+def stringify_column(values):
+    if any(issubclass(t, (bytes, list)) for t in set(map(type, values))):
+        return [stringify(x) for x in values]
+    return list(map(str, values))
+
+
+def handler_results(handler, measurements):
+    """Yields (message, sensorgram, result) for each result of handler over measurements."""
+    if isinstance(handler, BatchHandler):
+        yield from handler.process(measurements)
+        return
+
+    for message, datagram, sensorgram in measurements:
         for r in handler(message, datagram, sensorgram):
-            r['timestamp'] = sensorgram['timestamp']
-            r['value_raw'] = stringify(r['value_raw'])
-            r['value_hrf'] = stringify(r['value_hrf'])
-            results.append(r)
+            yield message, sensorgram, r
+
+
+def processed_results(handler, measurements):
+    if isinstance(handler, BatchHandler) and handler.columns:
+        yield from processed_column_results(handler, measurements)
+        return
+
+    for message, sensorgram, r in handler_results(handler, measurements):
+        r['timestamp'] = sensorgram['timestamp']
+        r['value_raw'] = stringify(r['value_raw'])
+        r['value_hrf'] = stringify(r['value_hrf'])
+        yield r
+
+
+def processed_column_results(handler, measurements):
+    for batch, columns in handler.batches(measurements):
+        columns = dict(columns)
+        columns['timestamp'] = field_column([sensorgram for _, _, sensorgram in batch], 'timestamp')
+        columns['value_raw'] = stringify_column(columns['value_raw'])
+        columns['value_hrf'] = stringify_column(columns['value_hrf'])
+        yield from column_rows(columns)
+
+
+def processed_measurements(handler, reader):
+    return processed_results(handler, measurements_in_message_stream(reader))
+
+
+def parse_processing_args(args):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--columnar')
+    return parser.parse_known_args(args)[0]
+
+
+def start_processing_measurements(handler, reader=sys.stdin.buffer, writer=sys.stdout, ndjson=None, processes=None,
+                                  columnar=None):
+    """
+    Runs handler over every measurement read from reader and writes the results
+    to writer as they are produced. By default, the output is a single JSON
+    array. If ndjson is true, or None and --ndjson was passed on the command
+    line, each result is written as its own line of JSON instead.
+
+    If processes, or --processes on the command line, is more than 1, the
+    input is decoded and converted by that many processes. The output is the
+    same. See waggle.plugin.parallel.
+
+    If columnar, or --columnar on the command line, is a path, the results are
+    appended to the column store at that path instead of written to writer.
+    See waggle.plugin.columnar.
+
+    If --worker was passed on the command line, handler is run as a long
+    running worker over a stream of batches instead. See waggle.plugin.worker.
+    """
+    if '--worker' in sys.argv[1:]:
+        from waggle.plugin.worker import run_worker
+        run_worker(handler)
+        return
+
+    if ndjson is None:
+        ndjson = '--ndjson' in sys.argv[1:]
+
+    args = parse_processing_args(sys.argv[1:])
+
+    if processes is None:
+        processes = args.processes
+
+    if columnar is None:
+        columnar = args.columnar
+
+    if columnar is not None:
+        from waggle.plugin.columnar import write_columns
+        write_columns(handler, reader, columnar, processes)
+        return
+
+    if processes > 1:
+        from waggle.plugin.parallel import processed_json
+        results = processed_json(handler, reader, processes)
+    else:
+        encoder = json.JSONEncoder(separators=(',', ':'))
+        results = map(encoder.encode, processed_measurements(handler, reader))
+
+    if ndjson:
+        for r in results:
+            writer.write(r)
+            writer.write('\n')
+        return
+
+    # produces the same output as json.dump(results) without holding results
+    writer.write('[')
+
+    for i, r in enumerate(results):
+        if i > 0:
+            writer.write(',')
+        writer.write(r)
 
-    json.dump(results, writer, separators=(',', ':'))
+    writer.write(']')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import json
+import os
+import tempfile
+import time
+from io import BytesIO, StringIO
+import numpy as np
+import waggle.plugin
+import waggle.protocol
+from waggle.plugin.columnar import ColumnReader
+
+# Compares going from a message dump to a per node mean of one parameter
+# through the JSON output against the columnar output.
+
+NUM_MESSAGES = 4000
+SENSORGRAMS_PER_MESSAGE = 50
+
+
+def handler(message, datagram, sensorgram):
+    yield {
+        'subsystem': 'metsense',
+        'sensor': sensorgram['sensor_id'],
+        'parameter': sensorgram['parameter_id'],
+        'value_raw': sensorgram['value'],
+        'value_hrf': sensorgram['value'] / 100,
+    }
+
+
+def make_data():
+    return b''.join(waggle.protocol.pack_message({
+        'sender_id': '{:016x}'.format(i % 20),
+        'body': waggle.protocol.pack_datagram({
+            'body': waggle.protocol.pack_sensorgrams([
+                {'sensor_id': j % 10, 'parameter_id': j // 10, 'value': i + j}
+                for j in range(SENSORGRAMS_PER_MESSAGE)
+            ]),
+        }),
+    }) for i in range(NUM_MESSAGES))
+
+
+def run_json(data):
+    writer = StringIO()
+    waggle.plugin.start_processing_measurements(handler, BytesIO(data), writer, ndjson=False)
+
+    totals = {}
+
+    # the JSON output has no node, so this only groups by sensor
+    for r in json.loads(writer.getvalue()):
+        if r['parameter'] == '0':
+            total = totals.setdefault(r['sensor'], [0.0, 0])
+            total[0] += float(r['value_hrf'])
+            total[1] += 1
+
+    return len(writer.getvalue())
+
+
+def run_columnar(data, path):
+    waggle.plugin.start_processing_measurements(handler, BytesIO(data), ndjson=False, columnar=path)
+
+    columns = ColumnReader(path)
+    parameter = columns['parameter'] == list(columns.dictionary('parameter')).index('0')
+    nodes = columns['node_id'][parameter]
+    values = columns['value_hrf'][parameter]
+    means = np.bincount(nodes, values) / np.bincount(nodes)
+    assert len(means) == 20
+
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    data = make_data()
+
+    json_time, json_size = timed(run_json, data)
+
+    with tempfile.TemporaryDirectory() as dir:
+        columnar_time, columnar_size = timed(run_columnar, data, os.path.join(dir, 'columns'))
+
+        start = time.perf_counter()
+        ColumnReader(os.path.join(dir, 'columns'))['value_hrf'].mean()
+        load_time = time.perf_counter() - start
+
+    print('measurements {}'.format(NUM_MESSAGES * SENSORGRAMS_PER_MESSAGE))
+    print('json         {:.3f}s  {} bytes'.format(json_time, json_size))
+    print('columnar     {:.3f}s  {} bytes  speedup {:.1f}x'.format(
+        columnar_time, columnar_size, json_time / columnar_time))
+    print('reload       {:.3f}s'.format(load_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import os
+import random
+import time
+import types
+from importlib.machinery import SourceFileLoader
+import waggle.plugin
+import waggle.protocol
+
+# Compares converting a day of synthetic wagman telemetry with the status
+# plugin_beehive one measurement at a time, as it used to, against its
+# vectorized batch conversion, for the conversions alone, the handler and the
+# processed results written by start_processing_measurements.
+
+REPORTS_PER_DAY = 24 * 60 * 2
+
+PLUGIN_BEEHIVE = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'plugin_beehive')
+
+
+def load_plugin_beehive():
+    loader = SourceFileLoader('status_plugin_beehive', PLUGIN_BEEHIVE)
+    module = types.ModuleType(loader.name)
+    loader.exec_module(module)
+    return module
+
+
+def make_measurements():
+    messages = []
+
+    for i in range(REPORTS_PER_DAY):
+        sensorgrams = []
+
+        for port in range(5):
+            sensorgrams.append({'sensor_id': 0xff06, 'parameter_id': port, 'value': random.randint(150, 2000) << 5})
+            sensorgrams.append({'sensor_id': 0xff10, 'parameter_id': port, 'value': random.randint(1500, 2500)})
+
+        sensorgrams.append({'sensor_id': 0xff08, 'parameter_id': 0, 'value': random.randint(3000, 3500)})
+        sensorgrams.append({'sensor_id': 0x0002, 'parameter_id': 1, 'value': random.randint(20000, 30000)})
+        sensorgrams.append({'sensor_id': 0x0002, 'parameter_id': 2, 'value': random.randint(20000, 30000)})
+        sensorgrams.append({'sensor_id': 0xff13, 'parameter_id': 0, 'value': i})
+
+        for sensorgram in sensorgrams:
+            sensorgram['timestamp'] = i * 30
+
+        messages.append({
+            'sender_sub_id': '0000000000000001',
+            'body': waggle.protocol.pack_datagram({'body': waggle.protocol.pack_sensorgrams(sensorgrams)}),
+        })
+
+    return list(waggle.plugin.measurements_in_message_data(waggle.protocol.pack_messages(messages)))
+
+
+def run_scalar_conversion(plugin, sensor_ids, parameter_ids, values):
+    return [plugin.get_conversion(sensor_id, parameter_id)(value)
+            for sensor_id, parameter_id, value in zip(sensor_ids, parameter_ids, values)]
+
+
+def run_batch_conversion(plugin, sensor_ids, parameter_ids, values):
+    return plugin.conversion_table.convert_batch(sensor_ids, parameter_ids, values)
+
+
+def make_scalar_handler(plugin):
+    def process_measurements(message, datagram, sensorgram):
+        conversion = plugin.get_conversion(sensorgram['sensor_id'], sensorgram['parameter_id'])
+        yield {
+            'subsystem': plugin.get_subsystem(message, sensorgram),
+            'sensor': sensorgram['sensor_id'],
+            'parameter': sensorgram['parameter_id'],
+            'value_raw': plugin.normalize_type(sensorgram['value']),
+            'value_hrf': plugin.normalize_type(conversion(sensorgram['value'])),
+        }
+
+    return process_measurements
+
+
+def run_scalar(handler, measurements):
+    return [r for message, datagram, sensorgram in measurements for r in handler(message, datagram, sensorgram)]
+
+
+def run_batch(plugin, measurements):
+    return plugin.process_batch(measurements)
+
+
+def run_processed(handler, measurements):
+    return list(waggle.plugin.processed_results(handler, measurements))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    import numpy
+
+    plugin = load_plugin_beehive()
+    measurements = make_measurements()
+    sensor_ids = [sensorgram['sensor_id'] for _, _, sensorgram in measurements]
+    parameter_ids = [sensorgram['parameter_id'] for _, _, sensorgram in measurements]
+    values = [sensorgram['value'] for _, _, sensorgram in measurements]
+
+    # warm up the lookup caches
+    run_batch(plugin, measurements[:1000])
+
+    scalar_time, expected = timed(run_scalar_conversion, plugin, sensor_ids, parameter_ids, values)
+    batch_time, results = timed(run_batch_conversion, plugin, sensor_ids, parameter_ids, values)
+    numpy.testing.assert_allclose(results, expected, rtol=1e-12)
+
+    print('measurements     {}'.format(len(measurements)))
+    print('scalar convert   {:.3f}s'.format(scalar_time))
+    print('batch convert    {:.3f}s  speedup {:.1f}x'.format(batch_time, scalar_time / batch_time))
+
+    scalar_handler = make_scalar_handler(plugin)
+    scalar_time, expected = timed(run_scalar, scalar_handler, measurements)
+    batch_time, results = timed(run_batch, plugin, measurements)
+    assert waggle.plugin.column_rows(results) == expected
+
+    print('scalar handler   {:.3f}s'.format(scalar_time))
+    print('batch handler    {:.3f}s  speedup {:.1f}x'.format(batch_time, scalar_time / batch_time))
+
+    scalar_time, expected = timed(run_processed, scalar_handler, measurements)
+    batch_time, results = timed(run_processed, plugin.process_measurements, measurements)
+    assert results == expected
+
+    print('scalar processed {:.3f}s'.format(scalar_time))
+    print('batch processed  {:.3f}s  speedup {:.1f}x'.format(batch_time, scalar_time / batch_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import tempfile
+import time
+import numpy as np
+from waggle.plugin.framebus import FrameBusReader, FrameBusWriter, frame_bus_path
+
+# Compares four image processors each decoding a 2592x1944 camera frame, as
+# they do reading from the image pipeline, against one decode published to
+# the frame bus, with a 2 level pyramid, and four readers acquiring it.
+# Decoding needs OpenCV; without it only the bus costs are measured.
+
+HEIGHT = 1944
+WIDTH = 2592
+CONSUMERS = 4
+NUMBER = 20
+
+
+def make_image():
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    image = np.dstack([x % 256, y % 256, (x + y) % 256]).astype(np.uint8)
+    noise = np.random.RandomState(0).randint(0, 32, image.shape).astype(np.uint8)
+    return image + noise
+
+
+def timed(func):
+    start = time.perf_counter()
+    for _ in range(NUMBER):
+        func()
+    return (time.perf_counter() - start) / NUMBER
+
+
+def main():
+    image = make_image()
+
+    try:
+        import cv2
+        data = cv2.imencode('.jpg', image)[1].tobytes()
+        decode_time = timed(lambda: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+    except ImportError:
+        decode_time = None
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = frame_bus_path('benchmark', directory=directory)
+        writer = FrameBusWriter(path, HEIGHT, WIDTH, levels=2)
+        readers = [FrameBusReader(path) for _ in range(CONSUMERS)]
+
+        publish_time = timed(lambda: writer.publish(image))
+
+        def acquire_all():
+            frames = [reader.acquire() for reader in readers]
+            for frame in frames:
+                frame.release()
+
+        acquire_time = timed(acquire_all)
+
+        for reader in readers:
+            reader.close()
+        writer.close()
+
+    print('publish     {:.2f}ms per frame'.format(1e3 * publish_time))
+    print('acquire     {:.3f}ms for {} readers'.format(1e3 * acquire_time, CONSUMERS))
+
+    if decode_time is None:
+        print('decode      OpenCV not installed')
+        return
+
+    separate_time = CONSUMERS * decode_time
+    bus_time = decode_time + publish_time + acquire_time
+    print('decode      {:.2f}ms per frame'.format(1e3 * decode_time))
+    print('separate    {:.2f}ms per frame for {} processors'.format(1e3 * separate_time, CONSUMERS))
+    print('frame bus   {:.2f}ms per frame  speedup {:.1f}x'.format(1e3 * bus_time, separate_time / bus_time))
+
+
+if __name__ == '__main__':
+    main()
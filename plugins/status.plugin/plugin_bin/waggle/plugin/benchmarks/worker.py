@@ -0,0 +1,98 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import waggle.protocol
+from waggle.plugin.worker import read_batches, write_batch
+
+# Compares running a plugin_beehive converter once per batch, as beehive does
+# now, against streaming the same batches through one long running worker.
+
+NUM_BATCHES = 200
+MESSAGES_PER_BATCH = 20
+SENSORGRAMS_PER_MESSAGE = 50
+
+CONVERTER = '''
+import waggle.plugin
+
+
+def process_measurements(message, datagram, sensorgram):
+    yield {
+        'sensor': sensorgram['sensor_id'],
+        'parameter': sensorgram['parameter_id'],
+        'value_raw': sensorgram['value'],
+        'value_hrf': sensorgram['value'],
+    }
+
+
+if __name__ == '__main__':
+    waggle.plugin.start_processing_measurements(process_measurements)
+'''
+
+
+def make_batch(n):
+    return b''.join(waggle.protocol.pack_message({
+        'sender_id': '{:016x}'.format(n * MESSAGES_PER_BATCH + i),
+        'body': waggle.protocol.pack_datagram({
+            'body': waggle.protocol.pack_sensorgrams([
+                {'sensor_id': j, 'parameter_id': 0, 'value': j}
+                for j in range(SENSORGRAMS_PER_MESSAGE)
+            ]),
+        }),
+    }) for i in range(MESSAGES_PER_BATCH))
+
+
+def run_spawn(script, batches):
+    return [subprocess.run([sys.executable, script], input=batch, stdout=subprocess.PIPE, check=True).stdout
+            for batch in batches]
+
+
+def run_worker(script, batches, processes):
+    with tempfile.TemporaryFile() as input:
+        for batch in batches:
+            write_batch(input, batch)
+
+        input.seek(0)
+        output = subprocess.run([sys.executable, script, '--worker', '--processes', str(processes)],
+                                stdin=input, stdout=subprocess.PIPE, check=True).stdout
+
+    with tempfile.TemporaryFile() as file:
+        file.write(output)
+        file.seek(0)
+        return list(read_batches(file))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    batches = [make_batch(n) for n in range(NUM_BATCHES)]
+
+    with tempfile.TemporaryDirectory() as dir:
+        script = os.path.join(dir, 'plugin_beehive')
+
+        with open(script, 'w') as file:
+            file.write(CONVERTER)
+
+        spawn_time, expected = timed(run_spawn, script, batches)
+        print('batches   {} x {} measurements'.format(NUM_BATCHES, MESSAGES_PER_BATCH * SENSORGRAMS_PER_MESSAGE))
+        print('spawn     {:.3f}s'.format(spawn_time))
+
+        for processes in [1, 4]:
+            worker_time, results = timed(run_worker, script, batches, processes)
+            assert results == expected
+            print('worker x{} {:.3f}s  speedup {:.1f}x'.format(processes, worker_time, spawn_time / worker_time))
+
+
+if __name__ == '__main__':
+    main()
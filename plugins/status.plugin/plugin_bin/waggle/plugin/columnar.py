@@ -0,0 +1,345 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module writes the results of a plugin_beehive handler as columns of
+typed arrays, which can be loaded as numpy arrays without parsing.
+
+A column store is a directory containing:
+
+* `columns.json` which lists the columns and their dtypes.
+* `<column>.bin` for each column, holding one little endian value per row.
+* `<column>.dict` for each string column, holding one JSON encoded string
+per line. String columns store uint32 codes indexing these dictionaries.
+
+Rows are only ever appended, so a store can be extended by later runs and
+read while it is being written. Dictionary entries are written before the
+codes which refer to them and readers use the length of the shortest column,
+so a reader never sees a partially written row.
+
+Values which are numbers are stored in the float64 value_raw and value_hrf
+columns. Other values are stored as NaN there and as strings, formatted like
+the JSON output, in the value_raw_text and value_hrf_text columns.
+
+Example:
+
+```
+$ plugin_beehive --columnar results < replay.bin
+
+from waggle.plugin.columnar import ColumnReader
+
+columns = ColumnReader('results')
+ok = columns.strings('subsystem') == 'metsense'
+print(columns['timestamp'][ok], columns['value_hrf'][ok])
+```
+"""
+import array
+import json
+import math
+import os
+import sys
+import waggle.plugin
+
+VERSION = 1
+
+STRING = 'str'
+
+COLUMNS = [
+    ('timestamp', '<i8'),
+    ('node_id', STRING),
+    ('subsystem', STRING),
+    ('sensor', STRING),
+    ('parameter', STRING),
+    ('value_raw', '<f8'),
+    ('value_hrf', '<f8'),
+    ('value_raw_text', STRING),
+    ('value_hrf_text', STRING),
+]
+
+# array typecodes used to write each dtype
+typecodes = {
+    '<i8': 'q',
+    '<f8': 'd',
+    '<u4': 'I',
+}
+
+DEFAULT_BATCH_SIZE = 65536
+
+
+def split_value(value):
+    """Returns the numeric and text columns for a result value."""
+    if isinstance(value, (int, float)):
+        return float(value), ''
+    return math.nan, waggle.plugin.stringify(value)
+
+
+class ColumnBatch:
+    """
+    Holds rows waiting to be written. String columns are encoded against a
+    dictionary local to the batch, so batches can be built in other processes
+    and merged by a ColumnWriter.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.dictionaries = {}
+        self.codes = {}
+
+        for name, dtype in COLUMNS:
+            if dtype == STRING:
+                self.columns[name] = array.array('I')
+                self.dictionaries[name] = []
+                self.codes[name] = {}
+            else:
+                self.columns[name] = array.array(typecodes[dtype])
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def append_string(self, name, value):
+        codes = self.codes[name]
+
+        try:
+            code = codes[value]
+        except KeyError:
+            code = len(codes)
+            codes[value] = code
+            self.dictionaries[name].append(value)
+
+        self.columns[name].append(code)
+
+    def append(self, node_id, r):
+        value_raw, value_raw_text = split_value(r['value_raw'])
+        value_hrf, value_hrf_text = split_value(r['value_hrf'])
+
+        self.columns['timestamp'].append(r['timestamp'])
+        self.append_string('node_id', node_id)
+        self.append_string('subsystem', str(r.get('subsystem', '')))
+        self.append_string('sensor', str(r.get('sensor', '')))
+        self.append_string('parameter', str(r.get('parameter', '')))
+        self.columns['value_raw'].append(value_raw)
+        self.columns['value_hrf'].append(value_hrf)
+        self.append_string('value_raw_text', value_raw_text)
+        self.append_string('value_hrf_text', value_hrf_text)
+
+    def __getstate__(self):
+        # the reverse lookup is only needed while appending
+        return self.columns, self.dictionaries
+
+    def __setstate__(self, state):
+        self.columns, self.dictionaries = state
+        self.codes = None
+
+
+def column_batches(handler, measurements, batch_size=DEFAULT_BATCH_SIZE):
+    """Yields ColumnBatches of the results of handler over measurements."""
+    batch = ColumnBatch()
+
+    for message, sensorgram, r in waggle.plugin.handler_results(handler, measurements):
+        r['timestamp'] = sensorgram['timestamp']
+        batch.append(message['sender_id'], r)
+
+        if len(batch) >= batch_size:
+            yield batch
+            batch = ColumnBatch()
+
+    if len(batch) > 0:
+        yield batch
+
+
+def encode_columns(handler, measurements):
+    """Returns a single ColumnBatch of the results of handler over measurements."""
+    return next(column_batches(handler, measurements, batch_size=math.inf), ColumnBatch())
+
+
+def create_store(path):
+    os.makedirs(path, exist_ok=True)
+    schema_path = os.path.join(path, 'columns.json')
+    schema = {
+        'version': VERSION,
+        'columns': [{'name': name, 'dtype': dtype} for name, dtype in COLUMNS],
+    }
+
+    if os.path.exists(schema_path):
+        with open(schema_path) as file:
+            existing = json.load(file)
+
+        if existing != schema:
+            raise ValueError('Incompatible column store.')
+
+        return
+
+    with open(schema_path, 'w') as file:
+        json.dump(schema, file, indent=2)
+
+
+def read_dictionary(path):
+    """
+    Returns the entries of a dictionary file and the size of the complete
+    lines in it. A partially written last line is ignored.
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return [], 0
+
+    size = data.rfind(b'\n') + 1
+    return [json.loads(line.decode()) for line in data[:size].splitlines()], size
+
+
+def array_bytes(values):
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class ColumnWriter:
+    """Appends ColumnBatches to the column store at path."""
+
+    def __init__(self, path):
+        self.path = path
+        create_store(path)
+
+        self.files = {}
+        self.dictionary_files = {}
+        self.codes = {}
+
+        # drop any partially written rows left by an interrupted run
+        itemsizes = {name: array.array(typecodes.get(dtype, 'I')).itemsize for name, dtype in COLUMNS}
+        column_paths = {name: os.path.join(path, name + '.bin') for name, _ in COLUMNS}
+        rows = min(os.path.getsize(column_paths[name]) // itemsizes[name]
+                   if os.path.exists(column_paths[name]) else 0 for name, _ in COLUMNS)
+
+        for name, dtype in COLUMNS:
+            self.files[name] = open(column_paths[name], 'ab')
+            self.files[name].truncate(rows * itemsizes[name])
+
+            if dtype == STRING:
+                dictionary_path = os.path.join(path, name + '.dict')
+                dictionary, size = read_dictionary(dictionary_path)
+                self.codes[name] = {value: code for code, value in enumerate(dictionary)}
+                self.dictionary_files[name] = open(dictionary_path, 'a')
+                self.dictionary_files[name].truncate(size)
+
+    def code(self, name, value):
+        codes = self.codes[name]
+
+        try:
+            return codes[value]
+        except KeyError:
+            code = len(codes)
+            codes[value] = code
+            self.dictionary_files[name].write(json.dumps(value))
+            self.dictionary_files[name].write('\n')
+            return code
+
+    def append(self, batch):
+        columns = {}
+
+        for name, dtype in COLUMNS:
+            values = batch.columns[name]
+
+            if dtype == STRING:
+                remap = [self.code(name, value) for value in batch.dictionaries[name]]
+                values = array.array('I', [remap[code] for code in values])
+
+            columns[name] = values
+
+        # dictionary entries must be on disk before the codes using them
+        for file in self.dictionary_files.values():
+            file.flush()
+
+        for name, _ in COLUMNS:
+            self.files[name].write(array_bytes(columns[name]))
+
+        for file in self.files.values():
+            file.flush()
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+        for file in self.dictionary_files.values():
+            file.close()
+
+
+def write_columns(handler, reader, path, processes=1):
+    """
+    Runs handler over every measurement read from reader and appends the
+    results to the column store at path.
+    """
+    writer = ColumnWriter(path)
+
+    try:
+        if processes > 1:
+            from waggle.plugin.parallel import processed_chunks
+            batches = processed_chunks(handler, reader, processes, encode_func=encode_columns)
+        else:
+            batches = column_batches(handler, waggle.plugin.measurements_in_message_stream(reader))
+
+        for batch in batches:
+            writer.append(batch)
+    finally:
+        writer.close()
+
+
+class ColumnReader:
+    """
+    Reads the column store at path. Numeric columns and the codes of string
+    columns are returned as read only numpy arrays mapped from the column
+    files.
+    """
+
+    def __init__(self, path):
+        import numpy
+
+        with open(os.path.join(path, 'columns.json')) as file:
+            schema = json.load(file)
+
+        if schema['version'] != VERSION:
+            raise ValueError('Unsupported column store version.')
+
+        self.path = path
+        self.dtypes = {column['name']: column['dtype'] for column in schema['columns']}
+        self.arrays = {}
+
+        for name, dtype in self.dtypes.items():
+            dtype = numpy.dtype('<u4' if dtype == STRING else dtype)
+            column_path = os.path.join(path, name + '.bin')
+            count = os.path.getsize(column_path) // dtype.itemsize
+
+            if count == 0:
+                self.arrays[name] = numpy.empty(0, dtype=dtype)
+            else:
+                self.arrays[name] = numpy.memmap(column_path, dtype=dtype, mode='r', shape=(count,))
+
+        self.rows = min(len(values) for values in self.arrays.values())
+        self.dictionaries = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.rows]
+
+    def dictionary(self, name):
+        """Returns the dictionary of a string column as a numpy array of str."""
+        import numpy
+
+        if self.dtypes[name] != STRING:
+            raise ValueError('{} is not a string column.'.format(name))
+
+        if name not in self.dictionaries:
+            dictionary, _ = read_dictionary(os.path.join(self.path, name + '.dict'))
+            self.dictionaries[name] = numpy.array(dictionary, dtype=object)
+
+        return self.dictionaries[name]
+
+    def strings(self, name):
+        """Returns a string column decoded to a numpy array of str."""
+        return self.dictionary(name)[self[name]]
@@ -0,0 +1,202 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides conversion tables for plugin_beehive converters which
+can convert batches of values with numpy.
+
+A ConversionTable maps either a sensor ID or a (sensor ID, parameter ID) pair
+to a function converting one raw value. It may also map the same keys to a
+vectorized function converting a numpy array of raw values. convert_batch
+sorts values by key with numpy, converts each group with one call and
+scatters the results back in order. Groups without a vectorized function, or whose values
+are not a flat numeric array, are converted one value at a time.
+
+Vectorized functions may return a numpy array or a list. Elements of an array
+which are not finite are converted again with the scalar function, so inputs
+the scalar function rejects, such as a zero ADC reading, still raise the same
+error. round_array and round_floats round like round does, so vectorized
+functions and result columns can be rounded without a loop over the values.
+
+Example:
+
+```
+table = ConversionTable({
+    0xff06: convert_cu,
+    (0x0002, 1): convert_htu21d_temperature,
+}, vectorized={
+    0xff06: convert_cu_array,
+})
+
+table.convert(0xff06, 0, 2000)
+table.convert_batch([0xff06, 0x0002], [0, 1], [2000, 25000])
+```
+"""
+import operator
+
+
+def no_conversion(x):
+    return x
+
+
+def convert_group(func, vectorized, values, array=None):
+    if func is no_conversion:
+        return values
+
+    if vectorized is not None:
+        import numpy
+
+        if array is None:
+            array = numpy.asarray(values)
+
+        if array.ndim == 1 and array.dtype.kind in 'iuf':
+            try:
+                with numpy.errstate(all='ignore'):
+                    converted = vectorized(array)
+            except (TypeError, ValueError):
+                converted = None
+
+            if isinstance(converted, numpy.ndarray):
+                invalid = numpy.flatnonzero(~numpy.isfinite(converted))
+                converted = converted.tolist()
+
+                for i in invalid:
+                    converted[i] = func(values[i])
+
+            if converted is not None:
+                return converted
+
+    return [func(value) for value in values]
+
+
+class ConversionTable:
+
+    def __init__(self, table, vectorized=None, default=no_conversion):
+        self.table = table
+        self.vectorized = vectorized or {}
+        self.default = default
+        self.cache = {}
+
+    def lookup(self, sensor_id, parameter_id):
+        """
+        Returns the scalar and vectorized conversion functions for a sensor
+        and parameter. The vectorized function may be None.
+        """
+        key = (sensor_id, parameter_id)
+
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+
+        for k in (key, sensor_id):
+            if k in self.table:
+                result = (self.table[k], self.vectorized.get(k))
+                break
+        else:
+            result = (self.default, None)
+
+        self.cache[key] = result
+        return result
+
+    def convert(self, sensor_id, parameter_id, value):
+        return self.lookup(sensor_id, parameter_id)[0](value)
+
+    def convert_batch(self, sensor_ids, parameter_ids, values):
+        """
+        Converts each value in values using the conversion for the sensor and
+        parameter IDs at the same position and returns a list of the results.
+        """
+        import numpy
+
+        if len(values) < 2:
+            return [self.convert(*item) for item in zip(sensor_ids, parameter_ids, values)]
+
+        # sort by key, so each key's values are a contiguous, ordered run
+        codes = (numpy.array(sensor_ids, dtype=numpy.int64) << 32) | numpy.array(parameter_ids, dtype=numpy.int64)
+        order = numpy.argsort(codes, kind='stable')
+        codes = codes[order]
+        starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(codes)) + 1, [len(codes)])).tolist()
+        converted = []
+
+        # values of a single numeric type are sorted as an array, which is much
+        # faster, and tolist gives back the same Python values.
+        array = None
+        types = set(map(type, values))
+
+        if types == {int} or types == {float}:
+            array = numpy.array(values)[order]
+
+            if array.dtype.kind not in ('iu' if types == {int} else 'f'):
+                array = None
+
+        if array is None:
+            values = take(values, order.tolist())
+
+        for start, stop in zip(starts, starts[1:]):
+            code = int(codes[start])
+            func, vectorized = self.lookup(code >> 32, code & 0xffffffff)
+
+            if array is None:
+                converted.extend(convert_group(func, vectorized, list(values[start:stop])))
+            else:
+                group = array[start:stop]
+                converted.extend(convert_group(func, vectorized, group.tolist(), group))
+
+        # scatter the results back to the original order
+        return take(converted, numpy.argsort(order).tolist())
+
+
+def take(items, indices):
+    """Returns the items at indices as a list."""
+    if len(indices) == 1:
+        return [items[indices[0]]]
+    return list(operator.itemgetter(*indices)(items))
+
+
+def round_array(array, digits):
+    """
+    Returns a float array rounded to digits decimal places, with the same
+    results as calling round on each element. numpy.round rounds the scaled
+    values, which can round values within an ulp of a tie the other way, so
+    those, and values too large to scale exactly, are rounded with round.
+    """
+    import numpy
+
+    scale = 10.0 ** digits
+    scaled = numpy.asarray(array, dtype=float) * scale
+    rounded = numpy.rint(scaled) / scale
+
+    with numpy.errstate(invalid='ignore'):
+        near_tie = ~(numpy.abs(scaled - numpy.floor(scaled) - 0.5) > 1e-6) | ~(numpy.abs(scaled) < 1e9)
+
+    for i in numpy.flatnonzero(near_tie).tolist():
+        rounded[i] = round(float(array[i]), digits)
+
+    return rounded
+
+
+def round_floats(values, digits):
+    """
+    Returns a list of values with each float rounded to digits decimal places
+    like round. Other values are left alone.
+    """
+    index = [i for i, value in enumerate(values) if type(value) is float]
+
+    if not index:
+        return list(values)
+
+    rounded = round_array(take(values, index), digits).tolist()
+
+    if len(index) == len(values):
+        return rounded
+
+    values = list(values)
+
+    for i, value in zip(index, rounded):
+        values[i] = value
+
+    return values
@@ -0,0 +1,454 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides a shared memory bus of decoded image frames, so several
+image processors on a node can share one decode of each camera frame.
+
+A producer decodes each frame once into a ring of preallocated slots in a
+file under /dev/shm. Consumers map the same file and get read only ndarray
+views of the latest frame without copying it. Each slot can also hold a
+pyramid of images downscaled by 2, 4, ..., which consumers can ask for with
+level.
+
+The file starts with a header, followed by the slot table and the slots:
+
+```
+header
+magic         4s      b'WFRB'
+version       uint32
+slots         uint32  number of slots
+height        uint32  maximum frame height
+width         uint32  maximum frame width
+channels      uint32
+levels        uint32  pyramid levels after the full size frame
+headers_size  uint32  space for the JSON headers of each frame
+latest        uint64  sequence number of the latest frame
+
+slot table entry
+sequence      uint64  frame sequence number, 0 while empty or being written
+refcount      int32   consumers holding the frame
+headers_len   uint32
+acquired      float64 time the frame was last acquired
+timestamp     float64 time the frame was published
+height        uint32
+width         uint32
+```
+
+Each slot holds the headers followed by the pixels of each level. Slots and
+levels are aligned to 64 bytes.
+
+Updates to the header and slot table are made holding a lock on the file. A
+slot is only reused once its frame has no references, so the views stay
+valid until the frame is released. As a consumer which dies while holding a
+frame never releases it, a reference held for longer than stale_after
+seconds is ignored and the slot is reused. Consumers which keep a frame for
+longer should copy it.
+
+Example:
+
+```
+# producer
+bus = FrameBusWriter(frame_bus_path('bottom'), 1944, 2592, levels=2)
+bus.publish_jpeg(body, headers=properties.headers)
+
+# consumer
+reader = FrameBusReader(frame_bus_path('bottom'), level=1)
+ok, frame = reader.read()
+
+if ok:
+    with frame:
+        process(frame.image)
+```
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+
+MAGIC = b'WFRB'
+VERSION = 1
+
+HEADER = struct.Struct('<4sIIIIIIIQ')
+SLOT = struct.Struct('<QiIddII')
+
+ALIGNMENT = 64
+
+DEFAULT_DIRECTORY = '/dev/shm'
+
+
+def frame_bus_path(name, directory=DEFAULT_DIRECTORY):
+    return os.path.join(directory, 'waggle-frames-{}'.format(name))
+
+
+def align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def level_shape(height, width, level):
+    return height >> level, width >> level
+
+
+def downscale(src, dst):
+    """
+    Writes the 2x2 box average of src into dst, which is half its size. Uses
+    OpenCV's area resize when it is installed, as it is several times faster.
+    """
+    h, w = dst.shape[:2]
+
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+
+    if cv2 is not None:
+        cv2.resize(src[:2 * h, :2 * w], (w, h), dst=dst, interpolation=cv2.INTER_AREA)
+        return
+
+    pairs = src[:2 * h, :2 * w].reshape(h, 2, w, 2, -1)
+    rows = np.add(pairs[:, 0], pairs[:, 1], dtype=np.uint16)
+    total = np.add(rows[:, :, 0], rows[:, :, 1])
+    total += 2
+    np.right_shift(total, 2, out=total)
+    dst[:] = total.reshape(dst.shape)
+
+
+class Layout:
+    """
+    Offsets of the slot table and slots for a bus's parameters.
+    """
+
+    def __init__(self, slots, height, width, channels, levels, headers_size):
+        self.slots = slots
+        self.height = height
+        self.width = width
+        self.channels = channels
+        self.levels = levels
+        self.headers_size = headers_size
+
+        self.level_offsets = []
+        offset = align(headers_size)
+
+        for level in range(levels + 1):
+            self.level_offsets.append(offset)
+            h, w = level_shape(height, width, level)
+            offset += align(h * w * channels)
+
+        self.slot_size = offset
+        self.data_offset = align(HEADER.size + slots * SLOT.size)
+        self.size = self.data_offset + slots * self.slot_size
+
+    def slot_offset(self, index):
+        return self.data_offset + index * self.slot_size
+
+    def table_offset(self, index):
+        return HEADER.size + index * SLOT.size
+
+
+class Frame:
+    """
+    A frame acquired from a FrameBusReader. image is a read only view into
+    shared memory, valid until the frame is released.
+    """
+
+    def __init__(self, ring, index, sequence, timestamp, headers, image):
+        self.ring = ring
+        self.index = index
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.headers = headers
+        self.image = image
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.release(self.index, self.sequence)
+            self.ring = None
+            self.image = None
+
+
+class FrameRing:
+
+    def __init__(self, path, file, layout, stale_after):
+        self.path = path
+        self.file = file
+        self.layout = layout
+        self.stale_after = stale_after
+        self.map = mmap.mmap(file.fileno(), layout.size)
+        self.thread_lock = threading.Lock()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        try:
+            self.map.close()
+        except BufferError:
+            # views of frames are still referenced, the map is closed once
+            # they are collected.
+            pass
+        self.file.close()
+
+    def lock(self):
+        self.thread_lock.acquire()
+        fcntl.lockf(self.file, fcntl.LOCK_EX)
+
+    def unlock(self):
+        fcntl.lockf(self.file, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+    def read_slot(self, index):
+        return SLOT.unpack_from(self.map, self.layout.table_offset(index))
+
+    def write_slot(self, index, *fields):
+        SLOT.pack_into(self.map, self.layout.table_offset(index), *fields)
+
+    def read_latest(self):
+        return HEADER.unpack_from(self.map, 0)[-1]
+
+    def write_latest(self, sequence):
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.layout.slots, self.layout.height,
+                         self.layout.width, self.layout.channels, self.layout.levels,
+                         self.layout.headers_size, sequence)
+
+    def release(self, index, sequence):
+        if self.closed:
+            return
+
+        self.lock()
+        try:
+            fields = list(self.read_slot(index))
+
+            if fields[0] == sequence and fields[1] > 0:
+                fields[1] -= 1
+                self.write_slot(index, *fields)
+        finally:
+            self.unlock()
+
+    def view(self, index, level, height, width):
+        h, w = level_shape(height, width, level)
+        offset = self.layout.slot_offset(index) + self.layout.level_offsets[level]
+        array = np.frombuffer(self.map, dtype=np.uint8, count=h * w * self.layout.channels, offset=offset)
+        return array.reshape(h, w, self.layout.channels)
+
+
+class FrameBusWriter(FrameRing):
+    """
+    Creates the bus at path, replacing any existing bus, and publishes frames
+    of up to height x width pixels to it.
+    """
+
+    def __init__(self, path, height, width, channels=3, slots=4, levels=0, headers_size=1024, stale_after=60):
+        layout = Layout(slots, height, width, channels, levels, headers_size)
+
+        # the bus is created under a temporary name and renamed, so readers
+        # never see a partly initialized bus and reattach to the new one.
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        file = open(tmp_path, 'w+b')
+        file.truncate(layout.size)
+        super().__init__(path, file, layout, stale_after)
+        self.write_latest(0)
+        os.rename(tmp_path, path)
+
+    def publish(self, image, headers=None, timestamp=None):
+        """
+        Publishes a height x width x channels uint8 image. Returns the frame's
+        sequence number, or None if every slot is held by a consumer.
+        """
+        height, width = image.shape[:2]
+
+        if height > self.layout.height or width > self.layout.width:
+            raise ValueError('Frame is larger than the bus.')
+        if image.shape[2:] != (self.layout.channels,) and not (image.ndim == 2 and self.layout.channels == 1):
+            raise ValueError('Frame does not have {} channels.'.format(self.layout.channels))
+
+        headers_data = json.dumps(headers or {}).encode()
+
+        if len(headers_data) > self.layout.headers_size:
+            raise ValueError('Frame headers are larger than the bus allows.')
+
+        index = self._reserve()
+
+        if index is None:
+            return None
+
+        offset = self.layout.slot_offset(index)
+        self.map[offset:offset + len(headers_data)] = headers_data
+
+        previous = self.view(index, 0, height, width)
+        previous[:] = image.reshape(previous.shape)
+
+        for level in range(1, self.layout.levels + 1):
+            current = self.view(index, level, height, width)
+            downscale(previous, current)
+            previous = current
+
+        self.lock()
+        try:
+            sequence = self.read_latest() + 1
+            self.write_slot(index, sequence, 0, len(headers_data), 0.0,
+                            timestamp or time.time(), height, width)
+            self.write_latest(sequence)
+        finally:
+            self.unlock()
+
+        return sequence
+
+    def publish_jpeg(self, data, headers=None, timestamp=None):
+        """
+        Decodes an encoded image with OpenCV and publishes it.
+        """
+        import cv2
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+        if image is None:
+            raise ValueError('Failed to decode image.')
+
+        return self.publish(image, headers, timestamp)
+
+    def _reserve(self):
+        now = time.time()
+        self.lock()
+        try:
+            latest = self.read_latest()
+            slots = self.layout.slots
+            start = 0
+
+            for index in range(slots):
+                if self.read_slot(index)[0] == latest:
+                    start = index + 1
+                    break
+
+            for i in range(slots):
+                index = (start + i) % slots
+                sequence, refcount, _, acquired, _, _, _ = self.read_slot(index)
+
+                if sequence == latest and latest != 0:
+                    continue
+
+                if refcount <= 0 or now - acquired > self.stale_after:
+                    self.write_slot(index, 0, 0, 0, 0.0, 0.0, 0, 0)
+                    return index
+
+            return None
+        finally:
+            self.unlock()
+
+
+class FrameBusReader:
+    """
+    Attaches to the bus at path and acquires frames at pyramid level. The
+    bus is attached on the first read, and reattached if the producer
+    recreates it.
+    """
+
+    def __init__(self, path, level=0, poll_interval=0.01):
+        self.path = path
+        self.level = level
+        self.poll_interval = poll_interval
+        self.ring = None
+        self.inode = None
+        self.last_sequence = 0
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def acquire(self, after=0, level=None):
+        """
+        Returns the latest frame if its sequence number is greater than after,
+        otherwise None.
+        """
+        if level is None:
+            level = self.level
+
+        if not self._attach():
+            return None
+
+        ring = self.ring
+
+        if level > ring.layout.levels:
+            raise ValueError('Bus has no pyramid level {}.'.format(level))
+
+        ring.lock()
+        try:
+            latest = ring.read_latest()
+
+            if latest <= after:
+                return None
+
+            for index in range(ring.layout.slots):
+                sequence, refcount, headers_len, _, timestamp, height, width = ring.read_slot(index)
+
+                if sequence == latest:
+                    ring.write_slot(index, sequence, refcount + 1, headers_len, time.time(),
+                                    timestamp, height, width)
+                    break
+            else:
+                return None
+        finally:
+            ring.unlock()
+
+        offset = ring.layout.slot_offset(index)
+        headers = json.loads(ring.map[offset:offset + headers_len].decode())
+        image = ring.view(index, level, height, width)
+        image.flags.writeable = False
+        return Frame(ring, index, sequence, timestamp, headers, image)
+
+    def read(self, timeout=5):
+        """
+        Waits up to timeout seconds for a frame newer than the last one read.
+        Returns (True, frame) like ImagePipelineHandler.read, or (False, '')
+        on timeout.
+        """
+        deadline = time.time() + timeout
+
+        while True:
+            # attaching to a new bus resets last_sequence
+            self._attach()
+            frame = self.acquire(after=self.last_sequence)
+
+            if frame is not None:
+                self.last_sequence = frame.sequence
+                return True, frame
+
+            if time.time() >= deadline:
+                return False, ''
+
+            time.sleep(self.poll_interval)
+
+    def _attach(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return self.ring is not None
+
+        if self.ring is not None and inode == self.inode:
+            return True
+
+        file = open(self.path, 'r+b')
+        header = HEADER.unpack_from(file.read(HEADER.size))
+        magic, version, slots, height, width, channels, levels, headers_size, _ = header
+
+        if magic != MAGIC or version != VERSION:
+            file.close()
+            raise RuntimeError('{} is not a frame bus.'.format(self.path))
+
+        layout = Layout(slots, height, width, channels, levels, headers_size)
+        self.close()
+        self.ring = FrameRing(self.path, file, layout, stale_after=None)
+        self.inode = inode
+        self.last_sequence = 0
+        return True
@@ -0,0 +1,158 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module runs a plugin_beehive handler over a message stream on several
+cores, for backfills which are too large for a single process.
+
+The stream goes through a pipeline of three stages:
+
+1. The splitter reads the stream and cuts it into chunks of whole messages,
+using the body length in each message header to find the boundaries. Only the
+header CRC, which protects the length, is checked at this stage.
+2. A pool of forked processes checks CRCs, decodes and converts each chunk
+with the handler and encodes the results.
+3. The merger yields the encoded results of each chunk in input order as soon
+as they are ready, so the output is identical to a single process run and is
+written as it is produced.
+
+At most a few chunks per process are in flight at once, so memory use does
+not grow with the size of the input.
+
+Example:
+
+```sh
+$ plugin_beehive --ndjson --processes 8 < backfill.bin > results.ndjson
+```
+"""
+import collections
+import json
+import waggle.plugin
+import waggle.protocol
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+PACKET_OVERHEAD = waggle.protocol.WAGGLE_PACKET_BODY_OFFSET + waggle.protocol.WAGGLE_PACKET_FOOTER.size
+
+
+def message_boundary(buf, offset=0):
+    """
+    Returns the end of the last complete message in buf, starting from a
+    message boundary at offset, and whether it stopped at a header with an
+    invalid CRC, whose length cannot be trusted.
+    """
+    header_size = waggle.protocol.WAGGLE_PACKET_HEADER.size
+    end = len(buf)
+
+    while offset + PACKET_OVERHEAD <= end:
+        header_crc = waggle.protocol.UINT16.unpack_from(buf, offset + header_size)[0]
+
+        if waggle.protocol.crc16(buf[offset:offset + header_size]) != header_crc:
+            return offset, True
+
+        size = PACKET_OVERHEAD + waggle.protocol.UINT32.unpack_from(buf, offset + 4)[0]
+
+        if offset + size > end:
+            break
+
+        offset += size
+
+    return offset, False
+
+
+def split_messages(reader, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields chunks of at least chunk_size bytes of whole messages read from
+    reader, except for the last. As with read_messages, trailing incomplete
+    data is ignored. If a header is invalid, the rest of the buffered data is
+    yielded as is, so the error is raised when that chunk is processed.
+    """
+    read = getattr(reader, 'read1', reader.read)
+    buf = bytearray()
+    offset = 0
+
+    while True:
+        data = read(chunk_size)
+
+        if not data:
+            break
+
+        buf += data
+        offset, invalid = message_boundary(buf, offset)
+
+        if invalid:
+            if offset > 0:
+                yield bytes(buf[:offset])
+            yield bytes(buf[offset:])
+            return
+
+        if offset >= chunk_size:
+            yield bytes(buf[:offset])
+            del buf[:offset]
+            offset = 0
+
+    if offset > 0:
+        yield bytes(buf[:offset])
+
+
+def encode_json(handler, measurements):
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    return [encoder.encode(r) for r in waggle.plugin.processed_results(handler, measurements)]
+
+
+# handler and encode are set in each pool process by init_process
+handler = None
+encode = None
+
+
+def init_process(func, encode_func):
+    global handler, encode
+    handler = func
+    encode = encode_func
+
+
+def process_chunk(data):
+    measurements = waggle.plugin.measurements_in_message_data(data)
+    return encode(handler, measurements)
+
+
+def processed_chunks(func, reader, processes, encode_func=encode_json,
+                     chunk_size=DEFAULT_CHUNK_SIZE, max_pending=None):
+    """
+    Yields encode_func(func, measurements) for the measurements in each
+    chunk of messages read from reader, in order. Chunks are processed by a
+    pool of processes forked from the current one, so func need not be
+    picklable.
+    """
+    import multiprocessing
+
+    if max_pending is None:
+        max_pending = 2 * processes
+
+    context = multiprocessing.get_context('fork')
+    pool = context.Pool(processes, initializer=init_process, initargs=(func, encode_func))
+    pending = collections.deque()
+
+    try:
+        for data in split_messages(reader, chunk_size):
+            pending.append(pool.apply_async(process_chunk, (data,)))
+
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def processed_json(func, reader, processes, **kwargs):
+    """Yields the JSON encoded results of func over reader, in order."""
+    for results in processed_chunks(func, reader, processes, **kwargs):
+        yield from results
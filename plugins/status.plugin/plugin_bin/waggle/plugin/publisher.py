@@ -0,0 +1,408 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides a persistent, batching RabbitMQ publisher.
+
+A Publisher owns a single connection which is serviced by a background thread.
+Calls to publish only queue a message and return immediately. The I/O thread
+sends queued messages using asynchronous publisher confirms and keeps at most
+max_in_flight publishes unconfirmed at a time.
+
+Messages are only dropped from the publisher once the broker has confirmed
+them. If a publish is nacked or the connection is lost, the unconfirmed
+messages are put back at the head of the queue. Nacked messages are resent
+after a delay starting at min_nack_delay, and messages from a lost connection
+are resent once the connection has been reestablished. Both delays back off
+exponentially up to max_reconnect_delay.
+
+By default, messages are queued in memory. Passing a waggle.plugin.spool.Spool
+as queue stores them on disk instead, so they survive long outages and
+restarts.
+
+Each message is sent as its own AMQP publish by default. Setting
+max_batch_size coalesces consecutive queued messages into a single publish of
+up to that many bytes. Since waggle messages are self delimiting, this is
+transparent to consumers using waggle.protocol.unpack_messages, but consumers
+using unpack_message only see the first message of each publish, so it must
+only be enabled when all consumers of the exchange handle it.
+
+Example:
+
+```
+publisher = Publisher(parameters, exchange='messages')
+
+for message in messages:
+    publisher.publish(message)
+
+publisher.flush()
+print(publisher.get_metrics())
+publisher.close()
+```
+"""
+import collections
+import logging
+import threading
+import time
+import pika
+import pika.exceptions
+from pika.adapters.select_connection import IOLoop
+
+
+class MemoryQueue:
+    """
+    Holds messages waiting to be published. take removes a batch of
+    (data, timestamp) pairs to send, which are later either confirmed or
+    requeued at the head of the queue.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.queue = collections.deque()
+        self.unsent_bytes = 0
+        self.in_flight = 0
+
+    def __len__(self):
+        return len(self.queue) + self.in_flight
+
+    def full(self):
+        return len(self.queue) >= self.max_size
+
+    def append(self, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.queue.append((data, timestamp))
+        self.unsent_bytes += len(data)
+
+    def take(self, max_bytes):
+        batch = []
+        size = 0
+
+        while self.queue and (not batch or size + len(self.queue[0][0]) <= max_bytes):
+            item = self.queue.popleft()
+            batch.append(item)
+            size += len(item[0])
+
+        self.unsent_bytes -= size
+        self.in_flight += len(batch)
+        return batch
+
+    def confirm(self, batch):
+        self.in_flight -= len(batch)
+
+    def requeue(self, batch):
+        self.in_flight -= len(batch)
+        self.queue.extendleft(reversed(batch))
+        self.unsent_bytes += sum(len(data) for data, _ in batch)
+
+    def get_metrics(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class Publisher:
+
+    def __init__(self, parameters, exchange='messages', routing_key='',
+                 properties=None, max_in_flight=32, max_queue_size=100000,
+                 max_batch_size=0, batch_delay=0, min_reconnect_delay=1,
+                 max_reconnect_delay=60, min_nack_delay=0.1, queue=None):
+        self.logger = logging.getLogger('waggle.plugin.Publisher')
+
+        self.parameters = parameters
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.properties = properties or pika.BasicProperties(delivery_mode=2)
+        self.max_in_flight = max_in_flight
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self.batch_delay = batch_delay
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.min_nack_delay = min_nack_delay
+
+        # queue, in_flight and the metrics are shared with the I/O thread and
+        # must only be accessed while holding lock. in_flight maps delivery
+        # tags to the batch taken from the queue for that publish.
+        self.lock = threading.Condition()
+        self.queue = queue if queue is not None else MemoryQueue(max_queue_size)
+        self.in_flight = {}
+        self.flush_scheduled = False
+        self.closed = False
+
+        self.messages_published = 0
+        self.frames_published = 0
+        self.messages_nacked = 0
+        self.reconnects = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+
+        # connection state is only used by the I/O thread
+        self.connection = None
+        self.channel = None
+        self.delivery_tag = 0
+        self.reconnect_delay = min_reconnect_delay
+        self.nack_delay = min_nack_delay
+        self.paused = False
+        self.stopping = False
+
+        self.ioloop = IOLoop()
+        self.thread = threading.Thread(target=self.run, name='waggle-publisher', daemon=True)
+        self.thread.start()
+
+    def publish(self, body, timeout=None):
+        """
+        Queues body to be published. Blocks while the queue is full and raises
+        TimeoutError if it is still full after timeout seconds.
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('Publisher is closed.')
+
+            if not self.lock.wait_for(lambda: not self.queue.full(), timeout):
+                raise TimeoutError('Publisher queue is full.')
+
+            self.queue.append(body)
+
+            if self.flush_scheduled:
+                return
+
+            self.flush_scheduled = True
+
+        self.ioloop.add_callback_threadsafe(self.schedule_flush)
+
+    def flush(self, timeout=None):
+        """
+        Waits until all queued messages have been confirmed by the broker.
+        Returns False if this did not happen within timeout seconds.
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: self.closed or len(self.queue) == 0, timeout)
+            return len(self.queue) == 0
+
+    def close(self, timeout=None):
+        """
+        Flushes the queue for up to timeout seconds and then closes the
+        connection. Returns False if unconfirmed messages were left behind.
+        """
+        flushed = self.flush(timeout)
+
+        with self.lock:
+            if self.closed:
+                return flushed
+            self.closed = True
+
+        self.ioloop.add_callback_threadsafe(self.stop)
+        self.thread.join()
+
+        if not flushed:
+            self.logger.warning('Closed publisher with %d unconfirmed messages.', self.get_metrics()['queue_depth'])
+
+        with self.lock:
+            self.queue.close()
+
+        return flushed
+
+    def get_metrics(self):
+        with self.lock:
+            messages_confirmed = self.messages_published
+
+            metrics = {
+                'connected': self.channel is not None,
+                'queue_depth': len(self.queue),
+                'queue_bytes': self.queue.unsent_bytes,
+                'confirms_pending': len(self.in_flight),
+                'messages_published': self.messages_published,
+                'frames_published': self.frames_published,
+                'messages_nacked': self.messages_nacked,
+                'reconnects': self.reconnects,
+                'publish_latency_last': self.latency_last,
+                'publish_latency_max': self.latency_max,
+                'publish_latency_mean': self.latency_total / messages_confirmed if messages_confirmed else 0.0,
+            }
+
+            metrics.update(self.queue.get_metrics())
+            return metrics
+
+    # everything below runs on the I/O thread
+
+    def run(self):
+        self.connect()
+        self.ioloop.start()
+        self.ioloop.close()
+
+    def stop(self):
+        self.stopping = True
+
+        try:
+            self.connection.close()
+        except (AttributeError, pika.exceptions.ConnectionWrongStateError):
+            self.ioloop.stop()
+
+    def connect(self):
+        if self.stopping:
+            return
+
+        self.connection = pika.SelectConnection(
+            self.parameters,
+            on_open_callback=self.on_connection_open,
+            on_open_error_callback=self.on_connection_open_error,
+            on_close_callback=self.on_connection_closed,
+            custom_ioloop=self.ioloop)
+
+    def reconnect(self):
+        self.connection = None
+
+        if self.stopping:
+            self.ioloop.stop()
+            return
+
+        delay = self.reconnect_delay
+        self.reconnect_delay = min(2 * delay, self.max_reconnect_delay)
+
+        with self.lock:
+            self.reconnects += 1
+
+        self.logger.info('Reconnecting in %0.1fs.', delay)
+        self.ioloop.call_later(delay, self.connect)
+
+    def on_connection_open(self, connection):
+        connection.channel(on_open_callback=self.on_channel_open)
+
+    def on_connection_open_error(self, connection, error):
+        self.logger.warning('Failed to connect to broker: %s', error)
+        self.reconnect()
+
+    def on_connection_closed(self, connection, reason):
+        if not self.stopping:
+            self.logger.warning('Connection closed: %s', reason)
+
+        self.requeue_in_flight()
+        self.reconnect()
+
+    def on_channel_open(self, channel):
+        channel.add_on_close_callback(self.on_channel_closed)
+        channel.confirm_delivery(ack_nack_callback=self.on_delivery_confirmation,
+                                 callback=lambda frame: self.on_confirm_select_ok(channel))
+
+    def on_channel_closed(self, channel, reason):
+        if channel is not self.channel and self.channel is not None:
+            return
+
+        self.requeue_in_flight()
+
+        # the connection close callback takes care of reconnecting
+        if self.connection is not None and self.connection.is_open:
+            self.logger.warning('Channel closed: %s', reason)
+            self.connection.close()
+
+    def on_confirm_select_ok(self, channel):
+        self.reconnect_delay = self.min_reconnect_delay
+        self.delivery_tag = 0
+
+        with self.lock:
+            self.channel = channel
+
+        self.flush_queue()
+
+    def requeue_in_flight(self):
+        with self.lock:
+            self.channel = None
+
+            for delivery_tag in sorted(self.in_flight, reverse=True):
+                self.queue.requeue(self.in_flight.pop(delivery_tag))
+
+    def schedule_flush(self):
+        with self.lock:
+            delay = self.batch_delay if self.queue.unsent_bytes < self.max_batch_size else 0
+
+        if delay > 0:
+            self.ioloop.call_later(delay, self.flush_queue)
+        else:
+            self.flush_queue()
+
+    def flush_queue(self):
+        while True:
+            with self.lock:
+                self.flush_scheduled = False
+
+                if self.channel is None or self.paused or len(self.in_flight) >= self.max_in_flight:
+                    return
+
+                batch = self.queue.take(self.max_batch_size)
+
+                if not batch:
+                    return
+
+                self.delivery_tag += 1
+                self.in_flight[self.delivery_tag] = batch
+                self.frames_published += 1
+
+            self.channel.basic_publish(
+                exchange=self.exchange,
+                routing_key=self.routing_key,
+                properties=self.properties,
+                body=b''.join(body for body, _ in batch))
+
+    def on_delivery_confirmation(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        now = time.time()
+
+        with self.lock:
+            if method.multiple:
+                delivery_tags = sorted(tag for tag in self.in_flight if tag <= method.delivery_tag)
+            else:
+                delivery_tags = [method.delivery_tag]
+
+            # nacked batches are pushed back onto the head of the queue, so
+            # the newest goes first to preserve their order.
+            if not acked:
+                delivery_tags.reverse()
+
+            for delivery_tag in delivery_tags:
+                batch = self.in_flight.pop(delivery_tag, None)
+
+                if batch is None:
+                    continue
+
+                if not acked:
+                    self.messages_nacked += len(batch)
+                    self.queue.requeue(batch)
+                    continue
+
+                self.queue.confirm(batch)
+
+                for _, publish_time in batch:
+                    latency = now - publish_time
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                    self.latency_last = latency
+
+                self.messages_published += len(batch)
+
+            self.lock.notify_all()
+
+        if acked:
+            self.nack_delay = self.min_nack_delay
+            self.flush_queue()
+            return
+
+        # a broker which keeps nacking, for example because a queue is full,
+        # must not be sent the same messages again in a tight loop.
+        if not self.paused:
+            delay = self.nack_delay
+            self.nack_delay = min(2 * delay, self.max_reconnect_delay)
+            self.paused = True
+            self.logger.warning('Broker nacked delivery %d. Resending messages in %0.1fs.',
+                                method.delivery_tag, delay)
+            self.ioloop.call_later(delay, self.resume)
+
+    def resume(self):
+        self.paused = False
+        self.flush_queue()
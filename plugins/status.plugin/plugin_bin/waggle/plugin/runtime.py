@@ -0,0 +1,247 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides an asyncio based runtime which lets one process drive
+several sensors, timers and the publisher concurrently instead of running a
+blocking loop per plugin.
+
+Sensor readers are coroutines added with add. Periodic jobs are added with
+every, which schedules them against absolute deadlines so they do not drift
+and skips runs which were missed entirely. Plain functions passed to every run
+in a worker thread, so blocking calls do not stall the other tasks. Serial
+devices are opened as async streams with open_serial.
+
+All Plugin instances in a process share one publisher and broker connection,
+and publishing only queues messages, so coroutines can publish directly.
+
+If any task fails, the runtime cancels the others and run raises the error,
+so the process exits and is restarted like a plugin with a blocking loop.
+SIGINT and SIGTERM stop the runtime cleanly.
+
+Example:
+
+```
+import waggle.plugin
+from waggle.plugin.runtime import Runtime, open_serial
+
+runtime = Runtime()
+plugin = waggle.plugin.Plugin()
+
+async def read_sensor():
+    stream = await open_serial('/dev/ttyACM0', 115200)
+
+    while True:
+        line = await stream.readline()
+        plugin.add_measurement({'sensor_id': 1, 'parameter_id': 0, 'value': line})
+        plugin.publish_measurements()
+
+def publish_status():
+    plugin.add_measurement({'sensor_id': 2, 'parameter_id': 0, 'value': read_status()})
+    plugin.publish_measurements()
+
+runtime.add(read_sensor)
+runtime.every(60, publish_status)
+runtime.run()
+```
+"""
+import asyncio
+import logging
+import math
+import os
+import signal
+
+
+class Runtime:
+
+    def __init__(self, loop=None):
+        self.logger = logging.getLogger('waggle.plugin.Runtime')
+        self.loop = loop or asyncio.new_event_loop()
+        self.jobs = []
+        self.stopped = None
+
+    def add(self, func, *args):
+        """Adds a coroutine function to be run as a task when the runtime starts."""
+        self.jobs.append((func, args))
+
+    def every(self, interval, func, *args, delay=0):
+        """
+        Calls func every interval seconds, starting after delay seconds. func
+        may be a coroutine function, which is awaited, or a plain function,
+        which is run in a worker thread.
+        """
+        self.add(self.run_periodic, interval, func, args, delay)
+
+    async def call(self, func, *args):
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args)
+        return await self.loop.run_in_executor(None, func, *args)
+
+    async def run_periodic(self, interval, func, args, delay):
+        deadline = self.loop.time() + delay
+
+        while True:
+            await asyncio.sleep(max(0, deadline - self.loop.time()))
+            await self.call(func, *args)
+
+            deadline += interval
+            now = self.loop.time()
+
+            if deadline < now:
+                missed = math.ceil((now - deadline) / interval)
+                self.logger.warning('%s overran its interval. Skipping %d runs.', func.__name__, missed)
+                deadline += missed * interval
+
+    def stop(self):
+        if self.stopped is not None and not self.stopped.done():
+            self.stopped.set_result(None)
+
+    async def main(self):
+        self.stopped = self.loop.create_future()
+        tasks = [self.loop.create_task(func(*args)) for func, args in self.jobs]
+
+        try:
+            pending = set(tasks) | {self.stopped}
+
+            while not self.stopped.done():
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task is not self.stopped and task.exception() is not None:
+                        raise task.exception()
+
+                if pending == {self.stopped}:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            if tasks:
+                await asyncio.wait(tasks)
+
+    def run(self):
+        """Runs all tasks until they finish, one fails or the runtime is stopped."""
+        asyncio.set_event_loop(self.loop)
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.stop)
+
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                self.loop.remove_signal_handler(signum)
+
+
+class SerialStream:
+    """
+    Async stream over an open serial port. Reads are served by an
+    asyncio.StreamReader which is fed whenever the port's file descriptor is
+    readable. Writes are buffered and sent when the port is writable.
+    """
+
+    def __init__(self, port, loop):
+        self.port = port
+        self.loop = loop
+        self.fd = port.fileno()
+        self.reader = asyncio.StreamReader()
+        self.write_buffer = bytearray()
+        self.drained = None
+        self.loop.add_reader(self.fd, self.on_readable)
+
+    def on_readable(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self.loop.remove_reader(self.fd)
+            self.reader.set_exception(exc)
+            return
+
+        if not data:
+            self.loop.remove_reader(self.fd)
+            self.reader.feed_eof()
+            return
+
+        self.reader.feed_data(data)
+
+    async def read(self, n=-1):
+        return await self.reader.read(n)
+
+    async def readexactly(self, n):
+        return await self.reader.readexactly(n)
+
+    async def readuntil(self, separator=b'\n'):
+        return await self.reader.readuntil(separator)
+
+    async def readline(self):
+        return await self.reader.readline()
+
+    def write(self, data):
+        if not self.write_buffer:
+            try:
+                n = os.write(self.fd, data)
+            except BlockingIOError:
+                n = 0
+
+            data = data[n:]
+
+            if not data:
+                return
+
+            self.loop.add_writer(self.fd, self.on_writable)
+
+        self.write_buffer.extend(data)
+
+    def on_writable(self):
+        try:
+            n = os.write(self.fd, self.write_buffer)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self.write_buffer.clear()
+            self.loop.remove_writer(self.fd)
+            self.set_drained(exc)
+            return
+
+        del self.write_buffer[:n]
+
+        if not self.write_buffer:
+            self.loop.remove_writer(self.fd)
+            self.set_drained(None)
+
+    def set_drained(self, exc):
+        if self.drained is None or self.drained.done():
+            return
+        if exc is None:
+            self.drained.set_result(None)
+        else:
+            self.drained.set_exception(exc)
+
+    async def drain(self):
+        """Waits until all written data has been sent to the port."""
+        if not self.write_buffer:
+            return
+        if self.drained is None or self.drained.done():
+            self.drained = self.loop.create_future()
+        await self.drained
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.port.close()
+
+
+async def open_serial(device, baudrate, **kwargs):
+    """
+    Opens a serial device as a SerialStream. Extra keyword arguments are passed
+    to serial.Serial.
+    """
+    import serial
+
+    port = serial.Serial(device, baudrate, timeout=0, write_timeout=0, **kwargs)
+    return SerialStream(port, asyncio.get_event_loop())
@@ -0,0 +1,405 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides a disk backed store-and-forward queue for publishers.
+
+A Spool is a directory of fixed size, memory mapped segment files which
+messages are appended to, along with a small cursor file recording the oldest
+unconfirmed message. Once a segment is full, a new one is started. When the
+total size of the segments exceeds max_size, the oldest segment is deleted
+along with any messages it still holds, so the newest data is kept through
+long outages.
+
+Each record is stored as a header followed by the message:
+
+```
+length    uint32  message length
+crc       uint32  crc32 of the length, timestamp and message
+timestamp float64 time message was added
+message   bytes   message data
+```
+
+Segments are zero filled when created, which never passes the CRC check, so
+a process crash part way through an append only loses that record. When a
+spool is reopened, records after the cursor are replayed in order. Appends
+are written to the page cache, so they survive a process crash. Passing
+sync=True also flushes every append to disk, which protects against power
+loss at the cost of a much slower append.
+
+A Spool has the same interface as the Publisher's in memory queue and is not
+thread safe by itself. Publisher calls it while holding its own lock.
+
+Example:
+
+```
+spool = Spool('/wagglerw/waggle/spool/plugin-37-0')
+publisher = Publisher(parameters, queue=spool)
+```
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+RECORD_HEADER = struct.Struct('>IId')
+LENGTH_TIMESTAMP = struct.Struct('>Id')
+
+# sequence, segment, offset, crc
+CURSOR_SLOT = struct.Struct('>QQQI')
+
+Position = namedtuple('Position', ['index', 'segment', 'offset'])
+
+
+def record_crc(length, timestamp, data):
+    return zlib.crc32(data, zlib.crc32(LENGTH_TIMESTAMP.pack(length, timestamp)))
+
+
+def segment_name(seq):
+    return '{:016d}.seg'.format(seq)
+
+
+class Segment:
+
+    def __init__(self, path, seq, first_index):
+        self.path = path
+        self.seq = seq
+        self.first_index = first_index
+        self.count = 0
+        self.end = 0
+
+        with open(path, 'r+b') as file:
+            self.size = os.fstat(file.fileno()).st_size
+            self.map = mmap.mmap(file.fileno(), self.size)
+
+    @classmethod
+    def create(cls, path, seq, first_index, size):
+        with open(path, 'wb') as file:
+            file.truncate(size)
+        return cls(path, seq, first_index)
+
+    def read(self, offset):
+        """
+        Returns the record at offset as (data, timestamp, next_offset) or None
+        if there is no valid record there.
+        """
+        if offset + RECORD_HEADER.size > self.size:
+            return None
+
+        length, crc, timestamp = RECORD_HEADER.unpack_from(self.map, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+
+        if end > self.size:
+            return None
+
+        data = self.map[start:end]
+
+        if crc != record_crc(length, timestamp, data):
+            return None
+
+        return data, timestamp, end
+
+    def scan(self):
+        """Finds the end of the valid records and zeroes everything after it."""
+        offset = 0
+
+        while True:
+            record = self.read(offset)
+            if record is None:
+                break
+            offset = record[2]
+            self.count += 1
+
+        self.end = offset
+        self.map[offset:] = bytes(self.size - offset)
+
+    def append(self, data, timestamp):
+        length = len(data)
+        start = self.end + RECORD_HEADER.size
+        end = start + length
+        self.map[start:end] = data
+        RECORD_HEADER.pack_into(self.map, self.end, length, record_crc(length, timestamp, data), timestamp)
+        self.end = end
+        self.count += 1
+
+    def close(self):
+        self.map.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+class SpoolBatch(list):
+    """List of (data, timestamp) pairs along with their position in the spool."""
+
+    def __init__(self, start, end, items):
+        super().__init__(items)
+        self.start = start
+        self.end = end
+        self.confirmed = False
+
+
+class Spool:
+
+    def __init__(self, path, segment_size=4 * 1024 * 1024, max_size=256 * 1024 * 1024, sync=False):
+        self.logger = logging.getLogger('waggle.plugin.Spool')
+        self.path = path
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.sync = sync
+
+        self.segments = []
+        self.in_flight = []
+        self.requeued = []
+        self.evicted = 0
+
+        os.makedirs(path, exist_ok=True)
+        self.open_cursor()
+        self.open_segments()
+
+    def open_cursor(self):
+        path = os.path.join(self.path, 'cursor')
+
+        if not os.path.exists(path):
+            with open(path, 'wb') as file:
+                file.write(bytes(2 * CURSOR_SLOT.size))
+
+        with open(path, 'r+b') as file:
+            self.cursor_map = mmap.mmap(file.fileno(), 2 * CURSOR_SLOT.size)
+
+        self.cursor_seq = 0
+        self.cursor_segment = 0
+        self.cursor_offset = 0
+
+        # the cursor is written alternately to two slots, so a torn write
+        # leaves the previous cursor intact.
+        for slot in range(2):
+            seq, segment, offset, crc = CURSOR_SLOT.unpack_from(self.cursor_map, slot * CURSOR_SLOT.size)
+
+            if crc != zlib.crc32(CURSOR_SLOT.pack(seq, segment, offset, 0)):
+                continue
+
+            if seq >= self.cursor_seq:
+                self.cursor_seq = seq
+                self.cursor_segment = segment
+                self.cursor_offset = offset
+
+    def write_cursor(self, segment, offset):
+        self.cursor_seq += 1
+        crc = zlib.crc32(CURSOR_SLOT.pack(self.cursor_seq, segment, offset, 0))
+        CURSOR_SLOT.pack_into(self.cursor_map, (self.cursor_seq % 2) * CURSOR_SLOT.size,
+                              self.cursor_seq, segment, offset, crc)
+
+        if self.sync:
+            self.cursor_map.flush()
+
+    def open_segments(self):
+        seqs = sorted(int(name[:-4]) for name in os.listdir(self.path) if name.endswith('.seg'))
+        index = 0
+
+        for seq in seqs:
+            path = os.path.join(self.path, segment_name(seq))
+
+            if seq < self.cursor_segment:
+                os.remove(path)
+                continue
+
+            segment = Segment(path, seq, index)
+            segment.scan()
+            self.segments.append(segment)
+            index += segment.count
+
+        if not self.segments:
+            self.add_segment(max(self.cursor_segment, 0), 0)
+
+        first = self.segments[0]
+
+        if first.seq != self.cursor_segment:
+            self.commit = Position(first.first_index, first.seq, 0)
+        else:
+            self.commit = self.find_position(first, self.cursor_offset)
+
+        self.read = self.commit
+
+    def find_position(self, segment, offset):
+        # records are variable length, so the index is found by walking the
+        # segment up to offset.
+        index = segment.first_index
+        pos = 0
+
+        while pos < offset and pos < segment.end:
+            pos = segment.read(pos)[2]
+            index += 1
+
+        return Position(index, segment.seq, pos)
+
+    def add_segment(self, seq, first_index, size=None):
+        path = os.path.join(self.path, segment_name(seq))
+        segment = Segment.create(path, seq, first_index, size or self.segment_size)
+        self.segments.append(segment)
+        return segment
+
+    def get_segment(self, seq):
+        for segment in self.segments:
+            if segment.seq == seq:
+                return segment
+        return None
+
+    @property
+    def next_index(self):
+        last = self.segments[-1]
+        return last.first_index + last.count
+
+    def __len__(self):
+        return self.next_index - self.commit.index
+
+    @property
+    def unsent_bytes(self):
+        total = 0
+
+        for segment in self.segments:
+            if segment.seq == self.read.segment:
+                total += segment.end - self.read.offset
+            elif segment.seq > self.read.segment:
+                total += segment.end
+
+        return total + sum(RECORD_HEADER.size + len(data) for batch in self.requeued for data, _ in batch)
+
+    def full(self):
+        return False
+
+    def append(self, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        segment = self.segments[-1]
+
+        if segment.end + RECORD_HEADER.size + len(data) > segment.size:
+            segment = self.rotate(RECORD_HEADER.size + len(data))
+
+        segment.append(data, timestamp)
+
+        if self.sync:
+            segment.map.flush()
+
+    def rotate(self, record_size):
+        last = self.segments[-1]
+        last.map.flush()
+
+        segment = self.add_segment(last.seq + 1, last.first_index + last.count,
+                                   max(self.segment_size, record_size))
+
+        while len(self.segments) > 1 and sum(s.size for s in self.segments) > self.max_size:
+            self.evict()
+
+        return segment
+
+    def evict(self):
+        segment = self.segments.pop(0)
+        next_segment = self.segments[0]
+        start = Position(next_segment.first_index, next_segment.seq, 0)
+
+        lost = max(0, next_segment.first_index - self.commit.index)
+
+        if lost:
+            self.evicted += lost
+            self.logger.warning('Spool is full. Dropped %d oldest messages.', lost)
+
+        if self.commit < start:
+            self.commit = start
+            self.write_cursor(start.segment, start.offset)
+
+        if self.read < start:
+            self.read = start
+
+        self.in_flight = [batch for batch in self.in_flight if batch.start >= start]
+        self.requeued = [batch for batch in self.requeued if batch.start >= start]
+        segment.remove()
+
+    def take(self, max_bytes):
+        # requeued batches are sent again, oldest first, before any new ones
+        if self.requeued:
+            return self.requeued.pop(0)
+
+        items = []
+        size = 0
+        start = self.read
+        index, seq, offset = self.read
+        segment = self.get_segment(seq)
+
+        while True:
+            if offset >= segment.end:
+                if segment is self.segments[-1]:
+                    break
+                segment = self.segments[self.segments.index(segment) + 1]
+                offset = 0
+                continue
+
+            length = RECORD_HEADER.unpack_from(segment.map, offset)[0]
+
+            if items and size + length > max_bytes:
+                break
+
+            data, timestamp, offset = segment.read(offset)
+            items.append((data, timestamp))
+            size += length
+            index += 1
+
+        self.read = Position(index, segment.seq, offset)
+
+        batch = SpoolBatch(start, self.read, items)
+
+        if batch:
+            self.in_flight.append(batch)
+
+        return batch
+
+    def confirm(self, batch):
+        batch.confirmed = True
+        commit = self.commit
+
+        while self.in_flight and self.in_flight[0].confirmed:
+            commit = self.in_flight.pop(0).end
+
+        if commit == self.commit:
+            return
+
+        self.commit = commit
+        self.write_cursor(commit.segment, commit.offset)
+
+        while self.segments[0].seq < commit.segment:
+            self.segments.pop(0).remove()
+
+    def requeue(self, batch):
+        # batches are lists, so they are compared by identity
+        if not any(b is batch for b in self.in_flight) or any(b is batch for b in self.requeued):
+            return
+
+        # only the requeued batch is sent again. it keeps its place in
+        # in_flight, so once it is confirmed, the commit moves past any later
+        # batches which were already confirmed.
+        self.requeued.append(batch)
+        self.requeued.sort(key=lambda b: b.start)
+
+    def get_metrics(self):
+        return {
+            'spool_segments': len(self.segments),
+            'spool_bytes': sum(segment.size for segment in self.segments),
+            'spool_evicted': self.evicted,
+        }
+
+    def close(self):
+        for segment in self.segments:
+            segment.map.flush()
+            segment.close()
+
+        self.cursor_map.flush()
+        self.cursor_map.close()
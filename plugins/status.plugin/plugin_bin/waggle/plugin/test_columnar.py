@@ -0,0 +1,138 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import json
+import math
+import os
+import tempfile
+import unittest
+from io import BytesIO, StringIO
+import numpy as np
+import waggle.protocol
+import waggle.plugin
+from waggle.plugin.columnar import ColumnReader
+
+
+def make_message_data(num_messages):
+    return b''.join(waggle.protocol.pack_message({
+        'sender_id': '{:016x}'.format(i % 3),
+        'body': waggle.protocol.pack_datagram({
+            'body': waggle.protocol.pack_sensorgrams([
+                {'timestamp': 1000 + i, 'sensor_id': 1, 'parameter_id': 0, 'value': i},
+                {'timestamp': 1000 + i, 'sensor_id': 2, 'parameter_id': 1, 'value': b'\x00\x01'},
+                {'timestamp': 1000 + i, 'sensor_id': 3, 'parameter_id': 2, 'value': 'text'},
+            ]),
+        }),
+    }) for i in range(num_messages))
+
+
+def handler(message, datagram, sensorgram):
+    yield {
+        'subsystem': 'test',
+        'sensor': sensorgram['sensor_id'],
+        'parameter': 'p{}'.format(sensorgram['parameter_id']),
+        'value_raw': sensorgram['value'],
+        'value_hrf': sensorgram['value'] * 2 if sensorgram['sensor_id'] == 1 else sensorgram['value'],
+    }
+
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'columns')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, data, processes=1):
+        waggle.plugin.start_processing_measurements(handler, BytesIO(data), ndjson=False,
+                                                    processes=processes, columnar=self.path)
+
+    def expected(self, data):
+        writer = StringIO()
+        waggle.plugin.start_processing_measurements(handler, BytesIO(data), writer, ndjson=False)
+        results = json.loads(writer.getvalue())
+        nodes = [m['sender_id'] for m in waggle.protocol.unpack_messages(data) for _ in range(3)]
+        return results, nodes
+
+    def check(self, data):
+        results, nodes = self.expected(data)
+        columns = ColumnReader(self.path)
+
+        self.assertEqual(len(columns), len(results))
+        self.assertEqual(columns['timestamp'].tolist(), [r['timestamp'] for r in results])
+        self.assertEqual(columns.strings('node_id').tolist(), nodes)
+        self.assertEqual(columns.strings('subsystem').tolist(), ['test'] * len(results))
+        self.assertEqual(columns.strings('sensor').tolist(), [str(r['sensor']) for r in results])
+        self.assertEqual(columns.strings('parameter').tolist(), [r['parameter'] for r in results])
+
+        for name in ['value_raw', 'value_hrf']:
+            values = columns[name]
+            texts = columns.strings(name + '_text')
+
+            for r, value, text in zip(results, values, texts):
+                if text == '':
+                    self.assertEqual(str(int(value)), r[name])
+                else:
+                    self.assertTrue(math.isnan(value))
+                    self.assertEqual(text, r[name])
+
+    def test_write_read(self):
+        data = make_message_data(20)
+        self.write(data)
+        self.check(data)
+
+        columns = ColumnReader(self.path)
+        self.assertIsInstance(columns['value_raw'], np.memmap)
+        self.assertEqual(columns['sensor'].dtype, np.dtype('<u4'))
+        self.assertEqual(len(columns.dictionary('sensor')), 3)
+
+        with self.assertRaises(ValueError):
+            columns.dictionary('timestamp')
+
+    def test_append(self):
+        data = make_message_data(20)
+        self.write(data[:len(data) // 2])
+        self.write(data[len(data) // 2:])
+        self.check(data)
+
+        # dictionaries are shared across appends
+        self.assertEqual(len(ColumnReader(self.path).dictionary('node_id')), 3)
+
+    def test_parallel(self):
+        data = make_message_data(50)
+        self.write(data, processes=3)
+        self.check(data)
+
+    def test_interrupted_write(self):
+        data = make_message_data(20)
+        self.write(data)
+
+        # simulate a write interrupted in the middle of a row
+        with open(os.path.join(self.path, 'value_hrf.bin'), 'ab') as file:
+            file.write(b'\x00' * 8)
+
+        with open(os.path.join(self.path, 'timestamp.bin'), 'ab') as file:
+            file.write(b'\x00' * 3)
+
+        with open(os.path.join(self.path, 'sensor.dict'), 'a') as file:
+            file.write('"partial')
+
+        self.assertEqual(len(ColumnReader(self.path)), 60)
+
+        self.write(data)
+        self.check(data + data)
+
+    def test_empty(self):
+        self.write(b'')
+        columns = ColumnReader(self.path)
+        self.assertEqual(len(columns), 0)
+        self.assertEqual(columns.strings('node_id').tolist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
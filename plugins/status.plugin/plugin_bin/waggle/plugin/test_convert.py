@@ -0,0 +1,183 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import random
+import unittest
+from io import BytesIO, StringIO
+import waggle.protocol
+import waggle.plugin
+from waggle.plugin.convert import ConversionTable, no_conversion, round_array, round_floats
+
+
+def scale(x):
+    return 2 * x
+
+
+def scale_array(x):
+    return 2 * x
+
+
+def inverse(x):
+    return 1 / x
+
+
+def inverse_array(x):
+    return 1 / x
+
+
+def offset(x):
+    return x + 1
+
+
+table = ConversionTable({
+    1: scale,
+    2: inverse,
+    (2, 1): offset,
+}, vectorized={
+    1: scale_array,
+    2: inverse_array,
+})
+
+
+def make_message_data(num_messages):
+    return b''.join(waggle.protocol.pack_message({
+        'sender_id': '{:016x}'.format(i % 3),
+        'body': waggle.protocol.pack_datagram({
+            'body': waggle.protocol.pack_sensorgrams([
+                {'timestamp': 1000 + i, 'sensor_id': 1, 'parameter_id': 0, 'value': i},
+                {'timestamp': 1000 + i, 'sensor_id': 2, 'parameter_id': 1, 'value': i},
+                {'timestamp': 1000 + i, 'sensor_id': 3, 'parameter_id': 0, 'value': 'text'},
+            ]),
+        }),
+    }) for i in range(num_messages))
+
+
+def handler(message, datagram, sensorgram):
+    yield {
+        'sensor': sensorgram['sensor_id'],
+        'value_raw': sensorgram['value'],
+        'value_hrf': table.convert(sensorgram['sensor_id'], sensorgram['parameter_id'], sensorgram['value']),
+    }
+
+
+def process_batch(measurements):
+    converted = table.convert_batch([sensorgram['sensor_id'] for _, _, sensorgram in measurements],
+                                    [sensorgram['parameter_id'] for _, _, sensorgram in measurements],
+                                    [sensorgram['value'] for _, _, sensorgram in measurements])
+
+    return [[{
+        'sensor': sensorgram['sensor_id'],
+        'value_raw': sensorgram['value'],
+        'value_hrf': value_hrf,
+    }] for (_, _, sensorgram), value_hrf in zip(measurements, converted)]
+
+
+batch_handler = waggle.plugin.BatchHandler(process_batch, batch_size=7)
+
+
+def process_columns(measurements):
+    sensorgrams = [sensorgram for _, _, sensorgram in measurements]
+    sensor_ids = waggle.plugin.field_column(sensorgrams, 'sensor_id')
+    values = waggle.plugin.field_column(sensorgrams, 'value')
+
+    return {
+        'sensor': sensor_ids,
+        'value_raw': values,
+        'value_hrf': table.convert_batch(sensor_ids, waggle.plugin.field_column(sensorgrams, 'parameter_id'), values),
+    }
+
+
+column_handler = waggle.plugin.BatchHandler(process_columns, batch_size=7, columns=True)
+
+
+def process(handler, data):
+    writer = StringIO()
+    waggle.plugin.start_processing_measurements(handler, BytesIO(data), writer, ndjson=True)
+    return writer.getvalue()
+
+
+class TestConvert(unittest.TestCase):
+
+    def test_lookup(self):
+        self.assertEqual(table.lookup(1, 3), (scale, scale_array))
+        self.assertEqual(table.lookup(2, 0), (inverse, inverse_array))
+        self.assertEqual(table.lookup(2, 1), (offset, None))
+        self.assertEqual(table.lookup(3, 0), (no_conversion, None))
+        self.assertEqual(table.convert(2, 1, 10), 11)
+
+    def test_convert_batch(self):
+        sensor_ids = [random.choice([1, 2, 3]) for _ in range(1000)]
+        parameter_ids = [random.choice([0, 1]) for _ in range(1000)]
+        values = [random.randint(1, 1000) for _ in range(1000)]
+
+        self.assertEqual(table.convert_batch(sensor_ids, parameter_ids, values),
+                         [table.convert(*item) for item in zip(sensor_ids, parameter_ids, values)])
+
+        self.assertEqual(table.convert_batch([], [], []), [])
+        self.assertEqual(table.convert_batch([1], [0], [5]), [10])
+
+        # numeric values are sorted as an array, but keep their Python types
+        for values in [[1.5, 2.5, 3.5], [2**70, 1, 2], [True, 2, 3]]:
+            converted = table.convert_batch([1, 3, 3], [0, 0, 0], values)
+            self.assertEqual(converted, [2 * values[0]] + values[1:])
+            self.assertEqual([type(x) for x in converted[1:]], [type(x) for x in values[1:]])
+
+    def test_non_numeric_values(self):
+        values = [1, 'a', b'b', 2.5]
+        self.assertEqual(table.convert_batch([1, 1, 1, 1], [0, 0, 0, 0], values), [2, 'aa', b'bb', 5.0])
+        self.assertEqual(table.convert_batch([3, 3], [0, 0], [[1, 2], 'a']), [[1, 2], 'a'])
+
+    def test_scalar_errors(self):
+        # the vectorized inverse returns inf, so the scalar error is raised
+        with self.assertRaises(ZeroDivisionError):
+            table.convert_batch([2, 2, 2], [0, 0, 0], [4, 0, 2])
+
+        self.assertEqual(table.convert_batch([2, 2], [0, 0], [4, 2]), [0.25, 0.5])
+
+    def test_batch_handler(self):
+        data = make_message_data(20)
+        self.assertEqual(process(batch_handler, data), process(handler, data))
+
+        message, datagram, sensorgram = next(waggle.plugin.measurements_in_message_data(data))
+        self.assertEqual(list(batch_handler(message, datagram, sensorgram)),
+                         list(handler(message, datagram, sensorgram)))
+
+    def test_column_handler(self):
+        data = make_message_data(20)
+        self.assertEqual(process(column_handler, data), process(handler, data))
+
+        measurements = list(waggle.plugin.measurements_in_message_data(data))
+        self.assertEqual([r for _, _, r in waggle.plugin.handler_results(column_handler, measurements)],
+                         [r for m in measurements for r in handler(*m)])
+
+        message, datagram, sensorgram = measurements[0]
+        self.assertEqual(list(column_handler(message, datagram, sensorgram)),
+                         list(handler(message, datagram, sensorgram)))
+
+    def test_field_column(self):
+        sensorgrams = [sensorgram for _, _, sensorgram in waggle.plugin.measurements_in_message_data(
+            make_message_data(3))]
+        self.assertEqual(waggle.plugin.field_column(sensorgrams, 'sensor_id'), [1, 2, 3] * 3)
+        self.assertEqual(waggle.plugin.field_column([dict(s) for s in sensorgrams], 'sensor_id'), [1, 2, 3] * 3)
+
+        with self.assertRaises(KeyError):
+            waggle.plugin.field_column(sensorgrams, 'copy')
+
+    def test_round(self):
+        # values where rounding the scaled value gives a different last digit
+        values = [2.675, 1.005, 0.125, -0.125, 0.285, 1e300, float('nan'), 123.456789]
+        values += [random.uniform(-1000, 1000) for _ in range(1000)]
+
+        for digits in [0, 2, 3]:
+            self.assertEqual(repr(round_array(values, digits).tolist()),
+                             repr([round(x, digits) for x in values]))
+
+        self.assertEqual(round_floats([1, 2.3456, 'a', True], 2), [1, 2.35, 'a', True])
+        self.assertEqual(round_floats([1, 2], 2), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import multiprocessing
+import tempfile
+import unittest
+import numpy as np
+from waggle.plugin.framebus import FrameBusReader, FrameBusWriter, frame_bus_path
+
+
+def make_image(seed, height=48, width=64):
+    return np.random.RandomState(seed).randint(0, 256, (height, width, 3)).astype(np.uint8)
+
+
+def read_sum(path, queue):
+    reader = FrameBusReader(path)
+    ok, frame = reader.read(timeout=5)
+    queue.put((frame.sequence, int(frame.image.sum()), frame.headers))
+    frame.release()
+    reader.close()
+
+
+class FrameBusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = frame_bus_path('test', directory=self.tmpdir.name)
+        self.closers = []
+
+    def tearDown(self):
+        for obj in self.closers:
+            obj.close()
+        self.tmpdir.cleanup()
+
+    def open_writer(self, **kwargs):
+        kwargs.setdefault('levels', 2)
+        writer = FrameBusWriter(self.path, 48, 64, **kwargs)
+        self.closers.append(writer)
+        return writer
+
+    def open_reader(self, **kwargs):
+        reader = FrameBusReader(self.path, **kwargs)
+        self.closers.append(reader)
+        return reader
+
+    def test_publish_and_acquire(self):
+        writer = self.open_writer()
+        reader = self.open_reader()
+        self.assertIsNone(reader.acquire())
+
+        image = make_image(0)
+        self.assertEqual(writer.publish(image, headers={'image_format': 'MJPG'}, timestamp=10.0), 1)
+
+        with reader.acquire() as frame:
+            self.assertEqual(frame.sequence, 1)
+            self.assertEqual(frame.timestamp, 10.0)
+            self.assertEqual(frame.headers, {'image_format': 'MJPG'})
+            self.assertEqual(frame.image.tolist(), image.tolist())
+            self.assertFalse(frame.image.flags.owndata)
+
+            with self.assertRaises(ValueError):
+                frame.image[0, 0, 0] = 1
+
+        self.assertIsNone(reader.acquire(after=1))
+
+    def test_smaller_frame_and_pyramid(self):
+        writer = self.open_writer()
+        reader = self.open_reader()
+
+        image = make_image(1, 30, 42)
+        writer.publish(image)
+
+        expected = image.astype(int)
+        for level in range(3):
+            with reader.acquire(level=level) as frame:
+                self.assertEqual(frame.image.tolist(), expected.tolist())
+
+            h, w = expected.shape[0] // 2, expected.shape[1] // 2
+            expected = expected[:2 * h, :2 * w].reshape(h, 2, w, 2, 3).sum(axis=(1, 3))
+            expected = (expected + 2) // 4
+
+        with self.assertRaises(ValueError):
+            reader.acquire(level=3)
+
+    def test_held_frames_are_kept(self):
+        writer = self.open_writer(slots=3)
+        reader = self.open_reader()
+
+        image = make_image(2)
+        writer.publish(image)
+        held = reader.acquire()
+
+        # the held slot is skipped, and once the other two slots are taken by
+        # a held frame and the latest frame there is no free slot.
+        writer.publish(make_image(3))
+        other = reader.acquire()
+        writer.publish(make_image(4))
+        self.assertIsNone(writer.publish(make_image(5)))
+        self.assertEqual(held.image.tolist(), image.tolist())
+
+        held.release()
+        self.assertEqual(writer.publish(make_image(5)), 4)
+        other.release()
+
+    def test_stale_frames_are_reused(self):
+        writer = self.open_writer(slots=2, stale_after=-1)
+        reader = self.open_reader()
+
+        writer.publish(make_image(6))
+        reader.acquire()
+        writer.publish(make_image(7))
+        self.assertEqual(writer.publish(make_image(8)), 3)
+
+    def test_read(self):
+        reader = self.open_reader(poll_interval=0.001)
+        self.assertEqual(reader.read(timeout=0), (False, ''))
+
+        writer = self.open_writer()
+        writer.publish(make_image(9))
+
+        ok, frame = reader.read(timeout=0)
+        self.assertTrue(ok)
+        self.assertEqual(frame.sequence, 1)
+        frame.release()
+        self.assertEqual(reader.read(timeout=0), (False, ''))
+
+        # a new bus replaces the old one and is attached on the next read
+        writer = self.open_writer()
+        writer.publish(make_image(10))
+        ok, frame = reader.read(timeout=0)
+        self.assertTrue(ok)
+        self.assertEqual(frame.image.tolist(), make_image(10).tolist())
+        frame.release()
+
+    def test_other_process(self):
+        writer = self.open_writer()
+        image = make_image(11)
+        writer.publish(image, headers={'device': 'bottom'})
+
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        process = context.Process(target=read_sum, args=(self.path, queue))
+        process.start()
+        result = queue.get(timeout=10)
+        process.join()
+
+        self.assertEqual(result, (1, int(image.sum()), {'device': 'bottom'}))
+
+    def test_invalid_frames(self):
+        writer = self.open_writer(headers_size=16)
+
+        with self.assertRaises(ValueError):
+            writer.publish(make_image(12, 49, 64))
+        with self.assertRaises(ValueError):
+            writer.publish(np.zeros((48, 64, 4), dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            writer.publish(make_image(12), headers={'image_format': 'MJPG'})
+
+
+if __name__ == '__main__':
+    unittest.main()
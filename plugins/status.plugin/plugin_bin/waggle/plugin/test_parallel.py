@@ -0,0 +1,87 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import unittest
+from io import BytesIO, StringIO
+import waggle.protocol
+import waggle.plugin
+from waggle.plugin.parallel import processed_chunks, split_messages
+
+
+def make_message_data(num_messages, num_sensorgrams):
+    return b''.join(waggle.protocol.pack_message({
+        'sender_id': '{:016x}'.format(i % 7),
+        'body': waggle.protocol.pack_datagram({
+            'body': waggle.protocol.pack_sensorgrams([
+                {'timestamp': 1000 + i, 'sensor_id': j, 'parameter_id': 0, 'value': j}
+                for j in range(num_sensorgrams)
+            ]),
+        }),
+    }) for i in range(num_messages))
+
+
+def handler(message, datagram, sensorgram):
+    yield {
+        'node': message['sender_id'],
+        'sensor': sensorgram['sensor_id'],
+        'value_raw': sensorgram['value'],
+        'value_hrf': sensorgram['value'] * 2,
+    }
+
+
+def process(data, ndjson, processes):
+    writer = StringIO()
+    waggle.plugin.start_processing_measurements(handler, BytesIO(data), writer, ndjson=ndjson, processes=processes)
+    return writer.getvalue()
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_split_messages(self):
+        data = make_message_data(50, 3)
+        messages = waggle.protocol.unpack_messages(data)
+
+        for chunk_size in [1, 100, 1000, len(data)]:
+            chunks = list(split_messages(BytesIO(data + data[:70]), chunk_size))
+            self.assertEqual(b''.join(chunks), data)
+            self.assertEqual([m for chunk in chunks for m in waggle.protocol.unpack_messages(chunk)], messages)
+
+    def test_split_invalid_header(self):
+        data = bytearray(make_message_data(10, 3))
+        size = len(data) // 10
+        data[5 * size + 4] ^= 0xff
+
+        # the messages before the invalid header are split as usual
+        chunks = list(split_messages(BytesIO(data), size))
+        self.assertEqual(b''.join(chunks[:-1]), data[:5 * size])
+
+        with self.assertRaises(ValueError):
+            waggle.protocol.unpack_messages(chunks[-1])
+
+    def test_output_matches(self):
+        data = make_message_data(200, 5)
+
+        for ndjson in [False, True]:
+            self.assertEqual(process(data, ndjson, 3), process(data, ndjson, 1))
+
+        self.assertEqual(process(b'', False, 3), '[]')
+
+    def test_chunks_in_order(self):
+        data = make_message_data(200, 5)
+        chunks = processed_chunks(handler, BytesIO(data), 3, chunk_size=500, max_pending=2)
+        results = [r for chunk in chunks for r in chunk]
+        self.assertEqual(','.join(results), process(data, False, 1)[1:-1])
+
+    def test_invalid_data(self):
+        data = bytearray(make_message_data(20, 5))
+        data[-1] ^= 0xff
+
+        with self.assertRaises(ValueError):
+            process(bytes(data), True, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import json
+import unittest
+from io import BytesIO, StringIO
+import waggle.protocol
+import waggle.plugin
+
+
+def make_message_data(num_messages, num_sensorgrams):
+    return b''.join(waggle.protocol.pack_sensor_data_message([
+        {'timestamp': 1000 + i, 'sensor_id': j, 'parameter_id': 0, 'value': j}
+        for j in range(num_sensorgrams)
+    ]) for i in range(num_messages))
+
+
+def handler(message, datagram, sensorgram):
+    yield {
+        'sensor': sensorgram['sensor_id'],
+        'value_raw': sensorgram['value'],
+        'value_hrf': sensorgram['value'] * 2,
+    }
+
+
+class TestProcessing(unittest.TestCase):
+
+    def test_message_stream(self):
+        data = make_message_data(5, 3)
+        expected = list(waggle.plugin.measurements_in_message_data(data))
+        results = list(waggle.plugin.measurements_in_message_stream(BytesIO(data)))
+        self.assertEqual(results, expected)
+
+    def test_json_output(self):
+        data = make_message_data(5, 3)
+
+        expected = []
+
+        for message, datagram, sensorgram in waggle.plugin.measurements_in_message_data(data):
+            for r in handler(message, datagram, sensorgram):
+                r['timestamp'] = sensorgram['timestamp']
+                r['value_raw'] = str(r['value_raw'])
+                r['value_hrf'] = str(r['value_hrf'])
+                expected.append(r)
+
+        writer = StringIO()
+        waggle.plugin.start_processing_measurements(handler, BytesIO(data), writer, ndjson=False)
+        self.assertEqual(writer.getvalue(), json.dumps(expected, separators=(',', ':')))
+
+        writer = StringIO()
+        waggle.plugin.start_processing_measurements(handler, BytesIO(b''), writer, ndjson=False)
+        self.assertEqual(writer.getvalue(), '[]')
+
+        writer = StringIO()
+        waggle.plugin.start_processing_measurements(handler, BytesIO(data), writer, ndjson=True)
+        lines = writer.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,313 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import time
+import unittest
+import waggle.plugin
+import waggle.protocol
+from waggle.plugin.publisher import Publisher
+from waggle.plugin.testing import StubBroker
+
+
+def make_messages(count):
+    return [waggle.protocol.pack_message({'body': 'message {}'.format(i).encode()})
+            for i in range(count)]
+
+
+def unpack_bodies(bodies):
+    return [message['body'] for message in waggle.protocol.unpack_messages(b''.join(bodies))]
+
+
+class PublisherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StubBroker()
+        self.broker.start()
+        self.publishers = []
+
+    def tearDown(self):
+        for publisher in self.publishers:
+            publisher.close(timeout=1)
+        self.broker.stop()
+
+    def make_publisher(self, **kwargs):
+        kwargs.setdefault('min_reconnect_delay', 0.05)
+        kwargs.setdefault('min_nack_delay', 0.05)
+        publisher = Publisher(self.broker.parameters(), **kwargs)
+        self.publishers.append(publisher)
+        return publisher
+
+    def test_publish(self):
+        publisher = self.make_publisher()
+        messages = make_messages(100)
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(b''.join(self.broker.bodies()), b''.join(messages))
+
+        for message in self.broker.messages:
+            self.assertEqual(message.exchange, 'messages')
+            self.assertEqual(message.properties.delivery_mode, 2)
+
+        metrics = publisher.get_metrics()
+        self.assertEqual(metrics['messages_published'], 100)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['confirms_pending'], 0)
+        self.assertGreater(metrics['publish_latency_max'], 0)
+
+    def test_in_flight_window(self):
+        publisher = self.make_publisher(max_in_flight=2, max_batch_size=1)
+        messages = make_messages(10)
+
+        self.broker.hold_acks = True
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertTrue(self.broker.wait_for_frames(2))
+        time.sleep(0.1)
+        self.assertEqual(self.broker.frames, 2)
+        self.assertEqual(publisher.get_metrics()['confirms_pending'], 2)
+        self.assertEqual(publisher.get_metrics()['queue_depth'], 10)
+
+        self.broker.release_acks()
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(self.broker.bodies(), messages)
+
+    def test_no_coalesce(self):
+        publisher = self.make_publisher(max_in_flight=1)
+        messages = make_messages(10)
+
+        self.broker.hold_acks = True
+        publisher.publish(messages[0])
+        self.assertTrue(self.broker.wait_for_frames(1))
+
+        for message in messages[1:]:
+            publisher.publish(message)
+
+        self.broker.release_acks()
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(self.broker.bodies(), messages)
+
+    def test_coalesce(self):
+        publisher = self.make_publisher(max_in_flight=1, max_batch_size=65536)
+        messages = make_messages(50)
+
+        self.broker.hold_acks = True
+
+        # while the first publish is unconfirmed, the rest are queued and
+        # then sent together in a single publish.
+        publisher.publish(messages[0])
+        self.assertTrue(self.broker.wait_for_frames(1))
+
+        for message in messages[1:]:
+            publisher.publish(message)
+
+        self.broker.release_acks()
+        self.assertTrue(publisher.flush(timeout=5))
+
+        self.assertEqual(self.broker.frames, 2)
+        self.assertEqual(b''.join(self.broker.bodies()), b''.join(messages))
+        self.assertEqual(waggle.protocol.unpack_messages(self.broker.bodies()[1]),
+                         waggle.protocol.unpack_messages(b''.join(messages[1:])))
+
+    def test_max_batch_size(self):
+        publisher = self.make_publisher(max_in_flight=1, max_batch_size=200)
+        messages = make_messages(50)
+
+        self.broker.hold_acks = True
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertTrue(self.broker.wait_for_frames(1))
+        self.broker.release_acks()
+        self.assertTrue(publisher.flush(timeout=5))
+
+        for body in self.broker.bodies():
+            self.assertLessEqual(len(body), 200)
+
+        self.assertEqual(b''.join(self.broker.bodies()), b''.join(messages))
+
+    def test_nack(self):
+        publisher = self.make_publisher(max_in_flight=1)
+        messages = make_messages(10)
+
+        self.broker.nack_next = 1
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(unpack_bodies(self.broker.bodies()), unpack_bodies(messages))
+        self.assertEqual(publisher.get_metrics()['messages_nacked'], 1)
+
+    def test_nack_in_flight(self):
+        publisher = self.make_publisher()
+        messages = make_messages(10)
+
+        # the first publish is nacked while the later ones are still in flight
+        # and acked. every message must still arrive exactly once.
+        self.broker.hold_acks = True
+        self.broker.nack_next = 1
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertTrue(self.broker.wait_for_frames(10))
+        self.broker.release_acks()
+
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(self.broker.bodies(), messages[1:] + messages[:1])
+
+    def test_nack_multiple(self):
+        publisher = self.make_publisher()
+        messages = make_messages(10)
+
+        self.broker.hold_acks = True
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertTrue(self.broker.wait_for_frames(10))
+        self.broker.nack_held()
+
+        # all nacked messages are resent in their original order
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(unpack_bodies(self.broker.bodies()), unpack_bodies(messages))
+        self.assertEqual(publisher.get_metrics()['messages_nacked'], 10)
+
+    def test_nack_backoff(self):
+        publisher = self.make_publisher(max_in_flight=1, min_nack_delay=0.2)
+        messages = make_messages(10)
+
+        self.broker.nack_next = 3
+        start = time.monotonic()
+
+        for message in messages:
+            publisher.publish(message)
+
+        # three consecutive nacks wait 0.2s, 0.4s and 0.8s before resending
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertGreaterEqual(time.monotonic() - start, 1.4)
+        self.assertEqual(unpack_bodies(self.broker.bodies()), unpack_bodies(messages))
+
+    def test_reconnect(self):
+        publisher = self.make_publisher()
+        messages = make_messages(20)
+
+        for message in messages[:10]:
+            publisher.publish(message)
+
+        self.assertTrue(publisher.flush(timeout=5))
+
+        # messages in flight when the connection drops must be resent
+        self.broker.hold_acks = True
+
+        for message in messages[10:]:
+            publisher.publish(message)
+
+        self.assertTrue(self.broker.wait_for_frames(2))
+        self.broker.drop_connections()
+        self.broker.hold_acks = False
+
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(b''.join(self.broker.bodies()), b''.join(messages))
+        self.assertGreaterEqual(publisher.get_metrics()['reconnects'], 1)
+
+    def test_broker_unavailable(self):
+        self.broker.stop()
+
+        publisher = self.make_publisher()
+        message = make_messages(1)[0]
+        publisher.publish(message)
+
+        self.assertFalse(publisher.flush(timeout=0.2))
+        self.assertEqual(publisher.get_metrics()['queue_depth'], 1)
+        self.assertFalse(publisher.close(timeout=0))
+
+        with self.assertRaises(RuntimeError):
+            publisher.publish(message)
+
+    def test_queue_full(self):
+        self.broker.stop()
+
+        publisher = self.make_publisher(max_queue_size=2)
+        message = make_messages(1)[0]
+        publisher.publish(message)
+        publisher.publish(message)
+
+        with self.assertRaises(TimeoutError):
+            publisher.publish(message, timeout=0.05)
+
+
+class PluginTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = StubBroker()
+        self.broker.start()
+
+    def tearDown(self):
+        waggle.plugin.close_publishers()
+        self.broker.stop()
+
+    def make_plugin(self, **kwargs):
+        credentials = waggle.plugin.Credentials(
+            host=self.broker.host,
+            port=self.broker.port,
+            username='guest',
+            password='guest')
+
+        return waggle.plugin.Plugin(id=37, version=(1, 2, 3), instance=0, credentials=credentials, **kwargs)
+
+    def test_publish_measurements(self):
+        plugin = self.make_plugin()
+
+        plugin.add_measurement({'sensor_id': 1, 'parameter_id': 0, 'value': 23})
+        plugin.add_measurement({'sensor_id': 1, 'parameter_id': 1, 'value': b'data'})
+        plugin.publish_measurements()
+        self.assertTrue(plugin.flush(timeout=5))
+
+        body, = self.broker.bodies()
+        self.assertEqual(self.broker.messages[0].properties.user_id, 'guest')
+
+        results = list(waggle.plugin.measurements_in_message_data(body))
+        self.assertEqual([sensorgram['value'] for _, _, sensorgram in results], [23, b'data'])
+        self.assertEqual(results[0][1]['plugin_id'], 37)
+        self.assertEqual(plugin.get_publisher_metrics()['messages_published'], 1)
+
+    def test_publish_compressed(self):
+        plugin = self.make_plugin(compress=True)
+
+        for i in range(50):
+            plugin.add_measurement({'sensor_id': 0xff04, 'parameter_id': i % 10, 'value': i})
+
+        size = len(b''.join(plugin.measurements))
+        plugin.publish_measurements()
+        self.assertTrue(plugin.flush(timeout=5))
+
+        body, = self.broker.bodies()
+        message = waggle.protocol.unpack_message(body)
+        self.assertLess(len(message['body']), size)
+
+        results = list(waggle.plugin.measurements_in_message_data(body))
+        self.assertEqual([sensorgram['value'] for _, _, sensorgram in results], list(range(50)))
+
+    def test_shared_publisher(self):
+        self.assertIs(self.make_plugin().publisher, self.make_plugin().publisher)
+        self.assertTrue(self.broker.wait_for_connections(1))
+        time.sleep(0.1)
+        self.assertEqual(len(self.broker.connections), 1)
+
+    def test_waiting_messages(self):
+        plugin = self.make_plugin()
+        self.assertEqual(list(plugin.get_waiting_messages()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import asyncio
+import os
+import threading
+import time
+import unittest
+import waggle.plugin
+from waggle.plugin.runtime import Runtime, open_serial
+from waggle.plugin.testing import StubBroker
+
+
+class RuntimeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.runtime = Runtime()
+
+    def tearDown(self):
+        self.runtime.loop.close()
+
+    def test_tasks(self):
+        results = []
+
+        async def task(name, count):
+            for i in range(count):
+                results.append((name, i))
+                await asyncio.sleep(0.01)
+
+        self.runtime.add(task, 'a', 3)
+        self.runtime.add(task, 'b', 2)
+        self.runtime.run()
+
+        # the tasks ran concurrently
+        self.assertEqual(results[:2], [('a', 0), ('b', 0)])
+        self.assertEqual(len(results), 5)
+
+    def test_task_error(self):
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('sensor error')
+
+        cancelled = []
+
+        async def forever():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        self.runtime.add(fail)
+        self.runtime.add(forever)
+
+        with self.assertRaises(ValueError):
+            self.runtime.run()
+
+        self.assertEqual(cancelled, [True])
+
+    def test_every(self):
+        times = []
+
+        async def tick():
+            times.append(self.runtime.loop.time())
+            if len(times) == 5:
+                self.runtime.stop()
+
+        self.runtime.every(0.05, tick, delay=0.05)
+        start = self.runtime.loop.time()
+        self.runtime.run()
+
+        # runs are scheduled against absolute deadlines, so they do not drift
+        for i, t in enumerate(times):
+            self.assertAlmostEqual(t - start, 0.05 * (i + 1), delta=0.03)
+
+    def test_every_blocking(self):
+        threads = []
+
+        def blocking():
+            threads.append(threading.get_ident())
+            time.sleep(0.01)
+            if len(threads) == 2:
+                self.runtime.loop.call_soon_threadsafe(self.runtime.stop)
+
+        self.runtime.every(0.02, blocking)
+        self.runtime.run()
+
+        # plain functions run in a worker thread, not the event loop thread
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_every_overrun(self):
+        calls = []
+
+        async def slow():
+            calls.append(self.runtime.loop.time())
+            if len(calls) == 1:
+                await asyncio.sleep(0.35)
+            else:
+                self.runtime.stop()
+
+        self.runtime.every(0.1, slow)
+        start = self.runtime.loop.time()
+        self.runtime.run()
+
+        # the runs missed while the first one was running are skipped
+        self.assertAlmostEqual(calls[1] - start, 0.4, delta=0.05)
+
+    def test_serial(self):
+        master, slave = os.openpty()
+        received = []
+
+        async def talk():
+            stream = await open_serial(os.ttyname(slave), 115200)
+
+            stream.write(b'request\n')
+            await stream.drain()
+
+            received.append(await stream.readline())
+            received.append(await stream.readexactly(4))
+            stream.close()
+
+        def device():
+            # acts as the device on the other end of the serial line
+            request = b''
+            while not request.endswith(b'\n'):
+                request += os.read(master, 100)
+            received.append(request)
+            os.write(master, b'response\n')
+            time.sleep(0.05)
+            os.write(master, b'\x01\x02\x03\x04')
+
+        thread = threading.Thread(target=device)
+        thread.start()
+
+        self.runtime.add(talk)
+        self.runtime.run()
+        thread.join()
+
+        os.close(master)
+        os.close(slave)
+
+        self.assertEqual(received, [b'request\n', b'response\n', b'\x01\x02\x03\x04'])
+
+    def test_publish(self):
+        broker = StubBroker()
+        broker.start()
+
+        credentials = waggle.plugin.Credentials(
+            host=broker.host,
+            port=broker.port,
+            username='guest',
+            password='guest')
+
+        plugins = [waggle.plugin.Plugin(id=i, version=(1, 0, 0), instance=0, credentials=credentials)
+                   for i in range(2)]
+
+        async def sensor(plugin):
+            for i in range(3):
+                plugin.add_measurement({'sensor_id': 1, 'parameter_id': 0, 'value': i})
+                plugin.publish_measurements()
+                await asyncio.sleep(0.01)
+
+        for plugin in plugins:
+            self.runtime.add(sensor, plugin)
+
+        self.runtime.run()
+
+        try:
+            self.assertTrue(plugins[0].flush(timeout=5))
+            self.assertEqual(len(broker.bodies()), 6)
+            self.assertEqual(len(broker.connections), 1)
+        finally:
+            waggle.plugin.close_publishers()
+            broker.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,279 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import os
+import tempfile
+import unittest
+from waggle.plugin.publisher import Publisher
+from waggle.plugin.spool import Spool, RECORD_HEADER, CURSOR_SLOT
+from waggle.plugin.testing import StubBroker
+
+
+def make_messages(count, size=100):
+    return ['{:04d}'.format(i).encode().ljust(size, b'.') for i in range(count)]
+
+
+def take_all(spool):
+    return [data for data, _ in spool.take(1 << 30)]
+
+
+class SpoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = self.tmpdir.name
+        self.spools = []
+
+    def tearDown(self):
+        for spool in self.spools:
+            try:
+                spool.close()
+            except ValueError:
+                pass
+        self.tmpdir.cleanup()
+
+    def open_spool(self, **kwargs):
+        spool = Spool(self.path, **kwargs)
+        self.spools.append(spool)
+        return spool
+
+    def test_append_take_confirm(self):
+        spool = self.open_spool()
+        messages = make_messages(10)
+
+        for message in messages:
+            spool.append(message)
+
+        self.assertEqual(len(spool), 10)
+        self.assertEqual(spool.unsent_bytes, 10 * (RECORD_HEADER.size + 100))
+
+        batch = spool.take(250)
+        self.assertEqual([data for data, _ in batch], messages[:2])
+
+        spool.confirm(batch)
+        self.assertEqual(len(spool), 8)
+        self.assertEqual(take_all(spool), messages[2:])
+
+    def test_replay(self):
+        spool = self.open_spool()
+        messages = make_messages(10)
+
+        for message in messages:
+            spool.append(message)
+
+        spool.confirm(spool.take(300))
+        spool.take(300)
+        spool.close()
+
+        # unconfirmed messages are replayed in order after reopening
+        spool = self.open_spool()
+        self.assertEqual(len(spool), 7)
+        self.assertEqual(take_all(spool), messages[3:])
+
+    def test_rotation(self):
+        spool = self.open_spool(segment_size=1000)
+        messages = make_messages(50)
+
+        for message in messages:
+            spool.append(message)
+
+        self.assertGreater(len(spool.segments), 5)
+
+        batch = spool.take(1 << 30)
+        self.assertEqual([data for data, _ in batch], messages)
+
+        spool.confirm(batch)
+        self.assertEqual(len(spool), 0)
+        self.assertEqual(len(spool.segments), 1)
+        self.assertEqual(len([name for name in os.listdir(self.path) if name.endswith('.seg')]), 1)
+
+        spool.close()
+        spool = self.open_spool(segment_size=1000)
+        self.assertEqual(len(spool), 0)
+
+    def test_large_message(self):
+        spool = self.open_spool(segment_size=1000)
+        messages = [b'a' * 10, b'b' * 5000, b'c' * 10]
+
+        for message in messages:
+            spool.append(message)
+
+        self.assertEqual(take_all(spool), messages)
+
+    def test_eviction(self):
+        spool = self.open_spool(segment_size=1000, max_size=5000)
+        messages = make_messages(100)
+
+        for message in messages:
+            spool.append(message)
+
+        remaining = take_all(spool)
+        self.assertLessEqual(sum(segment.size for segment in spool.segments), 5000)
+        self.assertEqual(remaining, messages[-len(remaining):])
+        self.assertEqual(spool.get_metrics()['spool_evicted'], 100 - len(remaining))
+        self.assertEqual(len(spool), len(remaining))
+
+        spool.close()
+        spool = self.open_spool(segment_size=1000, max_size=5000)
+        self.assertEqual(take_all(spool), remaining)
+
+    def test_requeue(self):
+        spool = self.open_spool()
+        messages = make_messages(10)
+
+        for message in messages:
+            spool.append(message)
+
+        batch1 = spool.take(300)
+        batch2 = spool.take(300)
+        batch3 = spool.take(300)
+        spool.confirm(batch2)
+        spool.requeue(batch1)
+        spool.requeue(batch1)
+
+        # acking a later batch does not commit past an unconfirmed earlier one
+        self.assertEqual(len(spool), 10)
+
+        # only the requeued batch is sent again, then the unread messages
+        self.assertEqual(spool.unsent_bytes, 4 * (RECORD_HEADER.size + 100))
+        resent = spool.take(300)
+        self.assertEqual(resent, batch1)
+        self.assertEqual(take_all(spool), messages[9:])
+
+        # the earlier acks still count once the requeued batch is confirmed
+        spool.confirm(resent)
+        self.assertEqual(len(spool), 4)
+        spool.confirm(batch3)
+        self.assertEqual(len(spool), 1)
+
+    def test_requeue_in_order(self):
+        spool = self.open_spool()
+        messages = make_messages(6)
+
+        for message in messages:
+            spool.append(message)
+
+        batches = [spool.take(200) for _ in range(3)]
+
+        # a reconnect requeues every in flight batch, newest first
+        for batch in reversed(batches):
+            spool.requeue(batch)
+
+        resent = [spool.take(200) for _ in range(3)]
+        self.assertEqual([data for batch in resent for data, _ in batch], messages)
+        self.assertEqual(take_all(spool), [])
+
+        for batch in resent:
+            spool.confirm(batch)
+
+        self.assertEqual(len(spool), 0)
+
+    def test_torn_write(self):
+        spool = self.open_spool()
+        messages = make_messages(5)
+
+        for message in messages:
+            spool.append(message)
+
+        spool.close()
+
+        # corrupt the last record as if the process died while writing it
+        segment_path = os.path.join(self.path, sorted(name for name in os.listdir(self.path) if name.endswith('.seg'))[-1])
+
+        with open(segment_path, 'r+b') as file:
+            file.seek(4 * (RECORD_HEADER.size + 100) + RECORD_HEADER.size + 50)
+            file.write(b'X')
+
+        spool = self.open_spool()
+        self.assertEqual(len(spool), 4)
+
+        spool.append(b'new message')
+        self.assertEqual(take_all(spool), messages[:4] + [b'new message'])
+
+    def test_torn_cursor(self):
+        spool = self.open_spool()
+        messages = make_messages(5)
+
+        for message in messages:
+            spool.append(message)
+
+        spool.confirm(spool.take(100))
+        spool.confirm(spool.take(100))
+        spool.close()
+
+        # corrupt the newest cursor slot. the spool falls back to the previous
+        # cursor and replays the second message again.
+        with open(os.path.join(self.path, 'cursor'), 'r+b') as file:
+            file.seek(0)
+            file.write(b'\xff' * CURSOR_SLOT.size)
+
+        spool = self.open_spool()
+        self.assertEqual(take_all(spool), messages[1:])
+
+
+class SpoolPublisherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_store_and_forward(self):
+        messages = make_messages(20)
+
+        # broker is down. messages are only held in the spool.
+        broker = StubBroker()
+        broker.stop()
+
+        publisher = Publisher(broker.parameters(), queue=Spool(self.tmpdir.name), min_reconnect_delay=0.05)
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertFalse(publisher.close(timeout=0.2))
+
+        # a new process replays the spool once the broker is reachable
+        broker = StubBroker()
+        broker.start()
+
+        publisher = Publisher(broker.parameters(), queue=Spool(self.tmpdir.name), min_reconnect_delay=0.05)
+        self.assertEqual(publisher.get_metrics()['queue_depth'], 20)
+
+        publisher.publish(b'after restart')
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(b''.join(broker.bodies()), b''.join(messages) + b'after restart')
+        self.assertTrue(publisher.close(timeout=1))
+        broker.stop()
+
+        spool = Spool(self.tmpdir.name)
+        self.assertEqual(len(spool), 0)
+        spool.close()
+
+    def test_reconnect(self):
+        messages = make_messages(20)
+
+        broker = StubBroker()
+        broker.start()
+
+        publisher = Publisher(broker.parameters(), queue=Spool(self.tmpdir.name), min_reconnect_delay=0.05)
+        broker.hold_acks = True
+
+        for message in messages:
+            publisher.publish(message)
+
+        self.assertTrue(broker.wait_for_frames(1))
+        broker.drop_connections()
+        broker.hold_acks = False
+
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertEqual(b''.join(broker.bodies()), b''.join(messages))
+        self.assertTrue(publisher.close(timeout=1))
+        broker.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
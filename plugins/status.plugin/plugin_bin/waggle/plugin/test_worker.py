@@ -0,0 +1,152 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from io import BytesIO, StringIO
+import waggle.protocol
+import waggle.plugin
+from waggle.plugin.worker import LENGTH, Server, make_pool, read_batches, serve_stream, write_batch
+
+
+def make_message_data(sender_ids, num_sensorgrams):
+    return b''.join(waggle.protocol.pack_message({
+        'sender_id': sender_id,
+        'body': waggle.protocol.pack_datagram({
+            'body': waggle.protocol.pack_sensorgrams([
+                {'timestamp': 1000 + i, 'sensor_id': j, 'parameter_id': 0, 'value': j}
+                for j in range(num_sensorgrams)
+            ]),
+        }),
+    }) for i, sender_id in enumerate(sender_ids))
+
+
+def handler(message, datagram, sensorgram):
+    if sensorgram['sensor_id'] == 99:
+        raise ValueError('bad sensor')
+
+    yield {
+        'node': message['sender_id'],
+        'sensor': sensorgram['sensor_id'],
+        'value_raw': sensorgram['value'],
+        'value_hrf': sensorgram['value'] * 2,
+    }
+
+
+def expected_output(data):
+    writer = StringIO()
+    waggle.plugin.start_processing_measurements(handler, BytesIO(data), writer, ndjson=False)
+    return writer.getvalue().encode()
+
+
+def make_batches():
+    sender_ids = ['{:016x}'.format(i % 5) for i in range(20)]
+    return [make_message_data(sender_ids[i:], 3) for i in range(10)] + [b'']
+
+
+def frame_batches(batches):
+    writer = BytesIO()
+
+    for batch in batches:
+        write_batch(writer, batch)
+
+    return writer.getvalue()
+
+
+class TestWorker(unittest.TestCase):
+
+    def serve(self, processes, batches):
+        pool = make_pool(handler, processes)
+        writer = BytesIO()
+
+        try:
+            serve_stream(pool, BytesIO(frame_batches(batches)), writer)
+        finally:
+            pool.close()
+
+        return list(read_batches(BytesIO(writer.getvalue())))
+
+    def test_read_batches(self):
+        batches = [b'', b'abc', b'x' * 100000]
+        data = frame_batches(batches)
+        self.assertEqual(list(read_batches(BytesIO(data))), batches)
+
+        with self.assertRaises(EOFError):
+            list(read_batches(BytesIO(data[:-1])))
+
+        with self.assertRaises(EOFError):
+            list(read_batches(BytesIO(LENGTH.pack(10)[:2])))
+
+    def test_local(self):
+        batches = make_batches()
+        self.assertEqual(self.serve(1, batches), [expected_output(batch) for batch in batches])
+
+    def test_pool(self):
+        batches = make_batches()
+        self.assertEqual(self.serve(3, batches), [expected_output(batch) for batch in batches])
+
+    def test_errors(self):
+        good = make_message_data(['0000000000000001'], 3)
+        bad_handler = make_message_data(['0000000000000002'], 100)
+        bad_crc = bytearray(good)
+        bad_crc[-1] ^= 0xff
+        bad_header = bytearray(good)
+        bad_header[20] ^= 0xff
+
+        for processes in [1, 3]:
+            responses = self.serve(processes, [good, bad_handler, bytes(bad_crc), bytes(bad_header), good])
+            self.assertEqual(responses[0], expected_output(good))
+            self.assertEqual(json.loads(responses[1].decode()), {'error': 'bad sensor'})
+            self.assertIn('error', json.loads(responses[2].decode()))
+            self.assertEqual(json.loads(responses[3].decode()), {'error': 'Invalid header CRC.'})
+            self.assertEqual(responses[4], expected_output(good))
+
+    def test_broken_pool(self):
+        pool = make_pool(handler, 2)
+
+        try:
+            pool.fail(RuntimeError('Worker process exited.'))
+            future = pool.submit(make_message_data(['0000000000000001'], 3))
+
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=0)
+        finally:
+            pool.close()
+
+    def test_socket(self):
+        batches = make_batches()
+        pool = make_pool(handler, 2)
+
+        with tempfile.TemporaryDirectory() as dir:
+            path = os.path.join(dir, 'worker.sock')
+            server = Server(path, pool)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+
+            try:
+                for _ in range(2):
+                    with socket.socket(socket.AF_UNIX) as sock:
+                        sock.connect(path)
+                        sock.sendall(frame_batches(batches))
+                        sock.shutdown(socket.SHUT_WR)
+
+                        with sock.makefile('rb') as reader:
+                            responses = list(read_batches(reader))
+
+                    self.assertEqual(responses, [expected_output(batch) for batch in batches])
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+                pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
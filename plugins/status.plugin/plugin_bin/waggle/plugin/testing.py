@@ -0,0 +1,292 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides a minimal in-process AMQP 0-9-1 broker for testing code
+which publishes through pika without needing a RabbitMQ server.
+
+The broker only implements what plugins use: connection and channel setup,
+publisher confirms, exchange / queue declares and basic.get on an always empty
+queue. Published messages are recorded once they are acked.
+
+Example:
+
+```
+broker = StubBroker()
+broker.start()
+
+publisher = Publisher(broker.parameters())
+publisher.publish(b'hello')
+publisher.flush()
+
+assert broker.bodies() == [b'hello']
+broker.stop()
+```
+"""
+import socket
+import socketserver
+import threading
+from collections import namedtuple
+import pika
+import pika.credentials
+from pika import frame, spec
+
+PublishedMessage = namedtuple('PublishedMessage', ['exchange', 'routing_key', 'properties', 'body'])
+
+
+class StubBroker:
+
+    def __init__(self, host='127.0.0.1'):
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+
+            def handle(self):
+                StubConnection(broker, self.request).run()
+
+        self.server = socketserver.ThreadingTCPServer((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+        self.thread = None
+
+        self.lock = threading.Condition()
+        self.connections = set()
+        self.messages = []
+        self.frames = 0
+
+        # when hold_acks is set, confirms are queued until release_acks or
+        # nack_held is called
+        self.hold_acks = False
+        self.held_acks = []
+
+        # number of upcoming publishes to nack instead of ack
+        self.nack_next = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the broker. A broker may also be stopped without being started."""
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
+        self.drop_connections()
+
+    def parameters(self, **kwargs):
+        return pika.ConnectionParameters(
+            host=self.host,
+            port=self.port,
+            credentials=pika.credentials.PlainCredentials('guest', 'guest'),
+            **kwargs)
+
+    def drop_connections(self):
+        """Abruptly closes all client connections."""
+        with self.lock:
+            connections = list(self.connections)
+            self.held_acks.clear()
+
+        for connection in connections:
+            connection.abort()
+
+    def release_acks(self):
+        with self.lock:
+            self.hold_acks = False
+            held_acks = list(self.held_acks)
+            self.held_acks.clear()
+
+        for _, _, _, confirm in held_acks:
+            confirm()
+
+    def nack_held(self):
+        """Nacks all held publishes using a single multiple nack per channel."""
+        with self.lock:
+            self.hold_acks = False
+            held_acks = list(self.held_acks)
+            self.held_acks.clear()
+
+        last_tags = {}
+
+        for connection, channel_number, delivery_tag, _ in held_acks:
+            key = (connection, channel_number)
+            last_tags[key] = max(last_tags.get(key, 0), delivery_tag)
+
+        for (connection, channel_number), delivery_tag in last_tags.items():
+            connection.send(channel_number, spec.Basic.Nack(delivery_tag=delivery_tag, multiple=True))
+
+    def bodies(self):
+        with self.lock:
+            return [message.body for message in self.messages]
+
+    def wait_for_frames(self, count, timeout=5):
+        with self.lock:
+            return self.lock.wait_for(lambda: self.frames >= count, timeout)
+
+    def wait_for_connections(self, count, timeout=5):
+        with self.lock:
+            return self.lock.wait_for(lambda: len(self.connections) >= count, timeout)
+
+
+class StubConnection:
+
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.write_lock = threading.Lock()
+        self.delivery_tags = {}
+        self.pending = {}
+
+    def abort(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def send(self, channel_number, method):
+        data = frame.Method(channel_number, method).marshal()
+
+        with self.write_lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                pass
+
+    def frames(self):
+        buf = b''
+
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                return
+
+            if not data:
+                return
+
+            buf += data
+
+            while True:
+                n, f = frame.decode_frame(buf)
+                if f is None:
+                    break
+                buf = buf[n:]
+                yield f
+
+    def run(self):
+        with self.broker.lock:
+            self.broker.connections.add(self)
+            self.broker.lock.notify_all()
+
+        try:
+            for f in self.frames():
+                if not self.handle(f):
+                    break
+        finally:
+            with self.broker.lock:
+                self.broker.connections.discard(self)
+                self.broker.lock.notify_all()
+            self.sock.close()
+
+    def handle(self, f):
+        if isinstance(f, frame.ProtocolHeader):
+            self.send(0, spec.Connection.Start(
+                server_properties={
+                    'product': 'waggle stub broker',
+                    'capabilities': {
+                        'publisher_confirms': True,
+                        'basic.nack': True,
+                        'consumer_cancel_notify': True,
+                    },
+                },
+                mechanisms='PLAIN EXTERNAL'))
+        elif isinstance(f, frame.Method):
+            return self.handle_method(f.channel_number, f.method)
+        elif isinstance(f, frame.Header):
+            self.pending[f.channel_number][1] = f.properties
+            self.pending[f.channel_number][2] = f.body_size
+            self.check_pending(f.channel_number)
+        elif isinstance(f, frame.Body):
+            self.pending[f.channel_number][3].append(f.fragment)
+            self.check_pending(f.channel_number)
+        return True
+
+    def handle_method(self, channel_number, method):
+        if isinstance(method, spec.Connection.StartOk):
+            self.send(0, spec.Connection.Tune(channel_max=0, frame_max=131072, heartbeat=0))
+        elif isinstance(method, spec.Connection.Open):
+            self.send(0, spec.Connection.OpenOk())
+        elif isinstance(method, spec.Connection.Close):
+            self.send(0, spec.Connection.CloseOk())
+            return False
+        elif isinstance(method, spec.Channel.Open):
+            self.send(channel_number, spec.Channel.OpenOk())
+        elif isinstance(method, spec.Channel.Close):
+            self.send(channel_number, spec.Channel.CloseOk())
+        elif isinstance(method, spec.Confirm.Select):
+            self.delivery_tags[channel_number] = 0
+            self.send(channel_number, spec.Confirm.SelectOk())
+        elif isinstance(method, spec.Exchange.Declare):
+            self.send(channel_number, spec.Exchange.DeclareOk())
+        elif isinstance(method, spec.Queue.Declare):
+            self.send(channel_number, spec.Queue.DeclareOk(queue=method.queue, message_count=0, consumer_count=0))
+        elif isinstance(method, spec.Basic.Get):
+            self.send(channel_number, spec.Basic.GetEmpty())
+        elif isinstance(method, spec.Basic.Publish):
+            self.pending[channel_number] = [method, None, None, []]
+        return True
+
+    def check_pending(self, channel_number):
+        method, properties, body_size, fragments = self.pending[channel_number]
+
+        if body_size is None or sum(map(len, fragments)) < body_size:
+            return
+
+        del self.pending[channel_number]
+
+        message = PublishedMessage(
+            exchange=method.exchange,
+            routing_key=method.routing_key,
+            properties=properties,
+            body=b''.join(fragments))
+
+        if channel_number not in self.delivery_tags:
+            self.record(message, True)
+            return
+
+        self.delivery_tags[channel_number] += 1
+        delivery_tag = self.delivery_tags[channel_number]
+
+        with self.broker.lock:
+            self.broker.frames += 1
+            self.broker.lock.notify_all()
+
+            ack = self.broker.nack_next == 0
+
+            if not ack:
+                self.broker.nack_next -= 1
+
+            def confirm():
+                self.record(message, ack)
+
+                if ack:
+                    self.send(channel_number, spec.Basic.Ack(delivery_tag=delivery_tag))
+                else:
+                    self.send(channel_number, spec.Basic.Nack(delivery_tag=delivery_tag))
+
+            if self.broker.hold_acks:
+                self.broker.held_acks.append((self, channel_number, delivery_tag, confirm))
+                return
+
+        confirm()
+
+    def record(self, message, ack):
+        if not ack:
+            return
+
+        with self.broker.lock:
+            self.broker.messages.append(message)
+            self.broker.lock.notify_all()
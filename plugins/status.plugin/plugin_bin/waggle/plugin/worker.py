@@ -0,0 +1,352 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module runs a plugin_beehive handler as a long running worker, so the
+interpreter startup, imports and spec parsing are paid once instead of for
+every batch.
+
+The worker reads a stream of batches from stdin or from connections to a Unix
+socket. Each batch is a 4 byte big endian length followed by that many bytes
+of concatenated waggle messages. For each batch, in order, the worker writes a
+4 byte big endian length followed by the JSON array start_processing_measurements
+would have written for it. If a batch cannot be processed, for example because
+it is corrupt, the response is a JSON object with an error field instead.
+
+With more than one process, messages are sharded across a pool of forked
+processes by sender_id. Each shard processes its messages in the order they
+were submitted, so results for a node are always produced in order, and the
+results of a batch are merged back into message order.
+
+Example:
+
+```sh
+$ plugin_beehive --worker --processes 4 --socket /run/waggle/status.sock
+```
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import queue
+import socketserver
+import struct
+import sys
+import threading
+import zlib
+import waggle.plugin
+import waggle.protocol
+
+LENGTH = struct.Struct('>I')
+
+logger = logging.getLogger('waggle.plugin.worker')
+
+
+def read_exactly(reader, n):
+    data = reader.read(n)
+
+    # raw streams may return short reads
+    while len(data) < n:
+        chunk = reader.read(n - len(data))
+
+        if not chunk:
+            break
+
+        data += chunk
+
+    return data
+
+
+def read_batches(reader):
+    """Yields each length prefixed batch read from reader until EOF."""
+    while True:
+        header = read_exactly(reader, LENGTH.size)
+
+        if not header:
+            return
+
+        if len(header) < LENGTH.size:
+            raise EOFError('Incomplete batch length.')
+
+        length, = LENGTH.unpack(header)
+        data = read_exactly(reader, length)
+
+        if len(data) < length:
+            raise EOFError('Incomplete batch.')
+
+        yield data
+
+
+def write_batch(writer, data):
+    writer.write(LENGTH.pack(len(data)))
+    writer.write(data)
+    writer.flush()
+
+
+def process_message_data(handler, data):
+    """Returns the JSON encoded results of handler over the messages in data."""
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    measurements = waggle.plugin.measurements_in_message_data(data)
+    return [encoder.encode(r) for r in waggle.plugin.processed_results(handler, measurements)]
+
+
+def encode_response(results):
+    return ('[' + ','.join(results) + ']').encode()
+
+
+def encode_error(exc):
+    return json.dumps({'error': str(exc)}).encode()
+
+
+class LocalPool:
+    """
+    Processes batches in the calling thread. submit returns a completed
+    future, like a Pool with one process.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def submit(self, data):
+        future = concurrent.futures.Future()
+
+        try:
+            future.set_result(process_message_data(self.handler, data))
+        except Exception as exc:
+            future.set_exception(exc)
+
+        return future
+
+    def close(self):
+        pass
+
+
+def run_shard(handler, tasks, results):
+    while True:
+        task = tasks.get()
+
+        if task is None:
+            break
+
+        job_id, packets = task
+
+        try:
+            results.put((job_id, [(index, process_message_data(handler, data)) for index, data in packets], None))
+        except Exception as exc:
+            results.put((job_id, None, str(exc)))
+
+
+class Pool:
+    """
+    Shards the messages in each batch across processes forked from the
+    current one by sender_id. submit returns a future of the results in
+    message order.
+    """
+
+    def __init__(self, handler, processes):
+        import multiprocessing
+
+        context = multiprocessing.get_context('fork')
+
+        self.lock = threading.Lock()
+        self.job_ids = itertools.count()
+        self.pending = {}
+        self.broken = None
+        self.results = context.Queue()
+        self.tasks = [context.Queue() for _ in range(processes)]
+        self.processes = [context.Process(target=run_shard, args=(handler, tasks, self.results), daemon=True)
+                          for tasks in self.tasks]
+
+        for process in self.processes:
+            process.start()
+
+        self.collector = threading.Thread(target=self.collect, name='waggle-worker-collector', daemon=True)
+        self.collector.start()
+
+    def shard(self, sender_id):
+        return zlib.crc32(sender_id.encode()) % len(self.tasks)
+
+    def submit(self, data):
+        future = concurrent.futures.Future()
+
+        try:
+            packets = [(index, packet.sender_id, bytes(packet.data))
+                       for index, packet in enumerate(waggle.protocol.iter_packet_views(data))]
+        except ValueError as exc:
+            future.set_exception(exc)
+            return future
+
+        shards = {}
+
+        for index, sender_id, packet in packets:
+            shards.setdefault(self.shard(sender_id), []).append((index, packet))
+
+        if not shards:
+            future.set_result([])
+            return future
+
+        # the lock keeps jobs in the same order on every shard queue
+        with self.lock:
+            if self.broken is not None:
+                future.set_exception(self.broken)
+                return future
+
+            job_id = next(self.job_ids)
+            self.pending[job_id] = [future, len(shards), [], None]
+
+            for shard, items in shards.items():
+                self.tasks[shard].put((job_id, items))
+
+        return future
+
+    def collect(self):
+        while True:
+            try:
+                item = self.results.get(timeout=1)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    self.fail(RuntimeError('Worker process exited.'))
+                    return
+                continue
+
+            if item is None:
+                return
+
+            job_id, results, error = item
+
+            with self.lock:
+                job = self.pending[job_id]
+                job[1] -= 1
+
+                if error is not None:
+                    job[3] = error
+                else:
+                    job[2].extend(results)
+
+                if job[1] > 0:
+                    continue
+
+                del self.pending[job_id]
+
+            future, _, results, error = job
+
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+                continue
+
+            results.sort(key=lambda item: item[0])
+            future.set_result([r for _, message_results in results for r in message_results])
+
+    def fail(self, exc):
+        with self.lock:
+            self.broken = exc
+            pending, self.pending = self.pending, {}
+
+        for future, _, _, _ in pending.values():
+            future.set_exception(exc)
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+
+        for process in self.processes:
+            process.join()
+
+        self.results.put(None)
+        self.collector.join()
+
+
+def make_pool(handler, processes=None):
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes <= 1:
+        return LocalPool(handler)
+
+    return Pool(handler, processes)
+
+
+def write_responses(futures, writer):
+    while True:
+        future = futures.get()
+
+        if future is None:
+            break
+
+        try:
+            data = encode_response(future.result())
+        except Exception as exc:
+            data = encode_error(exc)
+
+        write_batch(writer, data)
+
+
+def serve_stream(pool, reader, writer, max_pending=16):
+    """
+    Submits each batch from reader to pool and writes the responses to writer
+    in the same order. Up to max_pending batches are processed at once.
+    """
+    futures = queue.Queue(max_pending)
+    thread = threading.Thread(target=write_responses, args=(futures, writer))
+    thread.start()
+
+    try:
+        for data in read_batches(reader):
+            futures.put(pool.submit(data))
+    finally:
+        futures.put(None)
+        thread.join()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, pool):
+        self.pool = pool
+        super().__init__(path, StreamHandler)
+
+
+class StreamHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            serve_stream(self.server.pool, self.rfile, self.wfile)
+        except (EOFError, ConnectionError) as exc:
+            logger.warning('Closing worker connection: %s', exc)
+
+
+def run_worker(handler, args=None):
+    """
+    Runs handler as a worker configured by command line arguments. Serves
+    stdin and stdout unless --socket is given.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--worker', action='store_true')
+    parser.add_argument('--processes', type=int, help='number of processes. default is the number of CPUs.')
+    parser.add_argument('--socket', help='serve connections to this Unix socket.')
+    args, _ = parser.parse_known_args(args)
+
+    pool = make_pool(handler, args.processes)
+
+    try:
+        if args.socket is None:
+            serve_stream(pool, sys.stdin.buffer, sys.stdout.buffer)
+            return
+
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+        server = Server(args.socket, pool)
+
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+    finally:
+        pool.close()
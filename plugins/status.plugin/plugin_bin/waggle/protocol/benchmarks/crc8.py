@@ -0,0 +1,76 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import os
+import time
+from waggle.checksum import crc8, crc8_table, crc8_batch, Crc8
+
+# Compares the original CRC8 loop against crc8, Crc8 fed in serial sized
+# pieces and crc8_batch on a batch of datagram sized bodies.
+
+NUM_BUFFERS = 10000
+BUFFER_SIZE = 200
+
+
+def original_crc8(data, crc=0):
+    for value in data:
+        crc = crc8_table[crc ^ value]
+    return crc
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run_original(buffers):
+    return [original_crc8(b) for b in buffers]
+
+
+def run_crc8(buffers):
+    return [crc8(b) for b in buffers]
+
+
+def run_incremental(buffers):
+    results = []
+
+    for b in buffers:
+        c = Crc8()
+        for i in range(0, len(b), 16):
+            c.update(b[i:i + 16])
+        results.append(c.crc)
+
+    return results
+
+
+def run_batch(buffers):
+    return crc8_batch(buffers).tolist()
+
+
+def main():
+    buffers = [os.urandom(BUFFER_SIZE) for _ in range(NUM_BUFFERS)]
+
+    original_time, expected = timed(run_original, buffers)
+    print('buffers     {} x {} bytes'.format(NUM_BUFFERS, BUFFER_SIZE))
+    print('original    {:.3f}s'.format(original_time))
+
+    for name, func in [('crc8', run_crc8), ('Crc8 16B', run_incremental), ('batch', run_batch)]:
+        try:
+            # warm up, so one time imports are not included
+            func(buffers[:10])
+        except ImportError:
+            print('{:<11} skipped, requires numpy'.format(name))
+            continue
+
+        t, results = timed(func, buffers)
+
+        assert results == expected
+        print('{:<11} {:.3f}s  speedup {:.1f}x'.format(name, t, original_time / t))
+
+
+if __name__ == '__main__':
+    main()
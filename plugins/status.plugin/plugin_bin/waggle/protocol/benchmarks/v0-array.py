@@ -0,0 +1,68 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import struct
+import time
+import numpy as np
+from waggle.protocol.v0 import pack_sensorgram, unpack_sensorgram
+
+# Compares packing a 2048 channel spectrum with struct, as the spectral
+# plugins do, against the uint16 array sensorgram type.
+
+NUM_SPECTRA = 1000
+NUM_CHANNELS = 2048
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run_struct_pack(spectra):
+    return [pack_sensorgram({
+        'sensor_id': 1,
+        'parameter_id': 1,
+        'value': struct.pack('{}H'.format(NUM_CHANNELS), *[int(x) for x in spectrum]),
+    }) for spectrum in spectra]
+
+
+def run_struct_unpack(packed):
+    return [struct.unpack('{}H'.format(NUM_CHANNELS), unpack_sensorgram(data)['value']) for data in packed]
+
+
+def run_array_pack(spectra):
+    return [pack_sensorgram({
+        'sensor_id': 1,
+        'parameter_id': 1,
+        'value': spectrum,
+    }) for spectrum in spectra]
+
+
+def run_array_unpack(packed):
+    return [unpack_sensorgram(data)['value'] for data in packed]
+
+
+def main():
+    spectra = [np.random.randint(0, 0xffff, NUM_CHANNELS).astype(np.uint16) for _ in range(NUM_SPECTRA)]
+
+    struct_pack_time, struct_packed = timed(run_struct_pack, spectra)
+    struct_unpack_time, _ = timed(run_struct_unpack, struct_packed)
+    array_pack_time, array_packed = timed(run_array_pack, spectra)
+    array_unpack_time, results = timed(run_array_unpack, array_packed)
+
+    for spectrum, result in zip(spectra, results):
+        assert np.array_equal(spectrum, result)
+
+    print('spectra       {} x {} channels'.format(NUM_SPECTRA, NUM_CHANNELS))
+    print('struct pack   {:.3f}s'.format(struct_pack_time))
+    print('array pack    {:.3f}s  speedup {:.1f}x'.format(array_pack_time, struct_pack_time / array_pack_time))
+    print('struct unpack {:.3f}s'.format(struct_unpack_time))
+    print('array unpack  {:.3f}s  speedup {:.1f}x'.format(array_unpack_time, struct_unpack_time / array_unpack_time))
+
+
+if __name__ == '__main__':
+    main()
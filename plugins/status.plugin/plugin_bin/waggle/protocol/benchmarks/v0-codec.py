@@ -0,0 +1,102 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import time
+import waggle.protocol
+from waggle.protocol.v0 import Encoder, Decoder
+from waggle.protocol.v0 import make_pack_function, make_unpack_function
+
+# Compares the Encoder / Decoder based codec against the struct based one on a
+# corpus of 10k messages, each holding a datagram of 10 sensorgrams.
+
+NUM_MESSAGES = 10000
+
+reference_pack_sensorgrams = make_pack_function(Encoder.encode_sensorgram)
+reference_pack_datagrams = make_pack_function(Encoder.encode_datagram)
+reference_pack_messages = make_pack_function(Encoder.encode_waggle_packet)
+
+reference_unpack_sensorgrams = make_unpack_function(Decoder.decode_sensorgram)
+reference_unpack_datagrams = make_unpack_function(Decoder.decode_datagram)
+reference_unpack_messages = make_unpack_function(Decoder.decode_waggle_packet)
+
+sensorgrams = [
+    {'sensor_id': 1, 'parameter_id': 0, 'value': 23.1},
+    {'sensor_id': 1, 'parameter_id': 1, 'value': 1012},
+    {'sensor_id': 2, 'parameter_id': 0, 'value': -41},
+    {'sensor_id': 2, 'parameter_id': 1, 'value': b'\x01\x02\x03\x04'},
+    {'sensor_id': 3, 'parameter_id': 0, 'value': 'ok'},
+    {'sensor_id': 3, 'parameter_id': 1, 'value': 123456},
+    {'sensor_id': 4, 'parameter_id': 0, 'value': 0.5},
+    {'sensor_id': 4, 'parameter_id': 1, 'value': True},
+    {'sensor_id': 5, 'parameter_id': 0, 'value': [1.0, 2.0, 3.0]},
+    {'sensor_id': 5, 'parameter_id': 1, 'value': b'x' * 64},
+]
+
+
+def pack_corpus(pack_sensorgrams, pack_datagrams, pack_messages):
+    return b''.join(
+        pack_messages([{
+            'sender_id': '0000001e06107d97',
+            'body': pack_datagrams([{
+                'plugin_id': 37,
+                'plugin_major_version': 1,
+                'body': pack_sensorgrams(sensorgrams),
+            }]),
+        }])
+        for _ in range(NUM_MESSAGES))
+
+
+def unpack_corpus(data, unpack_sensorgrams, unpack_datagrams, unpack_messages):
+    count = 0
+
+    for message in unpack_messages(data):
+        for datagram in unpack_datagrams(message['body']):
+            count += len(unpack_sensorgrams(datagram['body']))
+
+    return count
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    ref_pack_time, ref_data = timed(pack_corpus,
+                                    reference_pack_sensorgrams,
+                                    reference_pack_datagrams,
+                                    reference_pack_messages)
+
+    fast_pack_time, data = timed(pack_corpus,
+                                 waggle.protocol.pack_sensorgrams,
+                                 waggle.protocol.pack_datagrams,
+                                 waggle.protocol.pack_messages)
+
+    assert len(ref_data) == len(data)
+
+    ref_unpack_time, ref_count = timed(unpack_corpus, data,
+                                       reference_unpack_sensorgrams,
+                                       reference_unpack_datagrams,
+                                       reference_unpack_messages)
+
+    fast_unpack_time, count = timed(unpack_corpus, data,
+                                    waggle.protocol.unpack_sensorgrams,
+                                    waggle.protocol.unpack_datagrams,
+                                    waggle.protocol.unpack_messages)
+
+    assert ref_count == count
+
+    print('messages   {}'.format(NUM_MESSAGES))
+    print('bytes      {}'.format(len(data)))
+    print('pack       reference {:.3f}s  struct {:.3f}s  speedup {:.1f}x'.format(
+        ref_pack_time, fast_pack_time, ref_pack_time / fast_pack_time))
+    print('unpack     reference {:.3f}s  struct {:.3f}s  speedup {:.1f}x'.format(
+        ref_unpack_time, fast_unpack_time, ref_unpack_time / fast_unpack_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import argparse
+import random
+from waggle.protocol.v0 import pack_datagram, pack_message, pack_sensorgrams
+from waggle.protocol.v0.dictionary import report, train_dictionary
+from waggle.protocol.v0.protocol import DEFAULT_DICTIONARY_ID, get_dictionary
+
+# Compares compressed datagram sizes on synthetic status and coresense
+# plugin streams, with no dictionary, the default dictionary unless it is
+# empty and one trained on the stream itself. --write-corpus saves the
+# messages in the format read by waggle.protocol.v0.dictionary.
+
+NUM_DATAGRAMS = 2000
+
+# (sensor_id, parameter_id, value generator) for the status plugin
+STATUS_SENSORS = (
+    [(0xff00, p, lambda: round(random.uniform(0, 4), 2)) for p in (1, 2, 3)] +
+    [(0xff01, 1, lambda: random.randint(100000, 900000)),
+     (0xff01, 2, lambda: 1020000),
+     (0xff01, 3, lambda: round(random.random(), 3))] +
+    [(0xff04, p, lambda: random.random() > 0.05) for p in range(1, 10)] +
+    [(0xff05, p, lambda: random.randint(0, 3)) for p in (1, 2, 3)] +
+    [(0xff06, p, lambda: random.randint(100, 900)) for p in (1, 2, 3, 4)] +
+    [(0xff07, p, lambda: True) for p in (1, 2, 3)] +
+    [(0xff08, p, lambda: random.randint(0, 1023)) for p in (1, 2, 3)] +
+    [(0xff0d, p, lambda: random.randint(0, 1 << 30)) for p in (1, 2)] +
+    [(0xff0e, p, lambda: random.randint(0, 1 << 26)) for p in (1, 2)] +
+    [(0xff0f, p, lambda: round(random.uniform(0.01, 0.5), 3)) for p in (1, 2, 3)] +
+    [(0xff10, p, lambda: random.randint(150, 500)) for p in range(1, 6)] +
+    [(0xff12, 1, lambda: random.randint(-110, -60)),
+     (0xff13, 1, lambda: 1),
+     (0xff14, 1, lambda: random.randint(0, 1 << 20))] +
+    [(0xff15, p, lambda: random.randint(0, 1 << 32)) for p in (1, 2, 3)] +
+    [(0xff18, p, lambda: round(random.random(), 3)) for p in (1, 2, 3)] +
+    [(0xff19, p, lambda: random.randint(0, 8)) for p in (1, 2)] +
+    [(0x0002, p, lambda: round(random.uniform(-20, 40), 2)) for p in (1, 2)]
+)
+
+# (sensor_id, parameter_id) for the coresense plugin, which publishes raw
+# readings. readings drift around a fixed level per sensor.
+CORESENSE_SENSORS = (
+    [(1, 1), (2, 1), (2, 2), (3, 1), (4, 1), (4, 2), (5, 1), (6, 1)] +
+    [(7, p) for p in (1, 2, 3)] +
+    [(8, 1), (9, 1)] +
+    [(10, p) for p in (1, 2, 3)] +
+    [(11, 1), (11, 2), (12, 1), (13, 1), (14, 1), (15, 1), (16, 1), (17, 1)]
+)
+
+
+def make_status_body(timestamp):
+    return pack_sensorgrams([{
+        'sensor_id': sensor_id,
+        'parameter_id': parameter_id,
+        'timestamp': timestamp,
+        'value': value(),
+    } for sensor_id, parameter_id, value in STATUS_SENSORS])
+
+
+def make_coresense_body(timestamp, levels):
+    return pack_sensorgrams([{
+        'sensor_id': sensor_id,
+        'parameter_id': parameter_id,
+        'timestamp': timestamp,
+        'value': levels[sensor_id, parameter_id] + random.randint(-20, 20),
+    } for sensor_id, parameter_id in CORESENSE_SENSORS] + [{
+        'sensor_id': 0x110,
+        'parameter_id': 1,
+        'timestamp': timestamp,
+        'value': bytes(random.randint(0, 255) for _ in range(24)),
+    }])
+
+
+def make_corpus(count):
+    random.seed(0)
+    timestamp = 1540000000
+    levels = {key: random.randint(100, 60000) for key in CORESENSE_SENSORS}
+    bodies = []
+
+    for i in range(count):
+        timestamp += 25
+
+        if i % 12 == 0:
+            bodies.append((4, make_status_body(timestamp)))
+        else:
+            bodies.append((37, make_coresense_body(timestamp, levels)))
+
+    return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write-corpus', help='file to write the synthetic messages to')
+    args = parser.parse_args()
+
+    corpus = make_corpus(NUM_DATAGRAMS)
+
+    if args.write_corpus:
+        with open(args.write_corpus, 'wb') as file:
+            for plugin_id, body in corpus:
+                file.write(pack_message({'body': pack_datagram({'plugin_id': plugin_id, 'body': body})}))
+        return
+
+    samples = [body for _, body in corpus]
+    split = len(samples) * 4 // 5
+
+    dictionaries = [('none', b'')]
+
+    if DEFAULT_DICTIONARY_ID != 0:
+        dictionaries.append(('default', get_dictionary(DEFAULT_DICTIONARY_ID)))
+
+    report(samples[split:], dictionaries + [('trained', train_dictionary(samples[:split]))])
+
+
+if __name__ == '__main__':
+    main()
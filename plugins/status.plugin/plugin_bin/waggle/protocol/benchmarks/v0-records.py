@@ -0,0 +1,109 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import random
+import time
+import tracemalloc
+from waggle.protocol.v0 import (
+    SENSORGRAM_HEADER, pack_datagram, pack_sensorgrams, pack_waggle_packets,
+    unpack_datagrams, unpack_sensorgrams, unpack_typed_value,
+    unpack_waggle_packets)
+
+# Replays a million sensorgrams the way measurements_in_message_data does and
+# compares the dict per sensorgram the codec used to return, including the
+# extra copy made when decoding the value, against the __slots__ records.
+
+NUM_MESSAGES = 10000
+SENSORGRAMS_PER_MESSAGE = 100
+
+
+def unpack_sensorgram_dicts(buf):
+    items = []
+
+    view = memoryview(buf)
+    size = SENSORGRAM_HEADER.size
+    end = len(view)
+    offset = 0
+
+    while offset + size <= end:
+        (body_length, sensor_id, sensor_instance,
+         parameter_id, timestamp, body_type) = SENSORGRAM_HEADER.unpack_from(view, offset)
+
+        start = offset + size
+        offset = start + body_length
+
+        sensorgram = {
+            'sensor_id': sensor_id,
+            'sensor_instance': sensor_instance,
+            'parameter_id': parameter_id,
+            'timestamp': timestamp,
+            'type': body_type,
+            'value': view[start:offset],
+        }
+
+        sensorgram = sensorgram.copy()
+        sensorgram['value'] = unpack_typed_value(body_type, sensorgram['value'])
+        items.append(sensorgram)
+
+    return items
+
+
+def make_data():
+    messages = []
+
+    for i in range(NUM_MESSAGES):
+        sensorgrams = pack_sensorgrams([{
+            'sensor_id': random.randint(0, 100),
+            'parameter_id': j % 16,
+            'value': random.randint(0, 0xffff),
+        } for j in range(SENSORGRAMS_PER_MESSAGE)])
+
+        messages.append({'body': pack_datagram({'body': sensorgrams})})
+
+    return pack_waggle_packets(messages)
+
+
+def replay(data, unpack):
+    results = []
+
+    for message in unpack_waggle_packets(data):
+        for datagram in unpack_datagrams(message['body']):
+            for sensorgram in unpack(datagram['body']):
+                results.append((message, datagram, sensorgram))
+
+    return results
+
+
+def measure(data, unpack):
+    start = time.perf_counter()
+    replay(data, unpack)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    results = replay(data, unpack)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    total = sum(sensorgram['value'] for _, _, sensorgram in results)
+    return elapsed, retained, total
+
+
+def main():
+    data = make_data()
+    count = NUM_MESSAGES * SENSORGRAMS_PER_MESSAGE
+
+    dict_time, dict_bytes, dict_total = measure(data, unpack_sensorgram_dicts)
+    record_time, record_bytes, record_total = measure(data, unpack_sensorgrams)
+    assert dict_total == record_total
+
+    print('sensorgrams {}'.format(count))
+    print('dicts       {:.3f}s  {:.0f} bytes/sensorgram'.format(dict_time, dict_bytes / count))
+    print('records     {:.3f}s  {:.0f} bytes/sensorgram  speedup {:.1f}x  memory {:.1f}x less'.format(
+        record_time, record_bytes / count, dict_time / record_time, dict_bytes / record_bytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import random
+import time
+from waggle.protocol.v0 import (
+    pack_datagram, pack_sensorgrams, pack_waggle_packets, route_packets,
+    unpack_datagrams, unpack_waggle_packets)
+
+# Compares computing a routing key for each message by fully unpacking the
+# message and its datagrams against the lazy header-only route_packets.
+
+NUM_MESSAGES = 10000
+
+
+def make_data():
+    messages = []
+
+    for i in range(NUM_MESSAGES):
+        sensorgrams = pack_sensorgrams([{
+            'sensor_id': random.randint(0, 100),
+            'parameter_id': j,
+            'value': random.random(),
+        } for j in range(20)])
+
+        messages.append({
+            'sender_id': '0000001e0610ba{:02x}'.format(i % 16),
+            'body': pack_datagram({
+                'plugin_id': i % 8,
+                'plugin_major_version': 1,
+                'body': sensorgrams,
+            }),
+        })
+
+    return pack_waggle_packets(messages)
+
+
+def run_unpack(data):
+    routes = []
+
+    for message in unpack_waggle_packets(data):
+        datagram = unpack_datagrams(message['body'])[0]
+        key = '{}.{}.{}.{}.{}.{}'.format(
+            message['sender_id'], message['sender_sub_id'], datagram['plugin_id'],
+            datagram['plugin_major_version'], datagram['plugin_minor_version'],
+            datagram['plugin_patch_version'])
+        routes.append(key)
+
+    return routes
+
+
+def run_route(data):
+    return [key for key, _ in route_packets(data)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    data = make_data()
+
+    unpack_time, expected = timed(run_unpack, data)
+    route_time, results = timed(run_route, data)
+    assert results == expected
+
+    print('messages  {}  bytes {}'.format(NUM_MESSAGES, len(data)))
+    print('unpack    {:.3f}s'.format(unpack_time))
+    print('route     {:.3f}s  speedup {:.1f}x'.format(route_time, unpack_time / route_time))
+
+
+if __name__ == '__main__':
+    main()
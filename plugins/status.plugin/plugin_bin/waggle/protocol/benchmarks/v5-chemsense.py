@@ -0,0 +1,84 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import random
+import tempfile
+import time
+import numpy as np
+from waggle.protocol.v5.utils import chemsense
+
+# Compares correcting 20k chemsense samples from a few boards one at a time,
+# as apply_corrections_to_sample used to, against apply_corrections_to_samples,
+# and loading the calibration data with and without the binary cache.
+
+NUMBER = 20000
+
+
+def single_corrections(sample):
+    S, Izero, n, M = chemsense.get_calib()[sample['BAD']]
+
+    Tboard = chemsense.slice_array(sample, ['AT0', 'AT1', 'AT2', 'AT3']).mean() / 100.0
+    CurZero = Izero * np.exp((Tboard - 40.0) / n) * 1e3
+    Cur = chemsense.slice_array(sample, chemsense.basis)
+    uncorrectedPPB = (Cur - CurZero) / S
+    correctedPPM = np.dot(M, uncorrectedPPB) / 1000.0
+
+    i = chemsense.basis_by_name['OZO']
+    j = chemsense.basis_by_name['NO2']
+    correctedPPM[i], correctedPPM[j] = chemsense.advanced_filter(correctedPPM[i], correctedPPM[j])
+
+    return dict(zip(chemsense.basis, correctedPPM))
+
+
+def make_samples():
+    boards = sorted(chemsense.get_calib().index)[:4]
+    samples = []
+
+    for _ in range(NUMBER):
+        sample = {'BAD': random.choice(boards)}
+
+        for k in ['AT0', 'AT1', 'AT2', 'AT3']:
+            sample[k] = float(random.randint(0, 4000))
+
+        for k in chemsense.basis:
+            sample[k] = float(random.randint(-5000, 30000))
+
+        samples.append(sample)
+
+    return samples
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    samples = make_samples()
+
+    single_time, expected = timed(lambda: [single_corrections(sample) for sample in samples])
+    batch_time, results = timed(chemsense.apply_corrections_to_samples, samples)
+
+    for result, sample in zip(results, expected):
+        for k in result:
+            assert abs(result[k] - sample[k]) <= 1e-9 * max(1.0, abs(sample[k]))
+
+    print('samples     {}'.format(NUMBER))
+    print('single      {:.3f}s'.format(single_time))
+    print('batch       {:.3f}s  speedup {:.1f}x'.format(batch_time, single_time / batch_time))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        parse_time, _ = timed(chemsense.read_calib_data, chemsense.calib_path, None)
+        chemsense.read_calib_data(chemsense.calib_path, cache_dir)
+        cached_time, _ = timed(chemsense.read_calib_data, chemsense.calib_path, cache_dir)
+
+    print('calibration parse   {:.1f}ms'.format(1e3 * parse_time))
+    print('calibration cached  {:.1f}ms  speedup {:.1f}x'.format(1e3 * cached_time, parse_time / cached_time))
+
+
+if __name__ == '__main__':
+    main()
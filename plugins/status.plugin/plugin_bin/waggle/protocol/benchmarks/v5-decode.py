@@ -0,0 +1,64 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import timeit
+from waggle.protocol.v5 import decoder, encoder, format
+
+# Measures per-frame decode latency of a typical coresense frame holding the
+# metsense and lightsense sensors, using the compiled per-sensor unpackers and
+# the generic waggle_unpack path.
+
+NUMBER = 2000
+
+frame_data = {
+    0x00: ['0123456789ab'],
+    0x01: [1000],
+    0x02: [2000, 3000],
+    0x03: [4000],
+    0x04: [100, 200000],
+    0x05: [500],
+    0x06: [600],
+    0x07: [1, 2, 3],
+    0x08: [bytes(126)],
+    0x09: [900],
+    0x0A: [1, -2, 3],
+    0x0B: [1100, 1200],
+    0x0C: [1300],
+    0x0D: [1400],
+    0x0E: [1500],
+    0x0F: [1600],
+    0x10: [1700],
+    0x13: [1800],
+}
+
+
+def generic_unpacker(formats, lengths):
+    return lambda buffer: format.waggle_unpack(formats, lengths, bytes(buffer))
+
+
+def main():
+    frame = encoder.encode_frame(frame_data)
+
+    compiled_cache = decoder.unpack_cache
+    generic_cache = {sensor_id: generic_unpacker(formats, lengths)
+                     for sensor_id, (_, formats, lengths) in decoder.spec_cache.items()}
+
+    decoder.unpack_cache = generic_cache
+    expected = decoder.decode_frame(frame)
+    generic_time = min(timeit.repeat(lambda: decoder.decode_frame(frame), number=NUMBER, repeat=5))
+
+    decoder.unpack_cache = compiled_cache
+    assert decoder.decode_frame(frame) == expected
+    compiled_time = min(timeit.repeat(lambda: decoder.decode_frame(frame), number=NUMBER, repeat=5))
+
+    print('frame       {} bytes, {} sensors'.format(len(frame), len(frame_data)))
+    print('generic     {:.1f}us per frame'.format(1e6 * generic_time / NUMBER))
+    print('compiled    {:.1f}us per frame  speedup {:.1f}x'.format(
+        1e6 * compiled_time / NUMBER, generic_time / compiled_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import random
+import timeit
+from waggle.protocol.v5.encoder import encode_frame, encode_frame_from_flat_string, encode_frame_from_dict
+from waggle.protocol.v5.helper import find_sensor_id_from_param_name, find_param_names_and_types_of_sensor, try_converting
+from waggle.protocol.v5.spec import spec
+
+# Compares encoding a 200 line flat string of status parameters with the
+# original encoder, which scans the spec and the remaining keys for each key,
+# against the indexed single pass encoder and the dict based API.
+
+LINES = 200
+
+NUMBER = 200
+
+
+def reference_encode_frame_from_flat_string(frame_data):
+    keys = []
+    values = []
+
+    for line in frame_data.splitlines():
+        sp = line.strip().split(' ')
+        if len(sp) == 2:
+            keys.append(sp[0])
+            values.append(sp[1])
+
+    dict_data = {}
+    number_of_keys = len(keys)
+    for i in range(0, number_of_keys):
+        key = keys[i]
+        if key == '':
+            continue
+
+        sensor_id = find_sensor_id_from_param_name(spec, key)
+        if sensor_id is None:
+            continue
+
+        required_params, required_types = find_param_names_and_types_of_sensor(spec, sensor_id)
+        required_values = [None] * len(required_params)
+        for j in range(i, number_of_keys):
+            key_in_search = keys[j]
+
+            if key_in_search in required_params:
+                index = required_params.index(key_in_search)
+                converted_value_in_search = try_converting(values[j], required_types[index])
+                if converted_value_in_search is not None:
+                    required_values[index] = converted_value_in_search
+                else:
+                    continue
+                keys[j] = ''
+        if None in required_values:
+            continue
+
+        dict_data[sensor_id] = required_values
+    return encode_frame(dict_data)
+
+
+def random_value(rand, param):
+    if param['format'] in ['uint', 'epoch']:
+        return rand.randint(0, 2**(8 * min(param['length'], 4)) - 1)
+    if param['format'] == 'int':
+        return rand.randint(-100, 100)
+    if param['format'] == 'float':
+        return rand.randint(0, 10000) / 100
+    if param['format'] in ['byte', 'hex']:
+        return bytes(rand.getrandbits(8) for _ in range(param['length'])).hex()
+    return 'x' * param['length']
+
+
+def make_data(rand):
+    data = {}
+
+    # sensors are taken from the highest ID down, which includes the node
+    # controller, wagman and edge processor status sensors.
+    for sensor_id in sorted(spec, reverse=True):
+        params = spec[sensor_id]['params']
+
+        if not all(param['length'] for param in params) or sum(param['length'] for param in params) >= 128:
+            continue
+
+        for param in params:
+            data[param['name']] = random_value(rand, param)
+
+        if len(data) >= LINES:
+            break
+
+    return data
+
+
+def main():
+    data = make_data(random.Random(0))
+    text = '\n'.join('{} {}'.format(k, v) for k, v in data.items())
+
+    expected = reference_encode_frame_from_flat_string(text)
+    assert encode_frame_from_flat_string(text) == expected
+    assert encode_frame_from_dict(data) == expected
+
+    reference_time = min(timeit.repeat(lambda: reference_encode_frame_from_flat_string(text), number=NUMBER, repeat=3))
+    indexed_time = min(timeit.repeat(lambda: encode_frame_from_flat_string(text), number=NUMBER, repeat=3))
+    dict_time = min(timeit.repeat(lambda: encode_frame_from_dict(data), number=NUMBER, repeat=3))
+
+    print('lines       {}, {} bytes encoded'.format(len(data), len(expected)))
+    print('original    {:.1f}us per frame'.format(1e6 * reference_time / NUMBER))
+    print('indexed     {:.1f}us per frame  speedup {:.1f}x'.format(
+        1e6 * indexed_time / NUMBER, reference_time / indexed_time))
+    print('dict        {:.1f}us per frame  speedup {:.1f}x'.format(
+        1e6 * dict_time / NUMBER, reference_time / dict_time))
+
+
+if __name__ == '__main__':
+    main()
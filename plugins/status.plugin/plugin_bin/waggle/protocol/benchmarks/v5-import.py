@@ -0,0 +1,49 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Measures the wall time of a fresh interpreter running `import
+# waggle.protocol.v5`, with the spec cache disabled, with a cold cache and with
+# a warm cache. The bare interpreter startup time is reported for reference.
+
+REPEAT = 10
+
+
+def run(code, cache_dir):
+    env = dict(os.environ, WAGGLE_CACHE_DIR=cache_dir)
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+    return time.perf_counter() - start
+
+
+def best(code, cache_dir):
+    return min(run(code, cache_dir) for _ in range(REPEAT))
+
+
+def main():
+    code = 'import waggle.protocol.v5'
+
+    baseline_time = best('pass', '')
+    uncached_time = best(code, '')
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold_time = run(code, cache_dir)
+        warm_time = best(code, cache_dir)
+
+    print('interpreter {:.1f}ms'.format(1e3 * baseline_time))
+    print('uncached    {:.1f}ms'.format(1e3 * uncached_time))
+    print('cold cache  {:.1f}ms'.format(1e3 * cold_time))
+    print('warm cache  {:.1f}ms  speedup {:.1f}x over uncached (excluding interpreter)'.format(
+        1e3 * warm_time, (uncached_time - baseline_time) / (warm_time - baseline_time)))
+
+
+if __name__ == '__main__':
+    main()
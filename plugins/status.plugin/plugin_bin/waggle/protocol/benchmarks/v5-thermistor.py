@@ -0,0 +1,51 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import random
+import time
+from waggle.protocol.v5.utils import pr103j2
+from waggle.protocol.v5.utils import mf52c1103f3380
+
+# Compares converting a million thermistor readings by computing each one, as
+# the pr103j2 and mf52c1103f3380 conversions used to, against the dense lookup
+# tables, one reading at a time and as a numpy array.
+
+NUMBER = 1000000
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def compare(name, direct, table, codes):
+    import numpy
+
+    direct_time, expected = timed(lambda: [direct(code) for code in codes])
+    table_time, results = timed(lambda: [table(code) for code in codes])
+    assert results == expected
+
+    array = numpy.array(codes)
+    array_time, results = timed(table.array, array)
+    assert results.tolist() == expected
+
+    print(name)
+    print('  computed    {:.3f}s'.format(direct_time))
+    print('  table       {:.3f}s  speedup {:.1f}x'.format(table_time, direct_time / table_time))
+    print('  array       {:.3f}s  speedup {:.1f}x'.format(array_time, direct_time / array_time))
+
+
+def main():
+    # readings in the normal operating range, where every conversion succeeds
+    compare('pr103j2', pr103j2.nearest_temperature, pr103j2.temperature_table,
+            [random.randint(100, 1000) for _ in range(NUMBER)])
+    compare('mf52c1103f3380', mf52c1103f3380.temperature_others, mf52c1103f3380.others_table,
+            [random.randint(100, 850) for _ in range(NUMBER)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module trains preset dictionaries for compressed datagrams and reports
+how they perform.
+
+Datagram bodies from a single plugin repeat the same sensorgram headers, so
+a dictionary made of representative bodies lets deflate reference them from
+the first byte. train_dictionary greedily picks the bodies which cover the
+most frequent byte sequences which are not covered yet, until the dictionary
+is full. The bodies picked first are placed at the end of the dictionary,
+where deflate can reference them with the shortest distances.
+
+The corpus is one or more files of captured waggle messages. The last 20% of
+datagrams are held out to evaluate the dictionary, which is compared against
+no dictionary and the current default dictionary, unless that is the empty
+one, at several compression levels. CPU cost is measured on the machine
+running the tool, so run it on a node to see the cost there.
+
+Example:
+
+```sh
+python3 -m waggle.protocol.v0.dictionary capture1.bin capture2.bin --output 2.bin
+```
+"""
+import argparse
+import collections
+import time
+import zlib
+from waggle.protocol.v0.protocol import (
+    DEFAULT_DICTIONARY_ID, get_dictionary, read_waggle_packets,
+    unpack_datagrams)
+
+DEFAULT_SIZE = 4096
+DEFAULT_NGRAM = 6
+
+
+def read_corpus(paths):
+    samples = []
+
+    for path in paths:
+        with open(path, 'rb') as file:
+            for message in read_waggle_packets(file):
+                for datagram in unpack_datagrams(message['body']):
+                    samples.append(datagram['body'])
+
+    return samples
+
+
+def ngrams(sample, n):
+    return {sample[i:i + n] for i in range(len(sample) - n + 1)}
+
+
+def train_dictionary(samples, size=DEFAULT_SIZE, n=DEFAULT_NGRAM):
+    """Builds a preset dictionary of at most size bytes from samples."""
+    candidates = {}
+    frequency = collections.Counter()
+
+    for sample in samples:
+        sample = bytes(sample)
+
+        if len(sample) < n or len(sample) > size or sample in candidates:
+            continue
+
+        candidates[sample] = ngrams(sample, n)
+        frequency.update(candidates[sample])
+
+    chosen = []
+    covered = set()
+    total = 0
+
+    def score(sample):
+        return sum(frequency[g] for g in candidates[sample] - covered) / len(sample)
+
+    while candidates:
+        best = max(candidates, key=score)
+
+        if score(best) == 0 or total + len(best) > size:
+            break
+
+        chosen.append(best)
+        covered |= candidates.pop(best)
+        total += len(best)
+
+    return b''.join(reversed(chosen))
+
+
+def evaluate(samples, dictionary, level):
+    """
+    Compresses and decompresses samples with dictionary and returns the
+    compressed size and the compression and decompression time per sample.
+    """
+    compressed = []
+    start = time.perf_counter()
+
+    for sample in samples:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+        compressed.append(compressor.compress(sample) + compressor.flush())
+
+    compress_time = time.perf_counter() - start
+    start = time.perf_counter()
+
+    for data in compressed:
+        decompressor = zlib.decompressobj(-15, zdict=dictionary)
+        decompressor.decompress(data)
+
+    decompress_time = time.perf_counter() - start
+
+    return {
+        'bytes': sum(len(data) for data in compressed),
+        'compress_us': 1e6 * compress_time / len(samples),
+        'decompress_us': 1e6 * decompress_time / len(samples),
+    }
+
+
+def report(samples, dictionaries, levels=(1, 6, 9)):
+    raw_bytes = sum(len(sample) for sample in samples)
+    print('datagrams  {}  raw bytes {}'.format(len(samples), raw_bytes))
+    print('{:<12} {:>5} {:>10} {:>7} {:>12} {:>14}'.format(
+        'dictionary', 'level', 'bytes', 'ratio', 'compress us', 'decompress us'))
+
+    for name, dictionary in dictionaries:
+        for level in levels:
+            r = evaluate(samples, dictionary, level)
+            print('{:<12} {:>5} {:>10} {:>7.3f} {:>12.1f} {:>14.1f}'.format(
+                name, level, r['bytes'], r['bytes'] / raw_bytes, r['compress_us'], r['decompress_us']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a compressed datagram dictionary.')
+    parser.add_argument('corpus', nargs='+', help='files of captured waggle messages')
+    parser.add_argument('--output', help='file to write the dictionary to')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='maximum dictionary size')
+    args = parser.parse_args()
+
+    samples = [bytes(sample) for sample in read_corpus(args.corpus)]
+    split = len(samples) * 4 // 5
+    training, test = samples[:split], samples[split:]
+
+    if not training or not test:
+        parser.error('corpus is too small.')
+
+    dictionary = train_dictionary(training, args.size)
+
+    print('trained {} byte dictionary on {} datagrams'.format(len(dictionary), len(training)))
+
+    dictionaries = [('none', b'')]
+
+    if DEFAULT_DICTIONARY_ID != 0:
+        dictionaries.append(('default', get_dictionary(DEFAULT_DICTIONARY_ID)))
+
+    report(test, dictionaries + [('trained', dictionary)])
+
+    if args.output:
+        with open(args.output, 'wb') as file:
+            file.write(dictionary)
+
+
+if __name__ == '__main__':
+    main()
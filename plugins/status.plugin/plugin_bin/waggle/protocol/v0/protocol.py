@@ -4,7 +4,12 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
+import array
+import collections.abc
+import os
+import sys
 import time
+import zlib
 from io import BytesIO
 from waggle.checksum import crc8
 from binascii import crc_hqx
@@ -26,6 +31,11 @@ PROTOCOL_PATCH_VERSION = 0
 START_FLAG = 0xaa
 END_FLAG = 0x55
 
+PACKET_TYPE_SENSORGRAMS = 0
+PACKET_TYPE_COMPRESSED = 1
+
+MAX_DATAGRAM_BODY_LENGTH = 0xffffff
+
 sender_sequence = 0
 packet_sequence = 0
 
@@ -57,6 +67,142 @@ def assert_length(b, length):
         raise ValueError('len({}) != {}'.format(b, length))
 
 
+class Record(collections.abc.Mapping):
+    """
+    Base class for unpacked messages, datagrams and sensorgrams. Fields are
+    stored in __slots__, which uses far less memory than a dict per record,
+    and can be accessed either as attributes or like a read only dict, as in
+    sensorgram['sensor_id']. Use dict(record) to get a plain dict, for example
+    to serialize it, and record.replace(field=value) to get a changed copy.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.field_set:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __contains__(self, key):
+        return key in self.field_set
+
+    def __eq__(self, other):
+        if isinstance(other, Record) and type(other) is not type(self):
+            return False
+        if isinstance(other, collections.abc.Mapping):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(key, getattr(self, key)) for key in self.__slots__))
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, key) for key in self.__slots__)
+
+    def copy(self):
+        return type(self)(*(getattr(self, key) for key in self.__slots__))
+
+    def replace(self, **fields):
+        """Returns a copy of the record with the given fields changed."""
+        unknown = fields.keys() - self.field_set
+
+        if unknown:
+            raise ValueError('Unknown fields {}.'.format(', '.join(sorted(unknown))))
+
+        return type(self)(*(fields.get(key, getattr(self, key)) for key in self.__slots__))
+
+
+def replace_fields(item, **fields):
+    """
+    Returns a copy of a record or dict with the given fields changed.
+    """
+    if isinstance(item, Record):
+        return item.replace(**fields)
+
+    item = item.copy()
+    item.update(fields)
+    return item
+
+
+class Sensorgram(Record):
+
+    __slots__ = ('sensor_id', 'sensor_instance', 'parameter_id', 'timestamp', 'type', 'value')
+
+    def __init__(self, sensor_id, sensor_instance, parameter_id, timestamp, type, value):
+        self.sensor_id = sensor_id
+        self.sensor_instance = sensor_instance
+        self.parameter_id = parameter_id
+        self.timestamp = timestamp
+        self.type = type
+        self.value = value
+
+
+class Datagram(Record):
+
+    __slots__ = ('timestamp', 'packet_seq', 'packet_type', 'plugin_id',
+                 'plugin_major_version', 'plugin_minor_version',
+                 'plugin_patch_version', 'plugin_instance', 'plugin_run_id',
+                 'body')
+
+    def __init__(self, timestamp, packet_seq, packet_type, plugin_id,
+                 plugin_major_version, plugin_minor_version,
+                 plugin_patch_version, plugin_instance, plugin_run_id, body):
+        self.timestamp = timestamp
+        self.packet_seq = packet_seq
+        self.packet_type = packet_type
+        self.plugin_id = plugin_id
+        self.plugin_major_version = plugin_major_version
+        self.plugin_minor_version = plugin_minor_version
+        self.plugin_patch_version = plugin_patch_version
+        self.plugin_instance = plugin_instance
+        self.plugin_run_id = plugin_run_id
+        self.body = body
+
+
+class Message(Record):
+
+    __slots__ = ('timestamp', 'protocol_major_version', 'protocol_minor_version',
+                 'protocol_patch_version', 'message_priority',
+                 'message_major_type', 'message_minor_type', 'sender_id',
+                 'sender_sub_id', 'sender_seq', 'sender_sid', 'receiver_id',
+                 'receiver_sub_id', 'response_seq', 'response_sid', 'token',
+                 'body')
+
+    def __init__(self, timestamp, protocol_major_version, protocol_minor_version,
+                 protocol_patch_version, message_priority, message_major_type,
+                 message_minor_type, sender_id, sender_sub_id, sender_seq,
+                 sender_sid, receiver_id, receiver_sub_id, response_seq,
+                 response_sid, token, body):
+        self.timestamp = timestamp
+        self.protocol_major_version = protocol_major_version
+        self.protocol_minor_version = protocol_minor_version
+        self.protocol_patch_version = protocol_patch_version
+        self.message_priority = message_priority
+        self.message_major_type = message_major_type
+        self.message_minor_type = message_minor_type
+        self.sender_id = sender_id
+        self.sender_sub_id = sender_sub_id
+        self.sender_seq = sender_seq
+        self.sender_sid = sender_sid
+        self.receiver_id = receiver_id
+        self.receiver_sub_id = receiver_sub_id
+        self.response_seq = response_seq
+        self.response_sid = response_sid
+        self.token = token
+        self.body = body
+
+
+for cls in (Sensorgram, Datagram, Message):
+    cls.field_set = frozenset(cls.__slots__)
+
+
 class Encoder:
 
     def __init__(self, writer):
@@ -213,14 +359,8 @@ class Decoder:
         body_type = self.decode_int(1)
         body = self.decode_bytes(body_length)
 
-        return decode_value_type({
-            'sensor_id': sensor_id,
-            'sensor_instance': sensor_instance,
-            'parameter_id': parameter_id,
-            'timestamp': timestamp,
-            'type': body_type,
-            'value': body,
-        })
+        return Sensorgram(sensor_id, sensor_instance, parameter_id, timestamp,
+                          body_type, unpack_typed_value(body_type, body))
 
     def decode_datagram(self):
         start_flag = self.decode_int(1)
@@ -250,18 +390,14 @@ class Decoder:
         if end_flag != END_FLAG:
             raise ValueError('Invalid end flag.')
 
-        return {
-            'timestamp': timestamp,
-            'packet_seq': packet_seq,
-            'packet_type': packet_type,
-            'plugin_id': plugin_id,
-            'plugin_major_version': plugin_major_version,
-            'plugin_minor_version': plugin_minor_version,
-            'plugin_patch_version': plugin_patch_version,
-            'plugin_instance': plugin_instance,
-            'plugin_run_id': plugin_run_id,
-            'body': body,
-        }
+        if packet_type == PACKET_TYPE_COMPRESSED:
+            packet_type = PACKET_TYPE_SENSORGRAMS
+            body = decompress_body(body)
+
+        return Datagram(timestamp, packet_seq, packet_type, plugin_id,
+                        plugin_major_version, plugin_minor_version,
+                        plugin_patch_version, plugin_instance, plugin_run_id,
+                        body)
 
     def decode_waggle_packet(self):
         header = self.decode_bytes(58)
@@ -296,25 +432,11 @@ class Decoder:
         if crc32(body) != body_crc:
             raise ValueError('Invalid body CRC.')
 
-        return {
-            'timestamp': timestamp,
-            'protocol_major_version': protocol_major_version,
-            'protocol_minor_version': protocol_minor_version,
-            'protocol_patch_version': protocol_patch_version,
-            'message_priority': message_priority,
-            'message_major_type': message_major_type,
-            'message_minor_type': message_minor_type,
-            'sender_id': sender_id,
-            'sender_sub_id': sender_sub_id,
-            'sender_seq': sender_seq,
-            'sender_sid': sender_sid,
-            'receiver_id': receiver_id,
-            'receiver_sub_id': receiver_sub_id,
-            'response_seq': response_seq,
-            'response_sid': response_sid,
-            'token': token,
-            'body': body,
-        }
+        return Message(timestamp, protocol_major_version, protocol_minor_version,
+                       protocol_patch_version, message_priority,
+                       message_major_type, message_minor_type, sender_id,
+                       sender_sub_id, sender_seq, sender_sid, receiver_id,
+                       receiver_sub_id, response_seq, response_sid, token, body)
 
 
 TYPE_BYTES = 0
@@ -343,6 +465,26 @@ TYPE_FLOAT32 = 30
 # TODO make sure type table IDs are organized
 TYPE_LIST_OF_FLOAT32 = 130
 
+# array types. elements are packed little endian and the element count is the
+# body length divided by the element size.
+TYPE_ARRAY_UINT8 = 140
+TYPE_ARRAY_UINT16 = 141
+TYPE_ARRAY_INT16 = 142
+TYPE_ARRAY_UINT32 = 143
+TYPE_ARRAY_FLOAT32 = 144
+TYPE_ARRAY_FLOAT64 = 145
+
+array_type_dtypes = {
+    TYPE_ARRAY_UINT8: '<u1',
+    TYPE_ARRAY_UINT16: '<u2',
+    TYPE_ARRAY_INT16: '<i2',
+    TYPE_ARRAY_UINT32: '<u4',
+    TYPE_ARRAY_FLOAT32: '<f4',
+    TYPE_ARRAY_FLOAT64: '<f8',
+}
+
+dtype_array_types = {dtype: type for type, dtype in array_type_dtypes.items()}
+
 
 def pack_typed_value(value):
     if isinstance(value, (bytes, bytearray)):
@@ -372,9 +514,51 @@ def pack_typed_value(value):
     if isinstance(value, list) and isinstance(value[0], float):
         return TYPE_LIST_OF_FLOAT32, struct.pack('{}f'.format(len(value)), *value)
 
+    if isinstance(value, array.array):
+        return pack_array_value(value)
+
+    # numpy arrays are detected by their attributes so numpy is not required
+    if getattr(value, 'ndim', 0) > 0 and hasattr(value, 'dtype'):
+        return pack_ndarray_value(value)
+
     raise ValueError('Unsupported value type.')
 
 
+def get_array_type(kind, itemsize):
+    try:
+        return dtype_array_types['<{}{}'.format(kind, itemsize)]
+    except KeyError:
+        raise ValueError('Unsupported array type.')
+
+
+def pack_array_value(value):
+    if value.typecode in 'fd':
+        kind = 'f'
+    elif value.typecode in 'bhilq':
+        kind = 'i'
+    else:
+        kind = 'u'
+
+    type = get_array_type(kind, value.itemsize)
+
+    if sys.byteorder != 'little':
+        value = array.array(value.typecode, value)
+        value.byteswap()
+
+    return type, memoryview(value).cast('B')
+
+
+def pack_ndarray_value(value):
+    if value.ndim != 1:
+        raise ValueError('Array values must be one dimensional.')
+
+    type = get_array_type(value.dtype.kind, value.dtype.itemsize)
+
+    # no copy is made if value is already a contiguous little endian array
+    value = value.astype(array_type_dtypes[type], order='C', copy=False)
+    return type, memoryview(value).cast('B')
+
+
 def packed_type_int_value(value):
     try:
         return TYPE_INT8, value.to_bytes(1, byteorder='big', signed=True)
@@ -450,9 +634,21 @@ def unpack_list_of_float32(x):
     return list(struct.unpack('{}f'.format(n), x))
 
 
+def unpack_array(x, dtype):
+    """
+    Returns a numpy array over x without copying. The array keeps the buffer x
+    views alive.
+    """
+    import numpy
+
+    return numpy.frombuffer(x, dtype=dtype)
+
+
+# NOTE unpack functions accept any bytes-like object, so values can be decoded
+# directly from a memoryview over the sensorgram body.
 unpack_type_table = {
-    TYPE_BYTES: lambda x: x,
-    TYPE_STRING: bytes.decode,
+    TYPE_BYTES: bytes,
+    TYPE_STRING: lambda x: str(x, 'utf-8'),
     TYPE_NULL: lambda x: None,
     TYPE_FALSE: lambda x: False,
     TYPE_TRUE: lambda x: True,
@@ -472,6 +668,13 @@ unpack_type_table = {
     TYPE_FLOAT32: unpack_float32,
 
     TYPE_LIST_OF_FLOAT32: unpack_list_of_float32,
+
+    TYPE_ARRAY_UINT8: lambda x: unpack_array(x, '<u1'),
+    TYPE_ARRAY_UINT16: lambda x: unpack_array(x, '<u2'),
+    TYPE_ARRAY_INT16: lambda x: unpack_array(x, '<i2'),
+    TYPE_ARRAY_UINT32: lambda x: unpack_array(x, '<u4'),
+    TYPE_ARRAY_FLOAT32: lambda x: unpack_array(x, '<f4'),
+    TYPE_ARRAY_FLOAT64: lambda x: unpack_array(x, '<f8'),
 }
 
 
@@ -483,17 +686,12 @@ def encode_value_type(sensorgram):
     if 'type' in sensorgram:
         return sensorgram
 
-    sensorgram = sensorgram.copy()
     type, value = pack_typed_value(sensorgram['value'])
-    sensorgram['type'] = type
-    sensorgram['value'] = value
-    return sensorgram
+    return replace_fields(sensorgram, type=type, value=value)
 
 
 def decode_value_type(sensorgram):
-    sensorgram = sensorgram.copy()
-    sensorgram['value'] = unpack_typed_value(sensorgram['type'], sensorgram['value'])
-    return sensorgram
+    return replace_fields(sensorgram, value=unpack_typed_value(sensorgram['type'], sensorgram['value']))
 
 
 def make_pack_function(func):
@@ -526,15 +724,658 @@ def make_unpack_function(func):
     return unpacker
 
 
-pack_sensorgrams = make_pack_function(Encoder.encode_sensorgram)
-pack_datagrams = make_pack_function(Encoder.encode_datagram)
-pack_waggle_packets = make_pack_function(Encoder.encode_waggle_packet)
+# The functions below are struct based versions of the Encoder / Decoder
+# methods. They produce and accept exactly the same bytes, but pack every
+# header with a single precompiled struct into one preallocated buffer and
+# decode headers in place with unpack_from over a memoryview. Three byte
+# fields are split into a high byte and a low short.
+
+# body_length, sensor_id, sensor_instance, parameter_id, timestamp, type
+SENSORGRAM_HEADER = struct.Struct('>HHBBIB')
+
+# start_flag, body_length (hi, lo), protocol_version, timestamp, packet_seq,
+# packet_type, plugin_id, plugin_major_version, plugin_minor_version,
+# plugin_patch_version, plugin_instance, plugin_run_id
+DATAGRAM_HEADER = struct.Struct('>BBHBIHBHBBBBH')
+
+# body_crc, end_flag
+DATAGRAM_FOOTER = struct.Struct('>BB')
+
+# protocol_major_version, protocol_minor_version, protocol_patch_version,
+# message_priority, body_length, timestamp, message_major_type,
+# message_minor_type, reserved, sender_id, sender_sub_id, receiver_id,
+# receiver_sub_id, sender_seq (hi, lo), sender_sid, response_seq (hi, lo),
+# response_sid
+WAGGLE_PACKET_HEADER = struct.Struct('>BBBBIIBBH8s8s8s8sBHHBHH')
+
+# header_crc, token
+WAGGLE_PACKET_HEADER_TRAILER = struct.Struct('>HI')
+
+# body_crc
+WAGGLE_PACKET_FOOTER = struct.Struct('>I')
+
+
+def get_sensorgram_fields(value):
+    value = encode_value_type(value)
+
+    return (
+        value['sensor_id'],
+        value.get('sensor_instance', 0),
+        value['parameter_id'],
+        get_timestamp_or_now(value),
+        value['type'],
+        value['value'],
+    )
+
+
+def pack_sensorgrams(sensorgrams):
+    items = [get_sensorgram_fields(sensorgram) for sensorgram in sensorgrams]
+
+    size = SENSORGRAM_HEADER.size
+    buf = bytearray(sum(size + len(item[5]) for item in items))
+    offset = 0
+
+    for sensor_id, sensor_instance, parameter_id, timestamp, body_type, body in items:
+        body_length = len(body)
+        SENSORGRAM_HEADER.pack_into(buf, offset, body_length, sensor_id,
+                                    sensor_instance, parameter_id, timestamp,
+                                    body_type)
+        offset += size
+        buf[offset:offset + body_length] = body
+        offset += body_length
+
+    return bytes(buf)
+
+
+def get_datagram_fields(value):
+    return (
+        value.get('protocol_version', PROTOCOL_MAJOR_VERSION),
+        get_timestamp_or_now(value),
+        value.get('packet_seq', get_packet_sequence_number()),
+        value.get('packet_type', 0),
+        value.get('plugin_id', 0),
+        value.get('plugin_major_version', 0),
+        value.get('plugin_minor_version', 0),
+        value.get('plugin_patch_version', 0),
+        value.get('plugin_instance', 0),
+        value.get('plugin_run_id', RUN_ID),
+        value['body'],
+    )
+
+
+def pack_datagrams(datagrams):
+    items = [get_datagram_fields(datagram) for datagram in datagrams]
+
+    size = DATAGRAM_HEADER.size + DATAGRAM_FOOTER.size
+    buf = bytearray(sum(size + len(item[10]) for item in items))
+    offset = 0
+
+    for item in items:
+        body = item[10]
+        body_length = len(body)
+        DATAGRAM_HEADER.pack_into(buf, offset, START_FLAG,
+                                  body_length >> 16, body_length & 0xffff,
+                                  *item[:10])
+        offset += DATAGRAM_HEADER.size
+        buf[offset:offset + body_length] = body
+        offset += body_length
+        DATAGRAM_FOOTER.pack_into(buf, offset, crc8(body), END_FLAG)
+        offset += DATAGRAM_FOOTER.size
+
+    return bytes(buf)
+
+
+# A compressed datagram body is a dictionary ID byte followed by a raw deflate
+# stream which uses that dictionary as its preset dictionary. Dictionary 0 is
+# empty and is the only one shipped so far. Others are loaded from the
+# dictionaries directory and should be produced by waggle.protocol.v0.dictionary
+# from captured sensorgram streams. Decoders need every dictionary which was
+# ever used, so a dictionary must never be changed once deployed and a
+# retrained one gets a new ID.
+DICTIONARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dictionaries')
+DEFAULT_DICTIONARY_ID = 0
+
+dictionaries = {0: b''}
+
+
+def get_dictionary(dictionary_id):
+    try:
+        return dictionaries[dictionary_id]
+    except KeyError:
+        pass
+
+    try:
+        with open(os.path.join(DICTIONARY_DIR, '{}.bin'.format(dictionary_id)), 'rb') as file:
+            dictionary = file.read()
+    except FileNotFoundError:
+        raise ValueError('Unknown compression dictionary {}.'.format(dictionary_id))
+
+    dictionaries[dictionary_id] = dictionary
+    return dictionary
+
+
+def compress_body(body, dictionary_id=DEFAULT_DICTIONARY_ID, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=get_dictionary(dictionary_id))
+    return bytes([dictionary_id]) + compressor.compress(body) + compressor.flush()
+
+
+def decompress_body(body):
+    if len(body) == 0:
+        raise ValueError('Invalid compressed body.')
+
+    decompressor = zlib.decompressobj(-15, zdict=get_dictionary(body[0]))
+
+    try:
+        data = decompressor.decompress(body[1:], MAX_DATAGRAM_BODY_LENGTH)
+    except zlib.error:
+        raise ValueError('Invalid compressed body.')
+
+    if not decompressor.eof or decompressor.unconsumed_tail:
+        raise ValueError('Invalid compressed body.')
+
+    return data
+
+
+def compress_datagram(datagram, dictionary_id=DEFAULT_DICTIONARY_ID, level=6):
+    """
+    Returns a copy of datagram with a compressed body if that is smaller than
+    its body. Otherwise, returns datagram unchanged.
+    """
+    body = compress_body(datagram['body'], dictionary_id, level)
+
+    if len(body) >= len(datagram['body']):
+        return datagram
+
+    return replace_fields(datagram, packet_type=PACKET_TYPE_COMPRESSED, body=body)
+
+
+def get_device_id_bytes(value, key):
+    b = bytes.fromhex(value.get(key, '0000000000000000'))
+    assert_length(b, 8)
+    return b
+
+
+def get_waggle_packet_fields(value):
+    body = value['body']
+    body_length = len(body)
+    sender_seq = value.get('sender_seq', get_sender_sequence_number())
+    response_seq = value.get('response_seq', 0)
+
+    # NOTE minor and patch versions intentionally mirror the lookups done by
+    # Encoder.encode_waggle_packet_header to remain byte compatible.
+    header = (
+        value.get('protocol_major_version', PROTOCOL_MAJOR_VERSION),
+        value.get('protocol_major_version', PROTOCOL_MINOR_VERSION),
+        value.get('protocol_major_version', PROTOCOL_PATCH_VERSION),
+        value.get('message_priority', 0),
+        body_length,
+        get_timestamp_or_now(value),
+        value.get('message_major_type', 0),
+        value.get('message_minor_type', 0),
+        0,
+        get_device_id_bytes(value, 'sender_id'),
+        get_device_id_bytes(value, 'sender_sub_id'),
+        get_device_id_bytes(value, 'receiver_id'),
+        get_device_id_bytes(value, 'receiver_sub_id'),
+        sender_seq >> 16,
+        sender_seq & 0xffff,
+        value.get('sender_sid', 0),
+        response_seq >> 16,
+        response_seq & 0xffff,
+        value.get('response_sid', 0),
+    )
+
+    return header, value.get('token', 0), body
+
+
+def pack_waggle_packets(packets):
+    items = [get_waggle_packet_fields(packet) for packet in packets]
+
+    size = (WAGGLE_PACKET_HEADER.size +
+            WAGGLE_PACKET_HEADER_TRAILER.size +
+            WAGGLE_PACKET_FOOTER.size)
+    buf = bytearray(sum(size + len(item[2]) for item in items))
+    view = memoryview(buf)
+    offset = 0
+
+    for header, token, body in items:
+        body_length = len(body)
+        WAGGLE_PACKET_HEADER.pack_into(buf, offset, *header)
+        header_crc = crc16(view[offset:offset + WAGGLE_PACKET_HEADER.size])
+        offset += WAGGLE_PACKET_HEADER.size
+        WAGGLE_PACKET_HEADER_TRAILER.pack_into(buf, offset, header_crc, token)
+        offset += WAGGLE_PACKET_HEADER_TRAILER.size
+        buf[offset:offset + body_length] = body
+        offset += body_length
+        WAGGLE_PACKET_FOOTER.pack_into(buf, offset, crc32(body))
+        offset += WAGGLE_PACKET_FOOTER.size
+
+    view.release()
+    return bytes(buf)
+
+
 pack_messages = pack_waggle_packets
 
-unpack_sensorgrams = make_unpack_function(Decoder.decode_sensorgram)
-unpack_datagrams = make_unpack_function(Decoder.decode_datagram)
-unpack_waggle_packets = make_unpack_function(Decoder.decode_waggle_packet)
+
+def unpack_sensorgrams(buf):
+    items = []
+
+    view = memoryview(buf)
+    size = SENSORGRAM_HEADER.size
+    end = len(view)
+    offset = 0
+
+    while offset + size <= end:
+        (body_length, sensor_id, sensor_instance,
+         parameter_id, timestamp, body_type) = SENSORGRAM_HEADER.unpack_from(view, offset)
+
+        start = offset + size
+        offset = start + body_length
+
+        if offset > end:
+            break
+
+        items.append(Sensorgram(sensor_id, sensor_instance, parameter_id, timestamp,
+                                body_type, unpack_typed_value(body_type, view[start:offset])))
+
+    return items
+
+
+def unpack_datagrams(buf):
+    items = []
+
+    view = memoryview(buf)
+    size = DATAGRAM_HEADER.size
+    end = len(view)
+    offset = 0
+
+    while offset < end:
+        if view[offset] != START_FLAG:
+            raise ValueError('Invalid start flag.')
+
+        if offset + size > end:
+            break
+
+        (_, body_length_hi, body_length_lo, protocol_version, timestamp,
+         packet_seq, packet_type, plugin_id, plugin_major_version,
+         plugin_minor_version, plugin_patch_version, plugin_instance,
+         plugin_run_id) = DATAGRAM_HEADER.unpack_from(view, offset)
+
+        start = offset + size
+        stop = start + ((body_length_hi << 16) | body_length_lo)
+
+        if stop + 1 > end:
+            break
+
+        body = view[start:stop]
+
+        if crc8(body) != view[stop]:
+            raise ValueError('Invalid body CRC.')
+
+        if stop + 2 > end:
+            break
+
+        if view[stop + 1] != END_FLAG:
+            raise ValueError('Invalid end flag.')
+
+        offset = stop + DATAGRAM_FOOTER.size
+
+        if packet_type == PACKET_TYPE_COMPRESSED:
+            packet_type = PACKET_TYPE_SENSORGRAMS
+            body = decompress_body(body)
+
+        items.append(Datagram(timestamp, packet_seq, packet_type, plugin_id,
+                              plugin_major_version, plugin_minor_version,
+                              plugin_patch_version, plugin_instance,
+                              plugin_run_id, bytes(body)))
+
+    return items
+
+
+def unpack_waggle_packet_from(view, offset=0):
+    """
+    Unpacks the waggle packet starting at offset in view. Returns the packet
+    and the offset following it, or None if view ends before the packet does.
+    """
+    size = WAGGLE_PACKET_HEADER.size
+    trailer_size = WAGGLE_PACKET_HEADER_TRAILER.size
+    end = len(view)
+
+    if offset + size + 2 > end:
+        return None
+
+    header_crc = int.from_bytes(view[offset + size:offset + size + 2], 'big')
+
+    if crc16(view[offset:offset + size]) != header_crc:
+        raise ValueError('Invalid header CRC.')
+
+    if offset + size + trailer_size > end:
+        return None
+
+    (protocol_major_version, protocol_minor_version, protocol_patch_version,
+     message_priority, body_length, timestamp, message_major_type,
+     message_minor_type, _, sender_id, sender_sub_id, receiver_id,
+     receiver_sub_id, sender_seq_hi, sender_seq_lo, sender_sid,
+     response_seq_hi, response_seq_lo,
+     response_sid) = WAGGLE_PACKET_HEADER.unpack_from(view, offset)
+
+    _, token = WAGGLE_PACKET_HEADER_TRAILER.unpack_from(view, offset + size)
+    start = offset + size + trailer_size
+    stop = start + body_length
+
+    if stop + WAGGLE_PACKET_FOOTER.size > end:
+        return None
+
+    body = view[start:stop]
+
+    if crc32(body) != WAGGLE_PACKET_FOOTER.unpack_from(view, stop)[0]:
+        raise ValueError('Invalid body CRC.')
+
+    return Message(timestamp, protocol_major_version, protocol_minor_version,
+                   protocol_patch_version, message_priority, message_major_type,
+                   message_minor_type, sender_id.hex(), sender_sub_id.hex(),
+                   (sender_seq_hi << 16) | sender_seq_lo, sender_sid,
+                   receiver_id.hex(), receiver_sub_id.hex(),
+                   (response_seq_hi << 16) | response_seq_lo, response_sid,
+                   token, bytes(body)), stop + WAGGLE_PACKET_FOOTER.size
+
+
+def unpack_waggle_packets(buf):
+    items = []
+
+    view = memoryview(buf)
+    offset = 0
+
+    while True:
+        result = unpack_waggle_packet_from(view, offset)
+
+        if result is None:
+            break
+
+        item, offset = result
+        items.append(item)
+
+    return items
+
+
+def read_waggle_packets(reader, chunk_size=65536):
+    """
+    Incrementally unpacks waggle packets from a binary file-like object such
+    as stdin or socket.makefile('rb'). Packets are yielded as soon as they are
+    complete and only a partial packet is buffered between reads. As with
+    unpack_waggle_packets, trailing incomplete data is ignored.
+    """
+    read = getattr(reader, 'read1', reader.read)
+    buf = bytearray()
+
+    while True:
+        chunk = read(chunk_size)
+
+        if not chunk:
+            break
+
+        buf += chunk
+        offset = 0
+
+        with memoryview(buf) as view:
+            while True:
+                result = unpack_waggle_packet_from(view, offset)
+
+                if result is None:
+                    break
+
+                item, offset = result
+                yield item
+
+        del buf[:offset]
+
+
+# The views below decode header fields straight from the packet buffer when
+# they are accessed. Unlike the unpack functions, they neither check the body
+# CRC nor copy the body unless asked, so routing code can inspect and forward
+# packets without decoding them.
+
+UINT16 = struct.Struct('>H')
+UINT32 = struct.Struct('>I')
+
+WAGGLE_PACKET_BODY_OFFSET = WAGGLE_PACKET_HEADER.size + WAGGLE_PACKET_HEADER_TRAILER.size
+
+
+def packet_body_length_at(view, offset=0):
+    """
+    Returns the body length of the waggle packet at offset in view after
+    checking its header CRC, or None if view ends before the header does.
+    Raises ValueError if the header CRC is invalid, since the body length
+    cannot be trusted then.
+    """
+    if offset + WAGGLE_PACKET_BODY_OFFSET > len(view):
+        return None
+
+    start = offset + WAGGLE_PACKET_HEADER.size
+
+    if crc16(view[offset:start]) != UINT16.unpack_from(view, start)[0]:
+        raise ValueError('Invalid header CRC.')
+
+    return UINT32.unpack_from(view, offset + 4)[0]
+
+
+class PacketView:
+    """
+    Lazy view of the waggle packet at offset in a memoryview. The header CRC
+    is checked before the body length is used.
+    """
+
+    def __init__(self, view, offset=0):
+        body_length = packet_body_length_at(view, offset)
+
+        if body_length is None:
+            raise ValueError('Incomplete packet header.')
+
+        self.view = view
+        self.offset = offset
+        self.body_length = body_length
+        self.size = WAGGLE_PACKET_BODY_OFFSET + self.body_length + WAGGLE_PACKET_FOOTER.size
+
+        if offset + self.size > len(view):
+            raise ValueError('Incomplete packet.')
+
+    def device_id(self, start):
+        start += self.offset
+        return self.view[start:start + 8].hex()
+
+    @property
+    def timestamp(self):
+        return UINT32.unpack_from(self.view, self.offset + 8)[0]
+
+    @property
+    def message_major_type(self):
+        return self.view[self.offset + 12]
+
+    @property
+    def message_minor_type(self):
+        return self.view[self.offset + 13]
+
+    @property
+    def sender_id(self):
+        return self.device_id(16)
+
+    @property
+    def sender_sub_id(self):
+        return self.device_id(24)
+
+    @property
+    def receiver_id(self):
+        return self.device_id(32)
+
+    @property
+    def receiver_sub_id(self):
+        return self.device_id(40)
+
+    @property
+    def data(self):
+        """Memoryview of the whole packet."""
+        return self.view[self.offset:self.offset + self.size]
+
+    @property
+    def body(self):
+        """Memoryview of the body. The body CRC is not checked."""
+        start = self.offset + WAGGLE_PACKET_BODY_OFFSET
+        return self.view[start:start + self.body_length]
+
+    @property
+    def datagram(self):
+        """DatagramView of the first datagram in the body."""
+        return DatagramView(self.body)
+
+    def verify_header(self):
+        start = self.offset + WAGGLE_PACKET_HEADER.size
+
+        if crc16(self.view[self.offset:start]) != UINT16.unpack_from(self.view, start)[0]:
+            raise ValueError('Invalid header CRC.')
+
+    def verify(self):
+        """Checks the header and body CRCs and raises ValueError if either is invalid."""
+        self.verify_header()
+
+        if crc32(self.body) != UINT32.unpack_from(self.view, self.offset + self.size - 4)[0]:
+            raise ValueError('Invalid body CRC.')
+
+    def unpack(self):
+        """Fully unpacks and checks the packet, like unpack_message."""
+        return unpack_waggle_packet_from(self.view, self.offset)[0]
+
+
+class DatagramView:
+    """
+    Lazy view of the datagram at offset in a memoryview.
+    """
+
+    def __init__(self, view, offset=0):
+        if offset + DATAGRAM_HEADER.size > len(view):
+            raise ValueError('Incomplete datagram header.')
+
+        if view[offset] != START_FLAG:
+            raise ValueError('Invalid start flag.')
+
+        self.view = view
+        self.offset = offset
+        self.body_length = (view[offset + 1] << 16) | UINT16.unpack_from(view, offset + 2)[0]
+        self.size = DATAGRAM_HEADER.size + self.body_length + DATAGRAM_FOOTER.size
+
+        if offset + self.size > len(view):
+            raise ValueError('Incomplete datagram.')
+
+    @property
+    def protocol_version(self):
+        return self.view[self.offset + 4]
+
+    @property
+    def timestamp(self):
+        return UINT32.unpack_from(self.view, self.offset + 5)[0]
+
+    @property
+    def packet_seq(self):
+        return UINT16.unpack_from(self.view, self.offset + 9)[0]
+
+    @property
+    def packet_type(self):
+        return self.view[self.offset + 11]
+
+    @property
+    def plugin_id(self):
+        return UINT16.unpack_from(self.view, self.offset + 12)[0]
+
+    @property
+    def plugin_version(self):
+        start = self.offset + 14
+        return tuple(self.view[start:start + 3])
+
+    @property
+    def plugin_instance(self):
+        return self.view[self.offset + 17]
+
+    @property
+    def plugin_run_id(self):
+        return UINT16.unpack_from(self.view, self.offset + 18)[0]
+
+    @property
+    def data(self):
+        """Memoryview of the whole datagram."""
+        return self.view[self.offset:self.offset + self.size]
+
+    @property
+    def body(self):
+        """
+        Memoryview of the body as sent. The body CRC is not checked and
+        compressed bodies are not decompressed.
+        """
+        start = self.offset + DATAGRAM_HEADER.size
+        return self.view[start:start + self.body_length]
+
+    def verify(self):
+        """Checks the body CRC and end flag and raises ValueError if either is invalid."""
+        stop = self.offset + self.size
+
+        if crc8(self.body) != self.view[stop - 2]:
+            raise ValueError('Invalid body CRC.')
+
+        if self.view[stop - 1] != END_FLAG:
+            raise ValueError('Invalid end flag.')
+
+    def unpack(self):
+        """Fully unpacks and checks the datagram, like unpack_datagram."""
+        return unpack_datagrams(self.data)[0]
+
+
+def iter_packet_views(buf):
+    """
+    Yields a PacketView for each waggle packet in buf. Header CRCs are checked,
+    since the body length is read from the header, and raise ValueError if
+    invalid. Body CRCs are not checked. As with unpack_waggle_packets, a
+    trailing incomplete header, or a valid header whose body is incomplete,
+    is ignored.
+    """
+    view = memoryview(buf)
+    offset = 0
+
+    while True:
+        body_length = packet_body_length_at(view, offset)
+
+        if body_length is None:
+            return
+
+        size = WAGGLE_PACKET_BODY_OFFSET + body_length + WAGGLE_PACKET_FOOTER.size
+
+        if offset + size > len(view):
+            return
+
+        packet = PacketView(view, offset)
+        yield packet
+        offset += packet.size
+
+
+def routing_key(packet):
+    """
+    Returns the routing key sender_id.sender_sub_id.plugin_id.major.minor.patch
+    for a PacketView.
+    """
+    datagram = packet.datagram
+    return '{}.{}.{}.{}.{}.{}'.format(packet.sender_id, packet.sender_sub_id,
+                                      datagram.plugin_id, *datagram.plugin_version)
+
+
+def route_packets(buf, key=routing_key):
+    """
+    Yields (key(packet), data) for each waggle packet in buf, where data is a
+    memoryview of the whole packet which can be forwarded as is. Raises
+    ValueError at the first packet with an invalid header CRC.
+    """
+    for packet in iter_packet_views(buf):
+        yield key(packet), packet.data
+
+
 unpack_messages = unpack_waggle_packets
+read_messages = read_waggle_packets
 
 
 def pack_message(message):
@@ -4,7 +4,10 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
+import array
+import pickle
 import unittest
+import numpy as np
 from io import BytesIO
 from protocol import *
 
@@ -185,6 +188,317 @@ class TestProtocol(unittest.TestCase):
             else:
                 self.assertEqual(v1, v2)
 
+    def test_typed_arrays(self):
+        testcases = [
+            (np.arange(256, dtype=np.uint8), TYPE_ARRAY_UINT8),
+            (np.arange(2048, dtype=np.uint16), TYPE_ARRAY_UINT16),
+            (np.arange(-100, 100, dtype=np.int16), TYPE_ARRAY_INT16),
+            (np.arange(100, dtype=np.uint32) * 100000, TYPE_ARRAY_UINT32),
+            (np.linspace(0, 1, 100, dtype=np.float32), TYPE_ARRAY_FLOAT32),
+            (np.linspace(0, 1, 100, dtype=np.float64), TYPE_ARRAY_FLOAT64),
+            (np.arange(10, dtype='>u2'), TYPE_ARRAY_UINT16),
+            (np.arange(20, dtype=np.float64)[::2], TYPE_ARRAY_FLOAT64),
+            (array.array('H', range(1024)), TYPE_ARRAY_UINT16),
+            (array.array('h', range(-10, 10)), TYPE_ARRAY_INT16),
+            (array.array('d', [1.5, 2.5]), TYPE_ARRAY_FLOAT64),
+        ]
+
+        reference_pack_sensorgrams = make_pack_function(Encoder.encode_sensorgram)
+
+        for value, value_type in testcases:
+            sensorgram = {'sensor_id': 1, 'parameter_id': 2, 'timestamp': 0, 'value': value}
+            data = pack_sensorgram(sensorgram)
+            self.assertEqual(data, reference_pack_sensorgrams([sensorgram]))
+
+            r = unpack_sensorgram(data)
+            self.assertEqual(r['type'], value_type)
+            np.testing.assert_array_equal(r['value'], np.asarray(value))
+
+        with self.assertRaises(ValueError):
+            pack_sensorgram({'sensor_id': 1, 'parameter_id': 2, 'value': np.zeros(3, dtype=np.int64)})
+
+        with self.assertRaises(ValueError):
+            pack_sensorgram({'sensor_id': 1, 'parameter_id': 2, 'value': np.zeros((2, 3), dtype=np.uint8)})
+
+        with self.assertRaises(ValueError):
+            pack_sensorgram({'sensor_id': 1, 'parameter_id': 2, 'value': np.array(3, dtype=np.uint8)})
+
+    def test_typed_array_zero_copy(self):
+        spectrum = np.arange(2048, dtype=np.uint16)
+        buf = bytearray(pack_sensorgrams([
+            {'sensor_id': 1, 'parameter_id': 1, 'value': 'spectrum'},
+            {'sensor_id': 1, 'parameter_id': 2, 'value': spectrum},
+        ]))
+
+        value = unpack_sensorgrams(buf)[1]['value']
+        np.testing.assert_array_equal(value, spectrum)
+
+        # decoded array is a view over the packed buffer
+        buf[-2:] = b'\xff\xff'
+        self.assertEqual(value[-1], 0xffff)
+
+    def test_compressed_datagram(self):
+        body = pack_sensorgrams([
+            {'sensor_id': 0xff00 + i % 8, 'parameter_id': i % 3, 'timestamp': 1540000000, 'value': i}
+            for i in range(100)
+        ])
+
+        # a preset dictionary made of a similar body
+        dictionaries[2] = pack_sensorgrams([
+            {'sensor_id': 0xff00 + i % 8, 'parameter_id': i % 3, 'timestamp': 1540000001, 'value': i + 1}
+            for i in range(20)
+        ])
+        self.addCleanup(dictionaries.pop, 2)
+
+        for dictionary_id in [DEFAULT_DICTIONARY_ID, 2]:
+            datagram = compress_datagram({'plugin_id': 4, 'body': body}, dictionary_id)
+            self.assertEqual(datagram['packet_type'], PACKET_TYPE_COMPRESSED)
+            self.assertLess(len(datagram['body']), len(body))
+
+            data = pack_datagram(datagram)
+
+            # decompression is transparent to both decoders
+            for r in [unpack_datagram(data), Decoder(BytesIO(data)).decode_datagram()]:
+                self.assertEqual(r['packet_type'], PACKET_TYPE_SENSORGRAMS)
+                self.assertEqual(r['plugin_id'], 4)
+                self.assertEqual(r['body'], body)
+
+        # bodies are left alone if compression does not save space
+        datagram = {'body': b'\x01\x02\x03'}
+        self.assertIs(compress_datagram(datagram), datagram)
+
+    def test_compressed_datagram_invalid(self):
+        body = bytearray(compress_body(b'x' * 100))
+
+        with self.assertRaises(ValueError):
+            decompress_body(body[:-1])
+
+        with self.assertRaises(ValueError):
+            decompress_body(bytes([200]) + body[1:])
+
+        with self.assertRaises(ValueError):
+            unpack_datagram(pack_datagram({'packet_type': PACKET_TYPE_COMPRESSED, 'body': b'\x00\xff\xff'}))
+
+    def test_train_dictionary(self):
+        from dictionary import train_dictionary, evaluate
+
+        samples = [pack_sensorgrams([
+            {'sensor_id': 0xff00 + i, 'parameter_id': 1, 'timestamp': 1540000000 + t, 'value': t * i}
+            for i in range(30)
+        ]) for t in range(100)]
+
+        dictionary = train_dictionary(samples[:80], size=1024)
+        self.assertLessEqual(len(dictionary), 1024)
+        self.assertLess(evaluate(samples[80:], dictionary, 6)['bytes'],
+                        evaluate(samples[80:], b'', 6)['bytes'])
+
+    def test_pack_matches_encoder(self):
+        reference_pack_sensorgrams = make_pack_function(Encoder.encode_sensorgram)
+        reference_pack_datagrams = make_pack_function(Encoder.encode_datagram)
+        reference_pack_waggle_packets = make_pack_function(Encoder.encode_waggle_packet)
+
+        sensorgrams = [dict(c, timestamp=1234) for c in self.sensorgram_test_cases]
+        self.assertEqual(pack_sensorgrams(sensorgrams),
+                         reference_pack_sensorgrams(sensorgrams))
+
+        datagrams = [dict(c, timestamp=1234, packet_seq=i, plugin_run_id=99)
+                     for i, c in enumerate(self.datagram_test_cases)]
+        self.assertEqual(pack_datagrams(datagrams),
+                         reference_pack_datagrams(datagrams))
+
+        packets = [dict(c, timestamp=1234, sender_seq=0x123456 + i, response_seq=0xabcdef)
+                   for i, c in enumerate(self.waggle_packet_test_cases)]
+        self.assertEqual(pack_waggle_packets(packets),
+                         reference_pack_waggle_packets(packets))
+
+    def test_unpack_matches_decoder(self):
+        reference_unpack_sensorgrams = make_unpack_function(Decoder.decode_sensorgram)
+        reference_unpack_datagrams = make_unpack_function(Decoder.decode_datagram)
+        reference_unpack_waggle_packets = make_unpack_function(Decoder.decode_waggle_packet)
+
+        data = pack_sensorgrams(self.sensorgram_test_cases)
+        self.assertEqual(unpack_sensorgrams(data), reference_unpack_sensorgrams(data))
+
+        data = pack_datagrams(self.datagram_test_cases)
+        self.assertEqual(unpack_datagrams(data), reference_unpack_datagrams(data))
+
+        data = pack_waggle_packets(self.waggle_packet_test_cases)
+        self.assertEqual(unpack_waggle_packets(data), reference_unpack_waggle_packets(data))
+
+    def test_unpack_truncated(self):
+        data = pack_waggle_packets(self.waggle_packet_test_cases)
+
+        for n in [0, 10, 59, 60, 70, len(data) - 1]:
+            self.assertEqual(unpack_waggle_packets(data[:n]),
+                             make_unpack_function(Decoder.decode_waggle_packet)(data[:n]))
+
+    def test_unpack_invalid_crc(self):
+        data = bytearray(pack_datagram({'plugin_id': 1, 'body': b'123'}))
+        data[-2] ^= 0xff
+
+        with self.assertRaises(ValueError):
+            unpack_datagrams(bytes(data))
+
+    def test_read_waggle_packets(self):
+        data = pack_waggle_packets(self.waggle_packet_test_cases)
+        expected = unpack_waggle_packets(data)
+
+        for chunk_size in [1, 7, 64, 1024, len(data)]:
+            results = list(read_waggle_packets(BytesIO(data), chunk_size=chunk_size))
+            self.assertEqual(results, expected)
+
+        results = list(read_waggle_packets(BytesIO(data[:-1]), chunk_size=64))
+        self.assertEqual(results, expected[:-1])
+
+    def test_records(self):
+        data = pack_sensorgram({'sensor_id': 1, 'parameter_id': 2, 'timestamp': 3, 'value': 4})
+        sensorgram = unpack_sensorgram(data)
+
+        self.assertIsInstance(sensorgram, Sensorgram)
+        self.assertFalse(hasattr(sensorgram, '__dict__'))
+        self.assertEqual(sensorgram['sensor_id'], 1)
+        self.assertEqual(sensorgram.parameter_id, 2)
+        self.assertEqual(sensorgram.get('value'), 4)
+        self.assertIsNone(sensorgram.get('missing'))
+        self.assertIn('timestamp', sensorgram)
+        self.assertNotIn('copy', sensorgram)
+
+        with self.assertRaises(KeyError):
+            sensorgram['copy']
+
+        expected = {
+            'sensor_id': 1,
+            'sensor_instance': 0,
+            'parameter_id': 2,
+            'timestamp': 3,
+            'type': TYPE_UINT8,
+            'value': 4,
+        }
+
+        self.assertEqual(dict(sensorgram), expected)
+        self.assertEqual(sensorgram, expected)
+        self.assertEqual(expected, sensorgram)
+        self.assertEqual(sensorgram.copy(), sensorgram)
+        self.assertEqual(pickle.loads(pickle.dumps(sensorgram)), sensorgram)
+
+        message = unpack_message(pack_message({'body': pack_datagram({'body': data})}))
+        self.assertIsInstance(message, Message)
+        self.assertIsInstance(unpack_datagram(message['body']), Datagram)
+        self.assertNotEqual(message, unpack_datagram(message['body']))
+
+    def test_replace_records(self):
+        sensorgram = unpack_sensorgram(pack_sensorgram({'sensor_id': 1, 'parameter_id': 2, 'value': 4}))
+        changed = sensorgram.replace(sensor_id=7)
+        self.assertIsInstance(changed, Sensorgram)
+        self.assertEqual(changed, dict(sensorgram, sensor_id=7))
+        self.assertEqual(sensorgram['sensor_id'], 1)
+
+        with self.assertRaises(ValueError):
+            sensorgram.replace(missing=1)
+
+        # value type helpers accept records as well as dicts
+        self.assertIs(encode_value_type(sensorgram), sensorgram)
+        encoded = Sensorgram(**encode_value_type({'sensor_id': 1, 'sensor_instance': 0, 'parameter_id': 2,
+                                                  'timestamp': 3, 'value': 1.5}))
+        decoded = decode_value_type(encoded)
+        self.assertIsInstance(decoded, Sensorgram)
+        self.assertEqual(decoded['value'], 1.5)
+
+        body = pack_sensorgrams([
+            {'sensor_id': 0xff00 + i % 8, 'parameter_id': i % 3, 'timestamp': 1540000000, 'value': i}
+            for i in range(100)
+        ])
+        datagram = unpack_datagram(pack_datagram({'plugin_id': 4, 'body': body}))
+        compressed = compress_datagram(datagram)
+        self.assertIsInstance(compressed, Datagram)
+        self.assertEqual(compressed['packet_type'], PACKET_TYPE_COMPRESSED)
+        self.assertEqual(unpack_datagram(pack_datagram(compressed)), datagram)
+
+    def test_packet_views(self):
+        datagram = pack_datagram({
+            'plugin_id': 37,
+            'plugin_major_version': 1,
+            'plugin_minor_version': 2,
+            'plugin_patch_version': 3,
+            'plugin_instance': 4,
+            'body': b'measurements',
+        })
+
+        data = pack_waggle_packets([{
+            'sender_id': '0000001e0610ba46',
+            'sender_sub_id': '0000000000000002',
+            'body': datagram,
+        }, {
+            'sender_id': '0000001e0610ba47',
+            'body': datagram,
+        }])
+
+        expected = unpack_waggle_packets(data)
+        packets = list(iter_packet_views(data + data[:70]))
+        self.assertEqual(len(packets), 2)
+
+        for packet, message in zip(packets, expected):
+            packet.verify()
+            self.assertEqual(packet.unpack(), message)
+            self.assertIsInstance(packet.body, memoryview)
+            self.assertEqual(bytes(packet.body), message['body'])
+
+            for field in ['sender_id', 'sender_sub_id', 'receiver_id', 'receiver_sub_id',
+                          'timestamp', 'message_major_type', 'message_minor_type']:
+                self.assertEqual(getattr(packet, field), message[field])
+
+            view = packet.datagram
+            view.verify()
+            self.assertEqual(view.unpack(), unpack_datagram(datagram))
+            self.assertEqual(view.plugin_id, 37)
+            self.assertEqual(view.plugin_version, (1, 2, 3))
+            self.assertEqual(view.plugin_instance, 4)
+            self.assertEqual(bytes(view.body), b'measurements')
+
+        self.assertEqual(list(route_packets(data)), [
+            ('0000001e0610ba46.0000000000000002.37.1.2.3', memoryview(data)[:len(data) // 2]),
+            ('0000001e0610ba47.0000000000000000.37.1.2.3', memoryview(data)[len(data) // 2:]),
+        ])
+
+    def test_packet_views_invalid(self):
+        data = bytearray(pack_message({'body': pack_datagram({'body': b'123'})}))
+
+        # body corruption is only detected when checked
+        data[-8] ^= 0xff
+        packet, = iter_packet_views(data)
+
+        with self.assertRaises(ValueError):
+            packet.verify()
+
+        with self.assertRaises(ValueError):
+            packet.datagram.verify()
+
+        # header corruption raises, since the length cannot be trusted
+        data[4] ^= 0xff
+
+        with self.assertRaises(ValueError):
+            list(iter_packet_views(data))
+
+        with self.assertRaises(ValueError):
+            list(route_packets(data))
+
+        with self.assertRaises(ValueError):
+            PacketView(memoryview(data))
+
+        # packets before a corrupted header are still yielded
+        valid = pack_message({'body': pack_datagram({'body': b'123'})})
+        packets = iter_packet_views(valid + data)
+        self.assertEqual(bytes(next(packets).data), valid)
+
+        with self.assertRaises(ValueError):
+            next(packets)
+
+        # a short trailing header is ignored
+        self.assertEqual(len(list(iter_packet_views(valid + valid[:10]))), 1)
+
+        with self.assertRaises(ValueError):
+            DatagramView(memoryview(b'123'))
+
 
 if __name__ == '__main__':
     unittest.main()
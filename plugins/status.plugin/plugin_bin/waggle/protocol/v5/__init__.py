@@ -39,8 +39,8 @@ def unpack_result(results, key, value, unit):
         results[key]['hrf_units'] = unit
 
 
-def unpack_sensors(packet):
-    unpacked_data = decode_frame(packet)
+def unpack_sensors(packet, sensors=None):
+    unpacked_data = decode_frame(packet, sensors=sensors)
 
     results = {}
 
@@ -19,56 +19,84 @@ HEADER_BYTE = 0xaa
 FOOTER_BYTE = 0x55
 
 
-def decode_frame(frame, required_version=2):
+def decode_frame(frame, required_version=2, sensors=None):
     """Decode a frame
     @params:
         - A byte array of the frame
-        - (optional) True for applying conversions
+        - (optional) Required protocol version
+        - (optional) Collection of sensor IDs to decode. Other sensors are skipped.
     @return:
         dict {sensorid: values, ...}
     """
+    return unpack_results(get_frame_data(frame, required_version), sensors)
+
+
+def get_frame_data(frame, required_version=2):
+    """
+    Validates each sub-frame of a frame and returns their concatenated data as
+    a memoryview. When the frame holds a single sub-frame, the result is a view
+    into frame and no data is copied.
+    """
     if logger.isEnabledFor(logging.DEBUG):
         logger.debug('Decoding datagram %s.', bytes(frame))
 
-    data = bytearray()
-
-    if not isinstance(frame, bytearray) and not isinstance(frame, bytes):
+    if not isinstance(frame, (bytes, bytearray, memoryview)):
         raise TypeError('frame must be byte-like type object')
 
-    while len(frame) != 0:
-        header = frame[0]
-        version = frame[1] & 0x0F
-        length = frame[2]
-        crc = frame[HEADER_SIZE + length]
-        footer = frame[HEADER_SIZE + length + 1]
-        subdata = frame[HEADER_SIZE:HEADER_SIZE + length]
+    frame = memoryview(frame)
+    chunks = []
+    offset = 0
+
+    while offset < len(frame):
+        if offset + HEADER_SIZE > len(frame):
+            raise RuntimeError('invalid length')
+
+        header = frame[offset]
+        version = frame[offset + 1] & 0x0F
+        length = frame[offset + 2]
+        start = offset + HEADER_SIZE
+        end = start + length
 
         if header != HEADER_BYTE:
             raise RuntimeError('invalid start byte')
 
+        if end + FOOTER_SIZE > len(frame):
+            raise RuntimeError('invalid length')
+
+        crc = frame[end]
+        footer = frame[end + 1]
+
         if footer != FOOTER_BYTE:
             raise RuntimeError('invalid end byte')
 
         if version != required_version:
             raise RuntimeError('invalid protocol version: target version is %d' % (required_version,))
 
-        if length != len(subdata):
-            raise RuntimeError('invalid length')
-
-        if crc != waggle.checksum.crc8(subdata):
+        if crc != waggle.checksum.crc8(frame[start:end]):
             raise RuntimeError('invalid crc')
 
-        subdata = frame[HEADER_SIZE + 1:HEADER_SIZE + length]
-        data.extend(subdata)
-        frame = frame[HEADER_SIZE + length + FOOTER_SIZE:]
+        chunks.append(frame[start + 1:end])
+        offset = end + FOOTER_SIZE
+
+    if len(chunks) == 1:
+        return chunks[0]
 
-    return unpack_results(data)
+    return memoryview(b''.join(chunks))
 
 
-def unpack_results(data):
+def iter_frame_subpackets(frame, required_version=2):
+    """
+    Validates a frame and returns a lazy iterator of (sensor_id, data) pairs,
+    where data is a memoryview of the subpacket or None if the sensor reported
+    invalid data. No sensor values are decoded.
+    """
+    return iter_data_subpackets(get_frame_data(frame, required_version))
+
+
+def unpack_results(data, sensors=None):
     results = {}
 
-    for sensor_id, names, values in decode_data(data):
+    for sensor_id, names, values in decode_data(data, sensors):
         if sensor_id not in results:
             results[sensor_id] = {}
 
@@ -94,31 +122,41 @@ for sensor_id in spec.keys():
 
     spec_cache[sensor_id] = (names, formats, lengths)
 
+# specialized unpack function for each sensor ID
+unpack_cache = {sensor_id: format.compile_unpack(formats, lengths)
+                for sensor_id, (_, formats, lengths) in spec_cache.items()}
+
+
+def decode_data(data, sensors=None):
+    for sensor_id, sensor_data in iter_data_subpackets(data):
+        if sensors is not None and sensor_id not in sensors:
+            continue
 
-def decode_data(data):
-    for sensor_id, sensor_data in get_data_subpackets(data):
         try:
-            names, formats, lengths = spec_cache[sensor_id]
+            names = spec_cache[sensor_id][0]
 
             if sensor_data is None:
                 yield sensor_id, names, ['invalid'] * len(names)
             else:
-                yield sensor_id, names, list(format.waggle_unpack(formats, lengths, sensor_data))
+                yield sensor_id, names, unpack_cache[sensor_id](sensor_data)
         except Exception as exc:
             logger.exception('Got an exception while decoding subpackets. sensor = {:02X}, data = {}'.format(sensor_id, repr(sensor_data)))
             continue
 
 
-def get_data_subpackets(data):
-    if logger.isEnabledFor(logging.DEBUG):
-        logger.debug('Reading subpackets in body %s.', bytes(data))
+def iter_data_subpackets(data):
+    debug = logger.isEnabledFor(logging.DEBUG)
 
-    subpackets = []
+    if debug:
+        logger.debug('Reading subpackets in body %s.', bytes(data))
 
+    data = memoryview(data)
     offset = 0
 
     while offset < len(data):
-        logger.debug('Reading subpacket at offset %d.', offset)
+        if debug:
+            logger.debug('Reading subpacket at offset %d.', offset)
+
         sensor_id = data[offset + 0]
         length = data[offset + 1] & 0x7F
         valid = data[offset + 1] & 0x80
@@ -132,18 +170,20 @@ def get_data_subpackets(data):
         sensor_data = data[offset:offset + length]
         offset += length
 
-        if logger.isEnabledFor(logging.DEBUG):
+        if debug:
             logger.debug('Read subpacket with sensor ID %s and data %s.', hex(sensor_id), bytes(sensor_data))
 
         if valid == 0x80:
-            subpackets.append((sensor_id, sensor_data))
+            yield sensor_id, sensor_data
         else:
-            subpackets.append((sensor_id, None))
+            yield sensor_id, None
 
     if offset != len(data):
         logger.warning('Subpacket total length differs from packet length.')
 
-    return subpackets
+
+def get_data_subpackets(data):
+    return list(iter_data_subpackets(data))
 
 
 def convert(values, sensor_id):
@@ -158,7 +198,7 @@ def convert(values, sensor_id):
         return raw_values
 
     try:
-        module = getattr(utils, conversion_name)
+        module = utils.load(conversion_name)
         return module.convert(values)
     except AttributeError:
         logging.warning('No valid conversion loaded for %s' % (sensor_id,))
@@ -7,7 +7,7 @@
 import logging
 from .spec import spec
 from . import format
-from .helper import get_key_value, find_sensor_id_from_param_name, find_param_names_and_types_of_sensor, try_converting
+from .helper import get_key_value, try_converting
 import waggle.checksum
 
 logger = logging.getLogger('protocol.encoder')
@@ -15,6 +15,23 @@ logger = logging.getLogger('protocol.encoder')
 # protocol_version 1 is used in lower or equal to coresense firmware 3.12
 protocol_version = 2
 
+# specialized pack function for each sensor ID
+pack_cache = {}
+
+for sensor_id in spec.keys():
+    params = spec[sensor_id]['params']
+    formats = [param['format'] for param in params]
+    lengths = [param['length'] for param in params]
+    pack_cache[sensor_id] = format.compile_pack(formats, lengths)
+
+# maps each param name to its (sensor_id, index, format). a name used by more
+# than one sensor belongs to the first, as with find_sensor_id_from_param_name.
+param_index = {}
+
+for sensor_id in spec.keys():
+    for index, param in enumerate(spec[sensor_id]['params']):
+        param_index.setdefault(param['name'], (sensor_id, index, param['format']))
+
 
 def encode_sub_packet(id, data=[]):
     '''
@@ -41,9 +58,7 @@ def encode_sub_packet(id, data=[]):
         logger.error('Length of the %s must be matched' % (str(data),))
         return None
 
-    formats = [param['format'] for param in params]
-    lengths = [param['length'] for param in params]
-    binary = format.waggle_pack(formats, lengths, data)
+    binary = pack_cache[id](data)
 
     packet_length = len(binary)
     sub_packet = bytearray(2)
@@ -140,45 +155,69 @@ def encode_frame_from_flat_string(frame_data, verbose=False):
             if verbose:
                 print('Could not parse %s' % (line,))
 
-    dict_data = {}
-    number_of_keys = len(keys)
-    for i in range(0, number_of_keys):
-        key = keys[i]
-        if key == '':
-            continue
-        value = values[i]
+    return encode_frame(group_params(zip(keys, values), try_converting, verbose))
+
+
+def convert_value(value, value_type):
+    # byte params may be given as bytes rather than as hex strings
+    if 'byte' in value_type and isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return try_converting(value, value_type)
+
+
+def encode_frame_from_dict(data, verbose=False):
+    '''
+    Encode a frame
+    @params:
+        - dict {param_name: value, ...}
+    @return:
+        A byte array of the frame
+    '''
+    if not isinstance(data, dict):
+        logger.error('%s must be a dictionary' % (str(data),))
+        return None
+
+    return encode_frame(group_params(data.items(), convert_value, verbose))
+
 
-        # Check if sensor ID for the key exists
-        sensor_id = find_sensor_id_from_param_name(spec, key)
-        if sensor_id is None:
+def group_params(items, convert, verbose=False):
+    '''
+    Groups (param_name, value) items by sensor in a single pass, converting
+    each value with convert(value, format). Sensors missing any of their params
+    are dropped. A param given more than once takes the last valid value.
+    @return:
+        - dict {sensorid: values, ...}
+    '''
+    frame_data = {}
+
+    for key, value in items:
+        try:
+            sensor_id, index, value_type = param_index[key]
+        except KeyError:
             if verbose:
                 print('Sensor ID not exist for %s' % (key,))
             continue
 
-        # Check if all required params exists in the list of inputs
-        required_params, required_types = find_param_names_and_types_of_sensor(spec, sensor_id)
-        required_values = [None] * len(required_params)
-        for j in range(i, number_of_keys):
-            key_in_search = keys[j]
-
-            if key_in_search in required_params:
-                index = required_params.index(key_in_search)
-                value_in_search = values[j]
-                conversion_type = required_types[index]
-                # Convert the value into proper type
-                converted_value_in_search = try_converting(value_in_search, conversion_type)
-                if converted_value_in_search is not None:
-                    required_values[index] = converted_value_in_search
-                else:
-                    if verbose:
-                        print('%s is not type of %s' % (value_in_search, conversion_type))
-                    continue
-                # Prevent the key from being called later
-                keys[j] = ''
-        if None in required_values:
+        # sensors are ordered by the first appearance of any of their params
+        try:
+            sensor_values = frame_data[sensor_id]
+        except KeyError:
+            sensor_values = [None] * len(spec[sensor_id]['params'])
+            frame_data[sensor_id] = sensor_values
+
+        converted_value = convert(value, value_type)
+
+        if converted_value is None:
             if verbose:
-                print('Not all params exists for %s' % (str(sensor_id),))
+                print('%s is not type of %s' % (value, value_type))
             continue
 
-        dict_data[sensor_id] = required_values
-    return encode_frame(dict_data)
+        sensor_values[index] = converted_value
+
+    for sensor_id in list(frame_data.keys()):
+        if None in frame_data[sensor_id]:
+            if verbose:
+                print('Not all params exists for %s' % (str(sensor_id),))
+            del frame_data[sensor_id]
+
+    return frame_data
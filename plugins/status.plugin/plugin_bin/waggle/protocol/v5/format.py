@@ -19,8 +19,16 @@ Format Reference
 - float_2: fixed point (-127.99, 127.99)
 - float_3: fixed point (-31.999, 31.999)
 
+For repeated use, compile_unpack and compile_pack build a specialized function
+for a fixed list of formats and lengths.
+
+>>> unpack = format.compile_unpack(['uint', 'hex'], [2, 2])
+>>> unpack(b'\\x01\\x02\\xab\\xcd')
+[258, 'abcd']
+
 '''
 import logging
+import struct
 from math import ceil
 from bitstring import BitArray
 
@@ -212,3 +220,182 @@ def waggle_pack(format, length, values):
 
 def waggle_unpack(format, length, buffer):
     return list(waggle_unpack_from(format, length, buffer))
+
+
+# =================================================
+# Compiled unpackers / packers
+# =================================================
+
+# struct codes for fixed width integer formats by length
+struct_int_codes = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+struct_uint_codes = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+struct_float_codes = {4: 'f', 8: 'd'}
+
+
+def get_field_unpacker(f, l):
+    """
+    Returns the struct code and optional post-processing function used to
+    unpack a single field, or None if the field has no fixed width form.
+    """
+    if l is None or l != int(l):
+        return None
+
+    l = int(l)
+
+    if f in ('uint', 'epoch'):
+        if l in struct_uint_codes:
+            return struct_uint_codes[l], None
+        return '{}s'.format(l), lambda b: int.from_bytes(b, 'big')
+
+    if f == 'int':
+        if l in struct_int_codes:
+            return struct_int_codes[l], None
+        return '{}s'.format(l), lambda b: int.from_bytes(b, 'big', signed=True)
+
+    if f == 'float' and l in struct_float_codes:
+        return struct_float_codes[l], None
+
+    if f == 'hex':
+        return '{}s'.format(l), bytes.hex
+
+    if f == 'float_2' and l == 2:
+        return '2s', lambda b: unpack_float_format6(b, 0)
+
+    if f == 'float_3' and l == 2:
+        return '2s', lambda b: unpack_float_format8(b, 0)
+
+    if f == 'str':
+        return '{}s'.format(l), bytes.decode
+
+    if f == 'byte':
+        return '{}s'.format(l), None
+
+    return None
+
+
+def compile_unpack(format, length):
+    """
+    Compiles formats and lengths into a function which takes a buffer and
+    returns the same list of values as waggle_unpack. Fixed width fields are
+    read with a single precompiled struct. Buffers which are too short and
+    variable length formats use waggle_unpack.
+    """
+    format = tuple(format)
+    length = tuple(length)
+
+    def generic_unpack(buffer):
+        return waggle_unpack(format, length, bytes(buffer))
+
+    fields = [get_field_unpacker(f, l) for f, l in zip(format, length)]
+
+    if None in fields:
+        return generic_unpack
+
+    compiled = struct.Struct('>' + ''.join(code for code, _ in fields))
+    posts = tuple((i, post) for i, (_, post) in enumerate(fields) if post is not None)
+
+    def unpack(buffer):
+        if len(buffer) < compiled.size:
+            return generic_unpack(buffer)
+
+        values = list(compiled.unpack_from(buffer))
+
+        for i, post in posts:
+            values[i] = post(values[i])
+
+        return values
+
+    return unpack
+
+
+def get_field_packer(f, l):
+    """
+    Returns the struct code and optional pre-processing function used to pack
+    a single field, or None if the field has no fixed width form. Values which
+    the generic packer would encode with a different width are rejected with a
+    ValueError.
+    """
+    if l is None or l != int(l):
+        return None
+
+    l = int(l)
+
+    if f in ('uint', 'epoch'):
+        if l in struct_uint_codes:
+            return struct_uint_codes[l], None
+        return '{}s'.format(l), lambda v: v.to_bytes(l, 'big')
+
+    if f == 'int':
+        if l in struct_int_codes:
+            return struct_int_codes[l], None
+        return '{}s'.format(l), lambda v: v.to_bytes(l, 'big', signed=True)
+
+    if f == 'float' and l in struct_float_codes:
+        return struct_float_codes[l], check_float
+
+    if f == 'hex':
+        return '{}s'.format(l), lambda v: check_length(pack_hex_string(v, l), l)
+
+    if f == 'float_2' and l == 2:
+        return '2s', pack_float_format6
+
+    if f == 'float_3' and l == 2:
+        return '2s', pack_float_format8
+
+    if f == 'str':
+        return '{}s'.format(l), lambda v: check_length(v.encode() if isinstance(v, str) else v, l)
+
+    if f == 'byte':
+        return '{}s'.format(l), lambda v: check_length(v, l)
+
+    return None
+
+
+def check_float(value):
+    if not isinstance(value, float):
+        raise ValueError('value must be float')
+    return value
+
+
+def check_length(value, length):
+    if not isinstance(value, (bytes, bytearray)) or len(value) != length:
+        raise ValueError('value must be {} bytes'.format(length))
+    return value
+
+
+def compile_pack(format, length):
+    """
+    Compiles formats and lengths into a function which takes a list of values
+    and returns the same bytes as waggle_pack. Values the compiled struct
+    cannot represent are passed to waggle_pack, so invalid values fail exactly
+    as before.
+    """
+    format = tuple(format)
+    length = tuple(length)
+
+    def generic_pack(values):
+        return waggle_pack(format, length, values)
+
+    fields = [get_field_packer(f, l) for f, l in zip(format, length)]
+
+    if None in fields:
+        return generic_pack
+
+    compiled = struct.Struct('>' + ''.join(code for code, _ in fields))
+    pres = tuple((i, pre) for i, (_, pre) in enumerate(fields) if pre is not None)
+
+    def pack(values):
+        if len(values) != len(format):
+            return generic_pack(values)
+
+        try:
+            converted = list(values)
+
+            for i, pre in pres:
+                converted[i] = pre(converted[i])
+
+            return compiled.pack(*converted)
+        except (struct.error, ValueError, TypeError, AttributeError, OverflowError, AssertionError):
+            return generic_pack(values)
+
+    return pack
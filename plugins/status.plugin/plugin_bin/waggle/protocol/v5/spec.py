@@ -4,13 +4,12 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
-import yaml
-
+from waggle.yamlcache import load_yaml
 from . import waggleprotocol_spec
 
 def get_spec(spec_str):
     spec = {}
-    contents = yaml.load(spec_str)
+    contents = load_yaml(spec_str)
     for packet in contents:
         assert 'conversion' in packet
         spec[packet['id']] = {}
@@ -5,7 +5,7 @@
 #          http://www.wa8.gl
 # ANL:waggle-license
 import unittest
-from waggle.protocol.v5.decoder import decode_frame
+from waggle.protocol.v5.decoder import decode_frame, iter_frame_subpackets
 from waggle.protocol.v5.encoder import encode_frame
 
 
@@ -35,6 +35,41 @@ class WaggleProtocolTestUnit(unittest.TestCase):
             original_values = data[sensor_id]
             self.assertEqual(decoded_values, original_values)
 
+    def test_multiple_frames(self):
+        encoded_data = b''.join(encode_frame({0x07: [i, i, i]}) for i in range(100))
+
+        for frame in [encoded_data, bytearray(encoded_data), memoryview(encoded_data)]:
+            decoded_data = decode_frame(frame)
+            self.assertEqual(list(decoded_data[0x07].values()), [4950, 4950, 4950])
+
+    def test_subpackets(self):
+        data = {
+            0x50: ['010203040506'],
+            0x5A: [123, 234, 345, 456, 567, 678],
+            0x07: [123, 234, 345],
+        }
+
+        encoded_data = encode_frame(data)
+        subpackets = list(iter_frame_subpackets(encoded_data))
+        self.assertEqual([sensor_id for sensor_id, _ in subpackets], [0x50, 0x5A, 0x07])
+
+        for sensor_id, sensor_data in subpackets:
+            self.assertIsInstance(sensor_data, memoryview)
+
+        decoded_data = decode_frame(encoded_data, sensors={0x07})
+        self.assertEqual(decoded_data, {0x07: decode_frame(encoded_data)[0x07]})
+
+    def test_invalid(self):
+        encoded_data = bytearray(encode_frame({0x07: [1, 2, 3]}))
+
+        with self.assertRaises(RuntimeError):
+            decode_frame(encoded_data[:-1])
+
+        encoded_data[-2] ^= 0xff
+
+        with self.assertRaises(RuntimeError):
+            decode_frame(encoded_data)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -5,9 +5,12 @@
 #          http://www.wa8.gl
 # ANL:waggle-license
 import logging
+import random
 import unittest
 from waggle.protocol.v5.decoder import decode_frame
-from waggle.protocol.v5.encoder import encode_frame_from_flat_string
+from waggle.protocol.v5.encoder import encode_frame, encode_frame_from_flat_string, encode_frame_from_dict
+from waggle.protocol.v5.helper import find_sensor_id_from_param_name, find_param_names_and_types_of_sensor, try_converting
+from waggle.protocol.v5.spec import spec
 
 
 def flatten_sensor_values(sensor_values):
@@ -19,8 +22,118 @@ def flatten_sensor_values(sensor_values):
     return flattened_values
 
 
+def reference_encode_frame_from_flat_string(frame_data):
+    # the original encoder, which scans the spec and the later keys for each key
+    keys = []
+    values = []
+
+    for line in frame_data.splitlines():
+        sp = line.strip().split(' ')
+        if len(sp) == 2:
+            keys.append(sp[0])
+            values.append(sp[1])
+
+    dict_data = {}
+    number_of_keys = len(keys)
+    for i in range(0, number_of_keys):
+        key = keys[i]
+        if key == '':
+            continue
+
+        sensor_id = find_sensor_id_from_param_name(spec, key)
+        if sensor_id is None:
+            continue
+
+        required_params, required_types = find_param_names_and_types_of_sensor(spec, sensor_id)
+        required_values = [None] * len(required_params)
+        for j in range(i, number_of_keys):
+            key_in_search = keys[j]
+
+            if key_in_search in required_params:
+                index = required_params.index(key_in_search)
+                converted_value_in_search = try_converting(values[j], required_types[index])
+                if converted_value_in_search is not None:
+                    required_values[index] = converted_value_in_search
+                else:
+                    continue
+                keys[j] = ''
+        if None in required_values:
+            continue
+
+        dict_data[sensor_id] = required_values
+    return encode_frame(dict_data)
+
+
+def random_value(rand, param):
+    length = param['length']
+
+    if param['format'] in ['uint', 'epoch']:
+        return str(rand.randint(0, 2**(8 * min(length, 4)) - 1))
+    if param['format'] == 'int':
+        return str(rand.randint(-100, 100))
+    if param['format'] == 'float':
+        return str(rand.randint(0, 10000) / 100)
+    if param['format'] in ['byte', 'hex']:
+        return bytes(rand.getrandbits(8) for _ in range(length)).hex()
+    return 'x' * length
+
+
+def random_flat_string(rand):
+    lines = []
+
+    # sensors with variable length params or over 127 bytes cannot be encoded
+    sensor_ids = [sensor_id for sensor_id in sorted(spec)
+                  if all(param['length'] for param in spec[sensor_id]['params']) and
+                  sum(param['length'] for param in spec[sensor_id]['params']) < 128]
+
+    for sensor_id in rand.sample(sensor_ids, 20):
+        for param in spec[sensor_id]['params']:
+            # leave out some params, so some sensors are incomplete
+            if rand.random() < 0.97:
+                lines.append('{} {}'.format(param['name'], random_value(rand, param)))
+
+    lines.append('unknown_param 1')
+    lines.append('nc_load_1 notafloat')
+    rand.shuffle(lines)
+    return '\n'.join(lines)
+
+
 class WaggleProtocolTestUnit(unittest.TestCase):
 
+    def test_matches_reference(self):
+        rand = random.Random(0)
+
+        for _ in range(50):
+            text = random_flat_string(rand)
+            self.assertEqual(encode_frame_from_flat_string(text), reference_encode_frame_from_flat_string(text))
+
+    def test_duplicate_keys(self):
+        text = 'nc_load_1 0.1\nnc_load_5 0.2\nnc_load_10 0.3\nnc_load_1 0.4\nnc_load_1 bad'
+        encoded = encode_frame_from_flat_string(text)
+        self.assertEqual(encoded, reference_encode_frame_from_flat_string(text))
+        self.assertAlmostEqual(flatten_sensor_values(decode_frame(encoded))['nc_load_1'], 0.4)
+
+    def test_encode_dict(self):
+        data = {
+            'nc_load_1': 0.74,
+            'nc_load_5': '0.53',
+            'nc_load_10': 0.45,
+            'nc_boot_id': '12345678901234567890123456789012',
+            'nc_ram_total': 8046136,
+            'nc_ram_free': 291328,
+            'net_broadband_rx': 1,
+        }
+
+        text = '\n'.join('{} {}'.format(k, v) for k, v in data.items())
+        self.assertEqual(encode_frame_from_dict(data), encode_frame_from_flat_string(text))
+
+        values = flatten_sensor_values(decode_frame(encode_frame_from_dict(data)))
+        self.assertAlmostEqual(values['nc_load_5'], 0.53)
+        self.assertEqual(values['nc_ram_total'], 8046136)
+        self.assertNotIn('net_broadband_rx', values)
+
+        self.assertIsNone(encode_frame_from_dict('nc_load_1 0.74'))
+
     def test_empty(self):
         self.assertEqual(decode_frame(encode_frame_from_flat_string('')), {})
 
@@ -4,8 +4,27 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
+import random
+import struct
 import unittest
 import format
+from waggle.protocol.v5.spec import spec
+
+
+def random_value(rand, f, l):
+    if f in ('uint', 'epoch'):
+        return rand.randint(0, 2**(8 * l) - 1)
+    if f == 'int':
+        return rand.randint(-2**(8 * l - 1), 2**(8 * l - 1) - 1)
+    if f == 'float':
+        return struct.unpack('>f', struct.pack('>f', rand.uniform(-1e6, 1e6)))[0]
+    if f == 'hex':
+        return bytes(rand.getrandbits(8) for _ in range(l)).hex()
+    if f == 'str':
+        return ''.join(rand.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(l))
+    if f == 'byte':
+        return bytes(rand.getrandbits(8) for _ in range(l))
+    raise ValueError(f)
 
 
 class WaggleFormatTest(unittest.TestCase):
@@ -294,6 +313,54 @@ class WaggleFormatTest(unittest.TestCase):
             unpacked = format.waggle_unpack(formats, lengths, packed)
             self.assertListEqual(values, unpacked)
 
+    def test_compiled_spec(self):
+        rand = random.Random(0)
+
+        for sensor_id, sensor in spec.items():
+            formats = [param['format'] for param in sensor['params']]
+            lengths = [param['length'] for param in sensor['params']]
+
+            if None in lengths:
+                continue
+
+            pack = format.compile_pack(formats, lengths)
+            unpack = format.compile_unpack(formats, lengths)
+
+            for _ in range(10):
+                values = [random_value(rand, f, l) for f, l in zip(formats, lengths)]
+                packed = format.waggle_pack(formats, lengths, values)
+                self.assertEqual(pack(values), packed)
+                self.assertEqual(unpack(packed), format.waggle_unpack(formats, lengths, packed))
+                self.assertEqual(unpack(memoryview(packed)), format.waggle_unpack(formats, lengths, packed))
+
+    def test_compiled_fixed_point(self):
+        formats = ['float_2', 'float_3', 'uint']
+        lengths = [2, 2, 3]
+        pack = format.compile_pack(formats, lengths)
+        unpack = format.compile_unpack(formats, lengths)
+
+        for values in [[1.25, -3.125, 7], [-127.99, 31.999, 2**24 - 1], [0.0, 0.0, 0]]:
+            packed = format.waggle_pack(formats, lengths, values)
+            self.assertEqual(pack(values), packed)
+            self.assertEqual(unpack(packed), format.waggle_unpack(formats, lengths, packed))
+
+    def test_compiled_fallback(self):
+        # short buffers and variable length fields use the generic functions
+        unpack = format.compile_unpack(['uint', 'uint'], [2, 2])
+        self.assertEqual(unpack(b'\x01\x02\x03'), format.waggle_unpack(['uint', 'uint'], [2, 2], b'\x01\x02\x03'))
+
+        unpack = format.compile_unpack(['uint', 'byte'], [1, None])
+        self.assertEqual(unpack(b'\x01abc'), [1, b'abc'])
+
+        # values of the wrong width are packed as before
+        pack = format.compile_pack(['hex'], [4])
+        self.assertEqual(pack(['abcd']), format.waggle_pack(['hex'], [4], ['abcd']))
+
+        pack = format.compile_pack(['uint'], [1])
+
+        with self.assertRaises(OverflowError):
+            pack([256])
+
 
 if __name__ == '__main__':
     unittest.main()
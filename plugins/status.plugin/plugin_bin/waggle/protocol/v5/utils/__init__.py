@@ -4,6 +4,7 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
+import importlib
 import os
 
 
@@ -15,4 +16,20 @@ def isimported(filename):
 imported = list(filter(isimported, os.listdir(os.path.dirname(__file__))))
 __all__ = [filename.replace('.py', '') for filename in imported]
 
-from . import *
+
+# Conversion modules are imported on first use rather than up front, so heavy
+# dependencies like numpy and the chemsense calibration data are only loaded
+# once a packet which needs them is decoded.
+def load(name):
+    if name not in __all__:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    return importlib.import_module('.' + name, __name__)
+
+
+# allows utils.name access on Python 3.7+. use load for older versions.
+def __getattr__(name):
+    return load(name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -5,13 +5,16 @@
 #          http://www.wa8.gl
 # ANL:waggle-license
 import logging
+import operator
 # import math
 import re
 import os
 # from waggle.protocol.v5.res import chemsense_calib_data as chemsense_res
 # from waggle.protocol.v5.res import chemsense_empty_data as chemsense_res
 import csv
+import io
 import numpy as np
+from waggle.yamlcache import load_cached
 
 logger = logging.getLogger('waggle.protocol.v5.utils.chemsense')
 
@@ -32,24 +35,73 @@ def slice_array(a, ks):
     return np.array(slice(a, ks))
 
 
-def read_calib_data(path):
-    results = {}
+calib_path = os.path.join(os.path.dirname(__file__), 'chemsense_calibration.csv')
+
+# column offsets of the S, Izero, n and M fields in a calibration row
+calib_fields = [('S', 0, 7), ('Izero', 7, 14), ('n', 14, 21), ('M', 21, 70)]
+
+
+def parse_calib_data(text):
+    """
+    Parses calibration CSV text into the list of board IDs and a float array
+    holding the S, Izero, n and M fields of each board, one row per board.
+    """
+    ids = []
+    rows = []
+
+    for row in csv.DictReader(io.StringIO(text)):
+        ids.append(row['ID'])
+        rows.append([float(x) for name, _, _ in calib_fields for x in row[name].split()])
+
+    return ids, np.array(rows, dtype=float).reshape(len(rows), 70)
+
+
+class Calibration:
+    """
+    Holds the calibration of each board as arrays with one row per board.
+    calib[board] returns the [S, Izero, n, M] arrays of a board.
+    """
+
+    def __init__(self, ids, data):
+        self.index = {board: i for i, board in enumerate(ids)}
+        self.S = data[:, 0:7]
+        self.Izero = data[:, 7:14]
+        self.n = data[:, 14:21]
+        self.M = data[:, 21:70].reshape(-1, 7, 7)
+
+    def __getitem__(self, board):
+        i = self.index[board]
+        return [self.S[i], self.Izero[i], self.n[i], self.M[i]]
+
+    def __contains__(self, board):
+        return board in self.index
+
+    def __len__(self):
+        return len(self.index)
+
 
+def read_calib_data(path, cache_dir=''):
+    """
+    Reads the calibration CSV at path. The parsed arrays are cached in
+    binary form by waggle.yamlcache.load_cached, keyed by the CSV contents.
+    """
     with open(path) as file:
-        reader = csv.DictReader(file)
+        text = file.read()
 
-        for row in reader:
-            results[row['ID']] = [
-                np.fromstring(row['S'], dtype=float, sep=' '),
-                np.fromstring(row['Izero'], dtype=float, sep=' '),
-                np.fromstring(row['n'], dtype=float, sep=' '),
-                np.fromstring(row['M'], dtype=float, sep=' ').reshape(7, 7),
-            ]
+    return Calibration(*load_cached(text, parse_calib_data, 'chemsense', cache_dir))
 
-    return results
 
+calib = None
+
+
+def get_calib():
+    """Returns the calibration data, which is loaded on first use."""
+    global calib
+
+    if calib is None:
+        calib = read_calib_data(calib_path)
 
-calib = read_calib_data(os.path.join(os.path.dirname(__file__), 'chemsense_calibration.csv'))
+    return calib
 
 
 def advanced_filter(a, b):
@@ -63,6 +115,61 @@ def advanced_filter(a, b):
         return a, b
 
 
+def advanced_filter_array(a, b):
+    """Applies advanced_filter elementwise to arrays a and b."""
+    conditions = [(a < 0.0) & (b < 0.0), (a > 0.0) & (b < 0.0), (a < 0.0) & (b > 0.0)]
+    return (np.select(conditions, [0.0, a + b, 0.0], a),
+            np.select(conditions, [0.0, 0.0, a + b], b))
+
+
+get_temperatures = operator.itemgetter('AT0', 'AT1', 'AT2', 'AT3')
+get_currents = operator.itemgetter(*basis)
+
+
+def correct_samples(board, temperatures, currents):
+    """
+    Corrects N samples from one board at once. temperatures is an N x 4
+    array of the AT0 to AT3 readings and currents an N x 7 array of the
+    chemical readings in basis order. Returns an N x 7 array of corrected PPM
+    values in basis order.
+    """
+    S, Izero, n, M = get_calib()[board]
+
+    Tboard = np.asarray(temperatures, dtype=float).mean(axis=1, keepdims=True) / 100.0
+    CurZero = Izero * np.exp((Tboard - 40.0) / n) * 1e3
+    uncorrectedPPB = (np.asarray(currents, dtype=float) - CurZero) / S
+    correctedPPM = np.dot(uncorrectedPPB, M.T) / 1000.0
+
+    i = basis_by_name['OZO']
+    j = basis_by_name['NO2']
+    correctedPPM[:, i], correctedPPM[:, j] = advanced_filter_array(correctedPPM[:, i], correctedPPM[:, j])
+
+    return correctedPPM
+
+
+def apply_corrections_to_samples(samples):
+    '''
+    Corrects a list of samples, as described in apply_corrections_to_sample,
+    and returns a list of the corrected PPM dictionaries in the same order.
+    Samples from the same board are corrected together in one batch.
+    '''
+    boards = {}
+
+    for i, sample in enumerate(samples):
+        boards.setdefault(sample['BAD'], []).append(i)
+
+    results = [None] * len(samples)
+
+    for board, indices in boards.items():
+        temperatures = [get_temperatures(samples[i]) for i in indices]
+        currents = [get_currents(samples[i]) for i in indices]
+
+        for i, correctedPPM in zip(indices, correct_samples(board, temperatures, currents).tolist()):
+            results[i] = dict(zip(basis, correctedPPM))
+
+    return results
+
+
 def apply_corrections_to_sample(sample):
     '''
     The argument `sample` should be a dictionary with keys:
@@ -71,19 +178,7 @@ def apply_corrections_to_sample(sample):
     * AT0, AT1, AT2, AT3 - Temperature readings.
     * IRR, IAQ, SO2, H2S, OZO, NO2, CMO - Chemical readings.
     '''
-    S, Izero, n, M = calib[sample['BAD']]
-
-    Tboard = slice_array(sample, ['AT0', 'AT1', 'AT2', 'AT3']).mean() / 100.0
-    CurZero = Izero * np.exp((Tboard - 40.0) / n) * 1e3
-    Cur = slice_array(sample, basis)
-    uncorrectedPPB = (Cur - CurZero) / S
-    correctedPPM = np.dot(M, uncorrectedPPB) / 1000.0
-
-    i = basis_by_name['OZO']
-    j = basis_by_name['NO2']
-    correctedPPM[i], correctedPPM[j] = advanced_filter(correctedPPM[i], correctedPPM[j])
-
-    return dict(zip(basis, correctedPPM))
+    return apply_corrections_to_samples([sample])[0]
 
 
 # def import_data():
@@ -199,7 +294,7 @@ def apply_corrections_to_sample(sample):
 chemsense_pattern = re.compile(r'(\S+)=(\S+)')
 
 
-def convert(value):
+def parse_sample(value):
     sample = dict(chemsense_pattern.findall(value['chemsense_raw']))
 
     for k in sample.keys():
@@ -208,8 +303,25 @@ def convert(value):
         except ValueError:
             continue
 
-    correctedPPM = apply_corrections_to_sample(sample)
+    return sample
+
+
+def convert(value):
+    sample = parse_sample(value)
+    return sample_results(sample, apply_corrections_to_sample(sample))
+
+
+def convert_batch(values):
+    """
+    Converts a list of values like convert, correcting the samples from each
+    board in one batch, and returns a list of the results.
+    """
+    samples = [parse_sample(value) for value in values]
+    return [sample_results(sample, correctedPPM)
+            for sample, correctedPPM in zip(samples, apply_corrections_to_samples(samples))]
+
 
+def sample_results(sample, correctedPPM):
     results = {}
 
     results['chemsense_id'] = [(sample['BAD'].lower(), '')]
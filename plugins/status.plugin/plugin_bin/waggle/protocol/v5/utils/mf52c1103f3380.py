@@ -14,6 +14,7 @@
 # This conversion is tested in Wagman hw V3.1 ker v1.0.4
 
 import math
+from waggle.thermistor import LookupTable
 
 
 def convert(value):
@@ -23,7 +24,7 @@ def convert(value):
     return value
 
 
-def calculation_others(value):
+def temperature_others(value):
     A = 0.00088570897
     B = 0.00025163902
     C = 0.00000019289731
@@ -40,19 +41,19 @@ def calculation_others(value):
     try:
         rt = R * (Vin / V - 1)
     except ZeroDivisionError:
-        return None, 'C'
+        return None
 
     try:
         logrt = math.log(rt)
     except ValueError:
-        return None, 'C'
+        return None
 
     temp = 1 / (A + (B * logrt) + (C * logrt * logrt * logrt))
     tempC = temp - 273.15
-    return round(tempC, 2), 'C'
+    return round(tempC, 2)
 
 
-def calculation_nc(value):
+def temperature_nc(value):
     A = 0.00088570897
     B = 0.00025163902
     C = 0.00000019289731
@@ -66,16 +67,31 @@ def calculation_nc(value):
     try:
         rt = R * (Vin / V - 1)
     except ZeroDivisionError:
-        return None, 'C'
+        return None
 
     try:
         logrt = math.log(rt)
     except ValueError:
-        return None, 'C'
+        return None
 
     temp = 1 / (A + B * logrt + C * logrt**3)
     tempC = temp - 273.15
-    return round(tempC, 2), 'C'
+    return round(tempC, 2)
+
+
+# readings are bounded ADC codes, so each conversion is a table lookup.
+# the heatsink is read by the 10-bit ADC and the others by the 16-bit ADC
+# right-shifted by 5 bits.
+others_table = LookupTable(temperature_others, 2**11)
+nc_table = LookupTable(temperature_nc, 2**10)
+
+
+def calculation_others(value):
+    return others_table(value), 'C'
+
+
+def calculation_nc(value):
+    return nc_table(value), 'C'
 
 
 conversions = [
@@ -5,6 +5,7 @@
 #          http://www.wa8.gl
 # ANL:waggle-license
 import bisect
+from waggle.thermistor import LookupTable, interpolate_points
 
 points = [
     (-55.00, 963849.00),
@@ -2736,13 +2737,41 @@ points.sort(key=lambda p: p[1], reverse=False)
 x = [p[0] for p in points]
 y = [p[1] for p in points]
 
+# raw readings come from a 10-bit ADC
+ADC_SIZE = 1024
 
-def convert_temperature(raw_r):
-    resistance = 47000. * (1023. / raw_r - 1)
-    index = bisect.bisect(y, resistance)
+
+def calculate_resistance(raw_r):
+    return 47000. * (1023. / raw_r - 1)
+
+
+def nearest_temperature(raw_r):
+    index = bisect.bisect(y, calculate_resistance(raw_r))
     return x[index]
 
 
+interpolate_resistance = interpolate_points(points)
+
+
+def interpolated_temperature(raw_r):
+    return interpolate_resistance(calculate_resistance(raw_r))
+
+
+temperature_table = LookupTable(nearest_temperature, ADC_SIZE)
+interpolated_table = LookupTable(interpolated_temperature, ADC_SIZE, interpolate=True)
+
+
+def convert_temperature(raw_r, interpolate=False):
+    """
+    Converts a raw reading to the temperature of the first point above its
+    resistance, or linearly interpolates between the points if
+    interpolate is true.
+    """
+    if interpolate:
+        return interpolated_table(raw_r)
+    return temperature_table(raw_r)
+
+
 def convert(value):
     raw_r = value['metsense_pr103j2_temperature']
 
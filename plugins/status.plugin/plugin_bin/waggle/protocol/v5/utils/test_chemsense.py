@@ -4,9 +4,13 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
+import os
+import random
+import tempfile
 import unittest
-import pprint
-from chemsense import convert
+import numpy as np
+import chemsense
+from chemsense import convert, convert_batch
 
 
 testdata = [
@@ -15,7 +19,109 @@ testdata = [
     'BAD=5410EC38A62B SQN=4 SHT=83 SHH=4404 HDT=78 HDH=5039 LPT=266 LPP=99845 SUV=0 SVL=249 SIR=265 BAD=5410EC38A62B SQN=5 IRR=2068 IAQ=20305 SO2=-663 H2S=318 OZO=4361 NO2=508 CMO=3195 BAD=5410EC38A62B SQN=6 AT0=32 AT1=58 AT2=116 AT3=161 LTM=6545',
 ]
 
+
+
+def reference_corrections(sample):
+    # the original per sample correction
+    S, Izero, n, M = chemsense.get_calib()[sample['BAD']]
+
+    Tboard = chemsense.slice_array(sample, ['AT0', 'AT1', 'AT2', 'AT3']).mean() / 100.0
+    CurZero = Izero * np.exp((Tboard - 40.0) / n) * 1e3
+    Cur = chemsense.slice_array(sample, chemsense.basis)
+    uncorrectedPPB = (Cur - CurZero) / S
+    correctedPPM = np.dot(M, uncorrectedPPB) / 1000.0
+
+    i = chemsense.basis_by_name['OZO']
+    j = chemsense.basis_by_name['NO2']
+    correctedPPM[i], correctedPPM[j] = chemsense.advanced_filter(correctedPPM[i], correctedPPM[j])
+
+    return dict(zip(chemsense.basis, correctedPPM))
+
+
+def random_sample(rand, board):
+    sample = {'BAD': board}
+
+    for k in ['AT0', 'AT1', 'AT2', 'AT3']:
+        sample[k] = float(rand.randint(-1000, 5000))
+
+    for k in chemsense.basis:
+        sample[k] = float(rand.randint(-5000, 30000))
+
+    return sample
+
+
+class ChemsenseTestCase(unittest.TestCase):
+
+    def assertCorrections(self, results, samples):
+        self.assertEqual(len(results), len(samples))
+
+        for result, sample in zip(results, samples):
+            expected = reference_corrections(sample)
+            self.assertEqual(result.keys(), expected.keys())
+
+            for k in result:
+                self.assertAlmostEqual(result[k], expected[k], delta=1e-9 * max(1.0, abs(expected[k])))
+
+    def test_sample(self):
+        for data in testdata:
+            sample = chemsense.parse_sample({'chemsense_raw': data})
+            self.assertCorrections([chemsense.apply_corrections_to_sample(sample)], [sample])
+
+    def test_batch(self):
+        rand = random.Random(1)
+        boards = sorted(chemsense.get_calib().index)
+        samples = [random_sample(rand, rand.choice(boards[:5])) for _ in range(500)]
+        self.assertCorrections(chemsense.apply_corrections_to_samples(samples), samples)
+
+        # exercises each branch of advanced_filter
+        values = [-2.0, -1.0, 0.0, 1.0, 2.0]
+        a = np.array([x for x in values for _ in values])
+        b = np.array([y for _ in values for y in values])
+        filtered = chemsense.advanced_filter_array(a, b)
+        expected = [chemsense.advanced_filter(x, y) for x, y in zip(a, b)]
+        self.assertEqual(list(zip(filtered[0].tolist(), filtered[1].tolist())), expected)
+
+    def test_convert_batch(self):
+        values = [{'chemsense_raw': data} for data in testdata]
+        results = convert_batch(values)
+        self.assertEqual(len(results), len(values))
+
+        # corrections in a batch may differ from single ones in the last bit
+        for result, value in zip(results, values):
+            expected = convert(value)
+            self.assertEqual(result.keys(), expected.keys())
+
+            for k in result:
+                self.assertEqual([unit for _, unit in result[k]], [unit for _, unit in expected[k]])
+
+                for (x, _), (y, _) in zip(result[k], expected[k]):
+                    if isinstance(x, float):
+                        self.assertAlmostEqual(x, y, delta=1e-9 * max(1.0, abs(y)))
+                    else:
+                        self.assertEqual(x, y)
+
+        self.assertEqual(convert_batch([]), [])
+
+    def test_calib_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            uncached = chemsense.read_calib_data(chemsense.calib_path, cache_dir=None)
+            cached = chemsense.read_calib_data(chemsense.calib_path, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            reloaded = chemsense.read_calib_data(chemsense.calib_path, cache_dir=cache_dir)
+
+        self.assertEqual(len(uncached), 313)
+
+        for calib in [cached, reloaded]:
+            self.assertEqual(calib.index, uncached.index)
+
+            for board in ['04A3E2BD29', '5410EC38A62B']:
+                for x, y in zip(calib[board], uncached[board]):
+                    self.assertEqual(x.tolist(), y.tolist())
+
+        S, Izero, n, M = uncached['04A3E2BD29']
+        self.assertEqual(S.tolist(), [41.8, 4.25, 9.98, 227.12, 22.23, 21.38, 8.17])
+        self.assertEqual(M.shape, (7, 7))
+
+
 if __name__ == '__main__':
-    for data in testdata:
-        value = {'chemsense_raw': data}
-        pprint.pprint(convert(value))
+    unittest.main()
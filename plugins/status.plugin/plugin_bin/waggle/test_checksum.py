@@ -4,8 +4,24 @@
 # license.  For more details on the Waggle project, visit:
 #          http://www.wa8.gl
 # ANL:waggle-license
+import random
 import unittest
-from waggle.checksum import crc8
+from waggle.checksum import crc8, crc8_table, crc8_batch, Crc8
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def reference_crc8(data, crc=0):
+    for value in data:
+        crc = crc8_table[crc ^ value]
+    return crc
+
+
+def random_bytes(rand, max_length):
+    return bytes(rand.getrandbits(8) for _ in range(rand.randint(0, max_length)))
 
 
 class ChecksumTestCase(unittest.TestCase):
@@ -21,6 +37,61 @@ class ChecksumTestCase(unittest.TestCase):
         for data, crc in test_cases:
             self.assertEqual(crc8(data), crc)
 
+    def test_crc8_buffer_types(self):
+        rand = random.Random(0)
+
+        for _ in range(100):
+            data = random_bytes(rand, 300)
+            crc = rand.getrandbits(8)
+            expected = reference_crc8(data, crc)
+            self.assertEqual(crc8(bytearray(data), crc), expected)
+            self.assertEqual(crc8(memoryview(data), crc), expected)
+
+            # unaligned views into a larger buffer
+            buf = b'xyz' + data + b'xyz'
+            self.assertEqual(crc8(memoryview(buf)[3:-3], crc), expected)
+
+        data = bytes(range(256)) * 4
+        self.assertEqual(crc8(memoryview(data).cast('I')), reference_crc8(data))
+
+    def test_crc8_incremental(self):
+        rand = random.Random(1)
+
+        for _ in range(100):
+            data = random_bytes(rand, 300)
+            c = Crc8()
+            offset = 0
+
+            while offset < len(data):
+                n = rand.randint(1, 16)
+                c.update(data[offset:offset + n])
+                offset += n
+
+            self.assertEqual(c.crc, reference_crc8(data))
+            self.assertEqual(c.digest(), bytes([reference_crc8(data)]))
+
+        c = Crc8(b'\x01\x02')
+        d = c.copy()
+        d.update(b'\x03')
+        self.assertEqual(c.crc, reference_crc8(b'\x01\x02'))
+        self.assertEqual(d.crc, 216)
+
+        c.reset()
+        self.assertEqual(c.crc, 0)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_crc8_batch(self):
+        rand = random.Random(2)
+
+        for crc in [0, 0x5e, 0xff]:
+            buffers = [random_bytes(rand, 200) for _ in range(100)]
+            buffers.append(b'')
+            expected = [reference_crc8(b, crc) for b in buffers]
+            self.assertEqual(crc8_batch(buffers, crc).tolist(), expected)
+
+        self.assertEqual(crc8_batch([]).tolist(), [])
+        self.assertEqual(crc8_batch([bytearray(b'\x01\x02\x03')]).tolist(), [216])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,122 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import math
+import unittest
+from waggle.thermistor import LookupTable, interpolate_points
+from waggle.protocol.v5.utils import pr103j2
+from waggle.protocol.v5.utils import mf52c1103f3380
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def inverse(code):
+    return 1 / code
+
+
+def assert_same(test, values, expected):
+    test.assertEqual(len(values), len(expected))
+
+    for value, x in zip(values, expected):
+        if math.isnan(x):
+            test.assertTrue(math.isnan(value))
+        else:
+            test.assertAlmostEqual(value, x, places=12)
+
+
+def call(func, code):
+    try:
+        return func(code)
+    except Exception as exc:
+        return type(exc)
+
+
+class LookupTableTestCase(unittest.TestCase):
+
+    def test_lookup(self):
+        table = LookupTable(inverse, 100)
+
+        for code in [1, 50, 99, 100, 1000, -5, 2.5]:
+            self.assertEqual(table(code), inverse(code))
+
+        # errors are raised by func as before
+        with self.assertRaises(ZeroDivisionError):
+            table(0)
+
+    def test_interpolate(self):
+        table = LookupTable(lambda code: code**2, 10, interpolate=True)
+
+        self.assertEqual(table(3), 9)
+        self.assertEqual(table(3.5), 12.5)
+        self.assertEqual(table(9.0), 81)
+        self.assertEqual(table(9.5), 90.25)
+
+        # codes next to an invalid entry are passed to func
+        table = LookupTable(inverse, 10, interpolate=True)
+        self.assertEqual(table(0.5), 2)
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_array(self):
+        for interpolate in [False, True]:
+            table = LookupTable(inverse, 100, interpolate=interpolate)
+            codes = numpy.array([0, 1, 7, 99, 100, 250, -4])
+            expected = [math.nan, 1, 1 / 7, 1 / 99, 1 / 100, 1 / 250, -1 / 4]
+            assert_same(self, table.array(codes).tolist(), expected)
+
+        table = LookupTable(lambda code: code**2, 10, interpolate=True)
+        self.assertEqual(table.array(numpy.array([3.5, 9.5])).tolist(), [12.5, 90.25])
+
+
+class ThermistorTestCase(unittest.TestCase):
+
+    def test_pr103j2(self):
+        for code in range(-10, 1100):
+            self.assertEqual(call(pr103j2.convert_temperature, code),
+                             call(pr103j2.nearest_temperature, code))
+
+        value = pr103j2.convert({'metsense_pr103j2_temperature': 0})
+        self.assertEqual(value['metsense_pr103j2_temperature'], (None, 'C'))
+
+    def test_pr103j2_interpolate(self):
+        previous = -math.inf
+
+        # lower readings are above the largest resistance
+        for code in range(48, 1024):
+            nearest = pr103j2.convert_temperature(code)
+            temperature = pr103j2.convert_temperature(code, interpolate=True)
+
+            # the nearest point is the next grid step above the resistance
+            self.assertLessEqual(abs(temperature - nearest), 0.05 + 1e-9)
+            self.assertGreaterEqual(temperature, previous)
+            previous = temperature
+
+        # the points are reproduced exactly, up to the largest resistance
+        temperature = interpolate_points(pr103j2.points)
+        for x, y in pr103j2.points[:-1]:
+            self.assertAlmostEqual(temperature(y), x)
+
+    def test_mf52c1103f3380(self):
+        for code in range(-10, 3000):
+            self.assertEqual(mf52c1103f3380.calculation_others(code),
+                             (mf52c1103f3380.temperature_others(code), 'C'))
+            self.assertEqual(mf52c1103f3380.calculation_nc(code),
+                             (mf52c1103f3380.temperature_nc(code), 'C'))
+
+        self.assertEqual(mf52c1103f3380.calculation_nc(0), (None, 'C'))
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_array_matches_scalar(self):
+        codes = numpy.arange(-10, 1100)
+        expected = [call(pr103j2.convert_temperature, code) for code in codes.tolist()]
+        expected = [x if isinstance(x, float) else math.nan for x in expected]
+        assert_same(self, pr103j2.temperature_table.array(codes).tolist(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import unittest
+from waggle.yamlcache import load_yaml, get_cache_path
+
+document = '''
+- id: 1
+  params:
+  - {name: x, length: 2, format: 'ui16'}
+- id: 2
+  params: []
+'''
+
+expected = [
+    {'id': 1, 'params': [{'name': 'x', 'length': 2, 'format': 'ui16'}]},
+    {'id': 2, 'params': []},
+]
+
+
+class YAMLCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_uncached(self):
+        self.assertEqual(load_yaml(document, cache_dir=None), expected)
+
+    def test_cache_written(self):
+        self.assertEqual(load_yaml(document, cache_dir=self.cache_dir), expected)
+
+        with open(get_cache_path(document, self.cache_dir), 'rb') as file:
+            self.assertEqual(pickle.load(file), expected)
+
+    def test_cache_used(self):
+        path = get_cache_path(document, self.cache_dir)
+        os.makedirs(self.cache_dir)
+
+        with open(path, 'wb') as file:
+            pickle.dump('cached', file)
+
+        self.assertEqual(load_yaml(document, cache_dir=self.cache_dir), 'cached')
+
+    def test_changed_document(self):
+        changed = document.replace('ui16', 'ui24')
+        self.assertNotEqual(get_cache_path(document, self.cache_dir),
+                            get_cache_path(changed, self.cache_dir))
+
+        load_yaml(document, cache_dir=self.cache_dir)
+        self.assertEqual(load_yaml(changed, cache_dir=self.cache_dir)[0]['params'][0]['format'], 'ui24')
+
+    def test_corrupt_cache(self):
+        path = get_cache_path(document, self.cache_dir)
+        os.makedirs(self.cache_dir)
+
+        with open(path, 'wb') as file:
+            file.write(b'not a pickle')
+
+        self.assertEqual(load_yaml(document, cache_dir=self.cache_dir), expected)
+
+        with open(path, 'rb') as file:
+            self.assertEqual(pickle.load(file), expected)
+
+    def test_unwritable_cache(self):
+        # a regular file where the cache directory should be can never be written to
+        open(self.cache_dir, 'w').close()
+        self.assertEqual(load_yaml(document, cache_dir=self.cache_dir), expected)
+
+    def test_lazy_conversions(self):
+        code = ('import sys, waggle.protocol.v5.decoder; '
+                'assert "numpy" not in sys.modules; '
+                'from waggle.protocol.v5 import utils; '
+                'utils.load("chemsense"); '
+                'assert "numpy" in sys.modules')
+        env = dict(os.environ, WAGGLE_CACHE_DIR=self.cache_dir,
+                   PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+
+
+if __name__ == '__main__':
+    unittest.main()
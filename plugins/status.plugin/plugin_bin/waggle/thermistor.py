@@ -0,0 +1,135 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+"""
+This module provides dense lookup tables for thermistor and other ADC
+conversions.
+
+Raw ADC readings are bounded integers, so a conversion can be evaluated once
+for every code when a table is built and each reading becomes a list index.
+
+>>> table = LookupTable(lambda code: code**2, 1024, interpolate=True)
+>>> table(100)
+10000
+>>> table(100.5)
+10100.5
+
+Example with numpy:
+
+```
+table.array(numpy.array([1, 2, 3]))
+```
+"""
+import bisect
+import math
+
+# marks codes for which the conversion raised an error
+INVALID = object()
+
+# errors a conversion may raise for a code outside its domain
+CONVERSION_ERRORS = (ArithmeticError, ValueError, IndexError)
+
+
+class LookupTable:
+    """
+    Holds func(code) for each integer code in range(size). Calls with an
+    integer code in range return the table entry. Calls with any other code,
+    or with a code for which func raised an error, are passed to func, so a
+    table behaves exactly like func.
+
+    If interpolate is true, codes between two valid entries are linearly
+    interpolated between them instead.
+    """
+
+    def __init__(self, func, size, interpolate=False):
+        self.func = func
+        self.size = size
+        self.interpolate = interpolate
+        self.values = []
+        self.array_values = None
+
+        for code in range(size):
+            try:
+                self.values.append(func(code))
+            except CONVERSION_ERRORS:
+                self.values.append(INVALID)
+
+    def __call__(self, code):
+        values = self.values
+
+        if type(code) is int and 0 <= code < self.size:
+            value = values[code]
+
+            if value is not INVALID:
+                return value
+        elif self.interpolate and 0 <= code <= self.size - 1:
+            index = int(code)
+            low = values[index]
+            high = values[min(index + 1, self.size - 1)]
+
+            if low is not INVALID and high is not INVALID:
+                return low + (code - index) * (high - low)
+
+        return self.func(code)
+
+    def array(self, codes):
+        """
+        Looks up each element of a numpy array of codes and returns a float64
+        array. Elements without a numeric result are NaN. This requires numpy.
+        """
+        import numpy as np
+
+        if self.array_values is None:
+            self.array_values = np.array([convert_float(value) for value in self.values], dtype=np.float64)
+
+        codes = np.asarray(codes)
+        result = np.full(codes.shape, np.nan)
+
+        if self.interpolate:
+            inside = (codes >= 0) & (codes <= self.size - 1)
+            result[inside] = np.interp(codes[inside], np.arange(self.size), self.array_values)
+        else:
+            inside = (codes >= 0) & (codes < self.size) & (codes == np.floor(codes))
+            result[inside] = self.array_values[codes[inside].astype(np.intp)]
+
+        # codes outside the table are rare, so they are passed to func one by one
+        for index in np.flatnonzero(~inside):
+            try:
+                result.flat[index] = convert_float(self.func(codes.flat[index].item()))
+            except CONVERSION_ERRORS:
+                pass
+
+        return result
+
+
+def convert_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return math.nan
+
+
+def interpolate_points(points):
+    """
+    Returns a function which linearly interpolates the temperatures of a list
+    of (temperature, resistance) points at a resistance. Like a bisect over
+    the same points, it raises IndexError above the largest resistance and
+    returns the temperature of the smallest resistance below it.
+    """
+    points = sorted(points, key=lambda p: p[1])
+    x = [p[0] for p in points]
+    y = [p[1] for p in points]
+
+    def temperature(resistance):
+        index = bisect.bisect(y, resistance)
+
+        if index == 0:
+            return x[0]
+
+        x0, x1 = x[index - 1], x[index]
+        y0, y1 = y[index - 1], y[index]
+        return x0 + (resistance - y0) * (x1 - x0) / (y1 - y0)
+
+    return temperature
@@ -0,0 +1,107 @@
+# ANL:waggle-license
+# This file is part of the Waggle Platform.  Please see the file
+# LICENSE.waggle.txt for the legal details of the copyright and software
+# license.  For more details on the Waggle project, visit:
+#          http://www.wa8.gl
+# ANL:waggle-license
+'''
+Parse YAML documents once and reuse the result across processes.
+
+load_cached does the same for documents in other formats.
+
+The parsed contents of a document are pickled into a cache directory under a
+name derived from the SHA-1 of the document text, so an edited document is
+simply a cache miss and gets reparsed. The cache directory is taken from
+WAGGLE_CACHE_DIR and defaults to ~/.cache/waggle. Setting WAGGLE_CACHE_DIR to
+an empty string disables the cache. Failing to read or write the cache is
+never an error - we just fall back to parsing.
+
+>>> load_yaml('- id: 1\\n  name: x', cache_dir=None)
+[{'id': 1, 'name': 'x'}]
+'''
+import hashlib
+import os
+import pickle
+
+
+def default_cache_dir():
+    try:
+        return os.environ['WAGGLE_CACHE_DIR'] or None
+    except KeyError:
+        return os.path.join(os.path.expanduser('~'), '.cache', 'waggle')
+
+
+def get_cache_path(text, cache_dir, prefix='yaml'):
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    key = hashlib.sha1(text).hexdigest()
+    return os.path.join(cache_dir, '{}-{}.pickle'.format(prefix, key))
+
+
+def parse_yaml(text):
+    # yaml is only needed on a cache miss, so we defer importing it.
+    import yaml
+
+    try:
+        loader = yaml.CSafeLoader
+    except AttributeError:
+        loader = yaml.SafeLoader
+
+    return yaml.load(text, Loader=loader)
+
+
+def read_cache(path):
+    try:
+        with open(path, 'rb') as file:
+            return True, pickle.load(file)
+    except Exception:
+        return False, None
+
+
+def write_cache(path, contents):
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(contents, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_cached(text, parse, prefix, cache_dir=''):
+    '''
+    Returns parse(text), reusing the cached result for the same text under
+    the given cache file name prefix. An empty cache_dir selects the default
+    cache directory and None disables caching.
+    '''
+    if cache_dir == '':
+        cache_dir = default_cache_dir()
+
+    if cache_dir is None:
+        return parse(text)
+
+    path = get_cache_path(text, cache_dir, prefix)
+
+    ok, contents = read_cache(path)
+
+    if ok:
+        return contents
+
+    contents = parse(text)
+    write_cache(path, contents)
+    return contents
+
+
+def load_yaml(text, cache_dir=''):
+    '''
+    Returns the parsed contents of the YAML document text. An empty cache_dir
+    selects the default cache directory and None disables caching.
+    '''
+    return load_cached(text, parse_yaml, 'yaml', cache_dir)